@@ -0,0 +1,29 @@
+"""add queued_event_model
+
+Revision ID: 4b1e7d2a9f30
+Revises: c3fe2e16ded1
+Create Date: 2026-10-18 09:12:04.118203
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4b1e7d2a9f30'
+down_revision = 'c3fe2e16ded1'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('queued_event_model',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created', sa.DateTime(), nullable=False),
+    sa.Column('claimed', sa.DateTime(), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('queued_event_model')
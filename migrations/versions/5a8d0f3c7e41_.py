@@ -0,0 +1,22 @@
+"""index karma_model.karma
+
+Revision ID: 5a8d0f3c7e41
+Revises: e27f4c8b1d05
+Create Date: 2026-10-18 15:06:52.811437
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5a8d0f3c7e41'
+down_revision = 'e27f4c8b1d05'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_index(op.f('ix_karma_model_karma'), 'karma_model', ['karma'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_karma_model_karma'), table_name='karma_model')
@@ -0,0 +1,28 @@
+"""add seen_event_model
+
+Revision ID: 9d3c5a1e6b72
+Revises: 4b1e7d2a9f30
+Create Date: 2026-10-18 10:02:37.540911
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '9d3c5a1e6b72'
+down_revision = '4b1e7d2a9f30'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('seen_event_model',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('event_id', sa.String(length=256), nullable=False),
+    sa.Column('created', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('event_id')
+    )
+
+
+def downgrade():
+    op.drop_table('seen_event_model')
@@ -0,0 +1,48 @@
+"""add karma ledger and rollups
+
+Revision ID: b6e2a9d4c813
+Revises: 5a8d0f3c7e41
+Create Date: 2026-10-18 16:27:40.392816
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'b6e2a9d4c813'
+down_revision = '5a8d0f3c7e41'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('karma_event_model',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created', sa.DateTime(), nullable=False),
+    sa.Column('string_id', sa.String(length=256), nullable=False),
+    sa.Column('giver', sa.String(length=64), nullable=True),
+    sa.Column('channel', sa.String(length=64), nullable=True),
+    sa.Column('delta', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_karma_event_model_created'), 'karma_event_model', ['created'], unique=False)
+    op.create_index(op.f('ix_karma_event_model_giver'), 'karma_event_model', ['giver'], unique=False)
+    op.create_index(op.f('ix_karma_event_model_string_id'), 'karma_event_model', ['string_id'], unique=False)
+    op.create_table('karma_rollup_model',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('period', sa.String(length=8), nullable=False),
+    sa.Column('start', sa.DateTime(), nullable=False),
+    sa.Column('string_id', sa.String(length=256), nullable=False),
+    sa.Column('upvotes', sa.Integer(), nullable=False),
+    sa.Column('downvotes', sa.Integer(), nullable=False),
+    sa.Column('karma', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('period', 'start', 'string_id')
+    )
+
+
+def downgrade():
+    op.drop_table('karma_rollup_model')
+    op.drop_index(op.f('ix_karma_event_model_string_id'), table_name='karma_event_model')
+    op.drop_index(op.f('ix_karma_event_model_giver'), table_name='karma_event_model')
+    op.drop_index(op.f('ix_karma_event_model_created'), table_name='karma_event_model')
+    op.drop_table('karma_event_model')
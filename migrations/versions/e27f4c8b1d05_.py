@@ -0,0 +1,55 @@
+"""merge duplicate karma entries and make string_id unique
+
+Revision ID: e27f4c8b1d05
+Revises: 9d3c5a1e6b72
+Create Date: 2026-10-18 13:41:09.270514
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'e27f4c8b1d05'
+down_revision = '9d3c5a1e6b72'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    # Fold every duplicate string_id into its oldest row, then drop the
+    # others, so the unique index can be built.
+    op.execute("""
+        UPDATE karma_model SET
+            upvotes = (
+                SELECT SUM(COALESCE(k.upvotes, 0)) FROM karma_model k
+                WHERE k.string_id = karma_model.string_id
+            ),
+            downvotes = (
+                SELECT SUM(COALESCE(k.downvotes, 0)) FROM karma_model k
+                WHERE k.string_id = karma_model.string_id
+            ),
+            karma = (
+                SELECT SUM(COALESCE(k.upvotes, 0) - COALESCE(k.downvotes, 0))
+                FROM karma_model k
+                WHERE k.string_id = karma_model.string_id
+            )
+        WHERE id IN (
+            SELECT MIN(id) FROM karma_model
+            WHERE string_id IS NOT NULL
+            GROUP BY string_id
+            HAVING COUNT(*) > 1
+        )
+    """)
+    op.execute("""
+        DELETE FROM karma_model
+        WHERE string_id IS NOT NULL
+        AND id NOT IN (
+            SELECT MIN(id) FROM karma_model
+            WHERE string_id IS NOT NULL
+            GROUP BY string_id
+        )
+    """)
+    op.create_index(op.f('ix_karma_model_string_id'), 'karma_model', ['string_id'], unique=True)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_karma_model_string_id'), table_name='karma_model')
@@ -0,0 +1,3 @@
+"""ASGI app."""
+
+from dungeonbot.asgi import application  # noqa: F401
@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+
+"""
+Micro-benchmarks for dungeonbot's plugin hot paths.
+
+Each benchmark is timed with timeit: the number of calls per round is
+picked so a round takes at least 0.2 s, then several rounds are run and
+the per-call min, median, mean and standard deviation are kept.
+
+Run them through manage.py, saving the results as JSON:
+
+    python manage.py benchmark -o bench-$(git rev-parse --short HEAD).json
+
+and compare a later run against saved results. Any benchmark whose
+median is more than `--threshold` slower than the baseline's is a
+regression, and the command exits with status 1:
+
+    python manage.py benchmark --compare bench-abc1234.json --threshold 0.2
+
+Benchmarks run against their own database, with PERMISSION_TO_SPEAK
+unset so nothing is sent to Slack. That's a temporary SQLite file unless
+`--db` is given; a database given with `--db` has its tables dropped.
+"""
+
+from datetime import datetime
+
+import os
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import timeit
+
+
+BENCHMARKS = []
+
+# Row counts for the karma table in the sized benchmarks.
+SIZES = (10000, 100000, 1000000)
+
+TEAM_ID = "SLACK_TEAM_ID"
+USER_ID = "A_SLACK_USERID"
+
+
+def benchmark(name, sized=False):
+    """Register a benchmark.
+
+    The decorated function does any setup and returns the callable to
+    time. A `sized` benchmark is called with the number of karma rows
+    and is run once per size.
+
+    """
+    def decorator(setup):
+        BENCHMARKS.append((name, setup, sized))
+        return setup
+    return decorator
+
+
+def _event(text):
+    return {
+        "type": "message",
+        "team_id": TEAM_ID,
+        "user": USER_ID,
+        "channel": "C00000001",
+        "text": text,
+    }
+
+
+def _user():
+    from dungeonbot.handlers.slack import SlackHandler
+
+    return SlackHandler().get_user_obj_from_id(USER_ID, TEAM_ID)
+
+
+@benchmark("die_roll_parse")
+def bench_die_roll_parse():
+    from dungeonbot.plugins.helpers.die_roll import DieRoll
+
+    return lambda: DieRoll("4d6+3", None)
+
+
+@benchmark("die_roll_roll")
+def bench_die_roll_roll():
+    from dungeonbot.plugins.helpers.die_roll import DieRoll
+
+    roll = DieRoll("4d6+3", "a")
+    return lambda: roll.print_results(roll.action())
+
+
+@benchmark("roll_make_roll")
+def bench_roll_make_roll():
+    from dungeonbot.plugins.roll import RollPlugin
+
+    plugin = RollPlugin(_event("!roll 1d20+5"), "1d20+5")
+    user = _user()
+    return lambda: plugin.make_roll(["1d20+5"], user)
+
+
+@benchmark("roll_make_roll_saved")
+def bench_roll_make_roll_saved():
+    from dungeonbot.models.roll import RollModel
+    from dungeonbot.plugins.roll import RollPlugin
+
+    plugin = RollPlugin(_event("!roll fireball"), "fireball")
+    user = _user()
+    if not RollModel.get(key="fireball", user=user):
+        RollModel.new(key="fireball", val="8d6", user=user)
+    return lambda: plugin.make_roll(["fireball"], user)
+
+
+@benchmark("karma_modify_run")
+def bench_karma_modify_run():
+    from dungeonbot.plugins.karma import KarmaModifyPlugin
+
+    plugin = KarmaModifyPlugin(_event("pizza++"), "pizza", "++")
+    return plugin.run
+
+
+@benchmark("karma_list_highest", sized=True)
+def bench_karma_list_highest(size):
+    from dungeonbot.models.karma import KarmaModel
+
+    seed_karma(size)
+    return lambda: KarmaModel.list_highest(10)
+
+
+@benchmark("karma_leaderboard_highest", sized=True)
+def bench_karma_leaderboard_highest(size):
+    from dungeonbot.plugins.helpers.leaderboard import leaderboard
+
+    seed_karma(size)
+    leaderboard.clear()
+    return lambda: leaderboard.highest(10)
+
+
+@benchmark("quest_slack_msg")
+def bench_quest_slack_msg():
+    from dungeonbot.models.quest import QuestModel
+    from dungeonbot.plugins.quest import QuestPlugin
+
+    quest = QuestModel.new(
+        title="kill the grue",
+        description="It is dark.||You are likely to be eaten.",
+        quest_giver="Zork",
+        location_given="West of House",
+    )
+    plugin = QuestPlugin(_event("!quest detail 1"), "detail 1")
+    return lambda: plugin._slack_msg(quest)
+
+
+@benchmark("dispatch_bang_roll")
+def bench_dispatch_bang_roll():
+    from dungeonbot.handlers.event import EventHandler
+
+    event = _event("!roll 1d20")
+    return lambda: EventHandler(event).process_event()
+
+
+@benchmark("dispatch_bang_unknown")
+def bench_dispatch_bang_unknown():
+    from dungeonbot.handlers.event import EventHandler
+
+    event = _event("!nosuchcommand")
+    return lambda: EventHandler(event).process_event()
+
+
+@benchmark("dispatch_suffix_karma")
+def bench_dispatch_suffix_karma():
+    from dungeonbot.handlers.event import EventHandler
+
+    event = _event("dice++")
+    return lambda: EventHandler(event).process_event()
+
+
+@benchmark("dispatch_no_command")
+def bench_dispatch_no_command():
+    from dungeonbot.handlers.event import EventHandler
+
+    event = _event("just chatting about dice")
+    return lambda: EventHandler(event).process_event()
+
+
+def seed_karma(size, chunk=10000):
+    """Replace the karma table with `size` rows of random karma."""
+    from dungeonbot.models import db
+    from dungeonbot.models.karma import KarmaModel
+
+    rng = random.Random(size)
+    table = KarmaModel.__table__
+    now = datetime.utcnow()
+
+    db.session.execute(table.delete())
+
+    for start in range(0, size, chunk):
+        rows = []
+        for n in range(start, min(start + chunk, size)):
+            upvotes, downvotes = rng.randint(0, 500), rng.randint(0, 500)
+            rows.append({
+                "created": now,
+                "string_id": "thing{:07d}".format(n),
+                "upvotes": upvotes,
+                "downvotes": downvotes,
+                "karma": upvotes - downvotes,
+            })
+        db.session.execute(table.insert(), rows)
+
+    db.session.commit()
+
+
+def measure(func, rounds=5):
+    """Time `func` and return per-call statistics in seconds."""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    per_call = [t / number for t in timer.repeat(rounds, number)]
+
+    return {
+        "number": number,
+        "rounds": rounds,
+        "min": min(per_call),
+        "median": statistics.median(per_call),
+        "mean": statistics.mean(per_call),
+        "stdev": statistics.stdev(per_call) if rounds > 1 else 0.0,
+    }
+
+
+def prepare(app, db_url=None):
+    """Point the app at a benchmark database and quiet it down.
+
+    Returns the database URL used.
+
+    """
+    import logging
+
+    from dungeonbot.models import db, karma, quest, roll  # noqa: F401
+
+    if db_url is None:
+        handle, path = tempfile.mkstemp(prefix="dungeonbot-bench-",
+                                        suffix=".db")
+        os.close(handle)
+        db_url = "sqlite:///" + path
+
+    os.environ.pop("PERMISSION_TO_SPEAK", None)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=db_url,
+        KARMA_BATCH_WINDOW_MS=0,
+    )
+    logging.getLogger("dungeonbot").setLevel(logging.WARNING)
+
+    db.drop_all()
+    db.create_all()
+
+    return db_url
+
+
+def run(pattern=None, sizes=SIZES, rounds=5, progress=None):
+    """Run the registered benchmarks and return {name: stats}.
+
+    Only benchmarks whose name contains `pattern` are run. `progress`,
+    if given, is called with each name and its stats as they finish.
+
+    """
+    results = {}
+
+    for name, setup, sized in BENCHMARKS:
+        if pattern and pattern not in name:
+            continue
+
+        cases = (
+            [("{}[{}]".format(name, size), (size,)) for size in sizes]
+            if sized else [(name, ())]
+        )
+
+        for case, args in cases:
+            results[case] = measure(setup(*args), rounds)
+            if progress:
+                progress(case, results[case])
+
+    return results
+
+
+def environment(db_url=None):
+    """Describe where results were taken, for the JSON output."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    return {
+        "commit": commit,
+        "taken": datetime.utcnow().isoformat() + "Z",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "database": db_url.split(":", 1)[0] if db_url else None,
+    }
+
+
+def compare(baseline, results, threshold=0.2):
+    """Compare results against a baseline's, by median.
+
+    Returns a list of (name, baseline median, median, ratio, regressed)
+    for the benchmarks in both; a benchmark regressed if it is more than
+    `threshold` (a fraction) slower.
+
+    """
+    rows = []
+
+    for name, stats in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        ratio = stats["median"] / before["median"]
+        rows.append((
+            name,
+            before["median"],
+            stats["median"],
+            ratio,
+            ratio > 1 + threshold,
+        ))
+
+    return rows
+
+
+def format_stats(name, stats):
+    """Return one line describing a benchmark's timings."""
+    return "{:<36} {:>12} median  {:>12} min  ({} x {})".format(
+        name,
+        _format_seconds(stats["median"]),
+        _format_seconds(stats["min"]),
+        stats["rounds"],
+        stats["number"],
+    )
+
+
+def format_comparison(rows):
+    """Return comparison rows as a readable table."""
+    lines = ["{:<36} {:>12} {:>12} {:>8}".format(
+        "benchmark", "baseline", "current", "change")]
+
+    for name, before, after, ratio, regressed in rows:
+        lines.append("{:<36} {:>12} {:>12} {:>+7.1%}{}".format(
+            name,
+            _format_seconds(before),
+            _format_seconds(after),
+            ratio - 1,
+            "  REGRESSION" if regressed else "",
+        ))
+
+    return "\n".join(lines)
+
+
+def _format_seconds(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return "{:.2f} {}".format(seconds / scale, unit)
+    return "{:.0f} ns".format(seconds / 1e-9)
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+
+"""
+A local stand-in for the parts of Slack's Web API that dungeonbot uses.
+
+Serves `chat.postMessage`, `users.list` and `users.info` from memory,
+with optional latency, server errors and rate limiting, so the real
+outbound path can be benchmarked without touching Slack.
+
+Run it:
+
+    python -m auxiliaries.fake_slack --port 8089 --users 5000 \
+        --latency-ms 40 --error-rate 0.01 --rate-limit-rate 0.02
+
+and point dungeonbot at it:
+
+    SLACK_API_URL=http://localhost:8089/api/ PERMISSION_TO_SPEAK=1 \
+        python manage.py serve
+
+`GET /_stats` returns how many calls each method has answered.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import argparse
+import json
+import random
+import threading
+import time
+
+
+def make_users(count, team_id="T00000001"):
+    """Return `count` users.list members named user00001, user00002, ..."""
+    return [
+        {
+            "id": "U{:08d}".format(n),
+            "team_id": team_id,
+            "name": "user{:05d}".format(n),
+            "real_name": "User {}".format(n),
+            "deleted": False,
+            "is_bot": False,
+            "profile": {"real_name": "User {}".format(n)},
+        }
+        for n in range(1, count + 1)
+    ]
+
+
+class FakeSlack(object):
+    """A fake Slack Web API served from a background thread.
+
+    `latency` is seconds added to every answer (plus up to `jitter`
+    more). `error_rate` and `rate_limit_rate` are the fractions of calls
+    answered with an HTTP 500 and with a 429 carrying `retry_after`.
+
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, users=100,
+                 team_id="T00000001", latency=0.0, jitter=0.0,
+                 error_rate=0.0, rate_limit_rate=0.0, retry_after=1):
+        """Initialize FakeSlack with `users` members of one team.
+
+        Nothing is served until start() is called. A `port` of 0 picks
+        a free port; see `url`.
+
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+
+        self.members = make_users(users, team_id)
+        self.by_id = {member["id"]: member for member in self.members}
+        self.posts = []
+        self.stats = {}
+        self.lock = threading.Lock()
+
+        self.server = ThreadingHTTPServer((host, port), _make_handler(self))
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        """The base URL to use as SLACK_API_URL."""
+        host, port = self.server.server_address[:2]
+        return "http://{}:{}/api/".format(host, port)
+
+    def start(self):
+        """Start serving on a background thread; return self."""
+        self.thread = threading.Thread(
+            target=self.server.serve_forever,
+            name="fake-slack",
+            daemon=True,
+        )
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving."""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def answer(self, method, params):
+        """Return (HTTP status, headers, body dict) for one API call."""
+        with self.lock:
+            self.stats[method] = self.stats.get(method, 0) + 1
+
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+
+        roll = random.random()
+
+        if roll < self.rate_limit_rate:
+            return 429, {"Retry-After": str(self.retry_after)}, {
+                "ok": False,
+                "error": "ratelimited",
+            }
+
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 500, {}, {"ok": False, "error": "internal_error"}
+
+        if method == "chat.postMessage":
+            return 200, {}, self.post_message(params)
+
+        if method == "users.list":
+            return 200, {}, {"ok": True, "members": self.members}
+
+        if method == "users.info":
+            user = self.by_id.get(params.get("user"))
+            if user is None:
+                return 200, {}, {"ok": False, "error": "user_not_found"}
+            return 200, {}, {"ok": True, "user": user}
+
+        return 200, {}, {"ok": False, "error": "unknown_method"}
+
+    def post_message(self, params):
+        """Record a chat.postMessage call and answer it like Slack."""
+        if not params.get("channel"):
+            return {"ok": False, "error": "channel_not_found"}
+
+        ts = "{:.6f}".format(time.time())
+
+        with self.lock:
+            self.posts.append((params["channel"], params.get("text")))
+
+        return {
+            "ok": True,
+            "channel": params["channel"],
+            "ts": ts,
+            "message": {"type": "message", "text": params.get("text"),
+                        "ts": ts},
+        }
+
+
+def _make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.handle_call()
+
+        def do_POST(self):
+            self.handle_call()
+
+        def handle_call(self):
+            url = urlparse(self.path)
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                body = self.rfile.read(length).decode("utf-8")
+                if "json" in (self.headers.get("Content-Type") or ""):
+                    params.update(json.loads(body))
+                else:
+                    params.update(
+                        {k: v[-1] for k, v in parse_qs(body).items()}
+                    )
+
+            if url.path == "/_stats":
+                with fake.lock:
+                    status, headers, body = 200, {}, dict(
+                        fake.stats,
+                        posts=len(fake.posts),
+                    )
+            elif url.path.startswith("/api/"):
+                status, headers, body = fake.answer(url.path[5:], params)
+            else:
+                status, headers, body = 404, {}, {"ok": False}
+
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--team-id", default="T00000001")
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    args = parser.parse_args()
+
+    fake = FakeSlack(
+        host=args.host,
+        port=args.port,
+        users=args.users,
+        team_id=args.team_id,
+        latency=args.latency_ms / 1000.0,
+        jitter=args.jitter_ms / 1000.0,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+    )
+
+    print("Fake Slack API at {}".format(fake.url))
+    fake.server.serve_forever()
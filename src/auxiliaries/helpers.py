@@ -1,6 +0,0 @@
-from __future__ import print_function
-import sys
-
-
-def eprint(*args, **kwargs):
-    print(">>>>", *args, file=sys.stderr, **kwargs)
@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+
+"""
+Replay Events API payloads against dungeonbot and measure it.
+
+Payloads are either synthetic (a mix of `++`, `!roll`, `!quest` and
+`!karma_top`) or read from a JSONL file with one recorded payload per
+line. They are POSTed to `/` either in-process, through the Flask test
+client, or over HTTP to a running server, at a fixed rate or from a
+fixed number of concurrent senders.
+
+The report gives request latency percentiles, throughput, status and
+error counts and, in-process, how many events the workers handled and
+how many DB queries they made. Run it through manage.py:
+
+    python manage.py load_test -n 2000 -c 16 --fake-slack
+
+Use a file or server database (e.g. DB_URL=sqlite:////tmp/load.db):
+an in-memory SQLite database isn't shared between worker threads.
+"""
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import json
+import random
+import threading
+import time
+
+
+# Share of each kind of command in a synthetic corpus.
+MIX = (
+    ("++", 40),
+    ("!roll", 30),
+    ("!quest", 15),
+    ("!karma_top", 15),
+)
+
+
+def _synthetic_text(kind, rng, users):
+    if kind == "++":
+        if rng.random() < 0.5:
+            return "user{:05d}++".format(rng.randint(1, users))
+        return rng.choice(("pizza", "dice", "the dm", "goblins")) + "++"
+
+    if kind == "!roll":
+        return "!roll {}d{}+{}".format(
+            rng.randint(1, 4),
+            rng.choice((4, 6, 8, 10, 12, 20)),
+            rng.randint(0, 5),
+        )
+
+    if kind == "!quest":
+        if rng.random() < 0.1:
+            return "!quest new Quest {}".format(rng.randint(1, 10 ** 6))
+        return "!quest log"
+
+    return "!karma_top {}".format(rng.choice((5, 10)))
+
+
+def synthetic_payloads(count, channels=10, users=1000,
+                       team_id="T00000001", seed=None):
+    """Yield `count` Events API payloads with a mix of commands."""
+    rng = random.Random(seed)
+    kinds = [kind for kind, weight in MIX for _ in range(weight)]
+    now = time.time()
+
+    for n in range(count):
+        ts = "{:.6f}".format(now + n / 1000.0)
+        yield {
+            "token": "loadgen",
+            "team_id": team_id,
+            "api_app_id": "A00000000",
+            "type": "event_callback",
+            "event_id": "EvLoad{:010d}".format(n),
+            "event": {
+                "type": "message",
+                "text": _synthetic_text(rng.choice(kinds), rng, users),
+                "user": "U{:08d}".format(rng.randint(1, users)),
+                "channel": "C{:08d}".format(rng.randint(1, channels)),
+                "ts": ts,
+                "event_ts": ts,
+            },
+        }
+
+
+def read_payloads(path, repeat=1):
+    """Yield payloads from a JSONL file, `repeat` times over.
+
+    Event ids get a per-pass suffix so deduplication doesn't drop the
+    replayed copies.
+
+    """
+    with open(path) as f:
+        payloads = [json.loads(line) for line in f if line.strip()]
+
+    for n in range(repeat):
+        for payload in payloads:
+            payload = dict(payload)
+            if payload.get("event_id"):
+                payload["event_id"] = "{}-{}".format(payload["event_id"], n)
+            yield payload
+
+
+def percentile(ordered, fraction):
+    """Return the nearest-rank percentile of an already-sorted list."""
+    if not ordered:
+        return None
+    rank = int(round(fraction * len(ordered)))
+    return ordered[max(0, min(len(ordered), rank) - 1)]
+
+
+class QueryCounter(object):
+    """Count SQL statements run by any SQLAlchemy engine in the process."""
+
+    def __init__(self):
+        """Initialize QueryCounter; nothing is counted until start()."""
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def _count(self, *args, **kwargs):
+        with self._lock:
+            self.count += 1
+
+    def start(self):
+        """Start counting."""
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+
+        event.listen(Engine, "before_cursor_execute", self._count)
+
+    def stop(self):
+        """Stop counting."""
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+
+        event.remove(Engine, "before_cursor_execute", self._count)
+
+
+def in_process_sender(app):
+    """Return a send(payload) that posts through the Flask test client."""
+    local = threading.local()
+
+    def send(payload):
+        if not hasattr(local, "client"):
+            local.client = app.test_client()
+        response = local.client.post(
+            "/",
+            data=json.dumps(payload),
+            content_type="application/json",
+        )
+        return response.status_code
+
+    return send
+
+
+def http_sender(url):
+    """Return a send(payload) that POSTs to a running server."""
+    import requests
+
+    local = threading.local()
+
+    def send(payload):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        return local.session.post(url, json=payload, timeout=30).status_code
+
+    return send
+
+
+def run_load(payloads, send, concurrency=8, rate=None):
+    """Send every payload and return a report dict.
+
+    With `rate` set, payloads are started at that many per second (up to
+    `concurrency` at once); otherwise `concurrency` senders send back to
+    back.
+
+    """
+    latencies = []
+    statuses = Counter()
+    errors = Counter()
+    lock = threading.Lock()
+
+    def one(payload):
+        started = time.perf_counter()
+        try:
+            status = send(payload)
+        except Exception as e:
+            with lock:
+                errors[type(e).__name__] += 1
+            return
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            statuses[status] += 1
+
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        if rate:
+            for n, payload in enumerate(payloads):
+                delay = started + n / float(rate) - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(one, payload)
+        else:
+            source = iter(payloads)
+            source_lock = threading.Lock()
+
+            def drain():
+                while True:
+                    with source_lock:
+                        payload = next(source, None)
+                    if payload is None:
+                        return
+                    one(payload)
+
+            for _ in range(concurrency):
+                pool.submit(drain)
+
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+
+    return {
+        "requests": len(latencies) + sum(errors.values()),
+        "seconds": round(elapsed, 3),
+        "throughput": round(len(latencies) / elapsed, 1) if elapsed else 0,
+        "latency_ms": {
+            name: round(percentile(latencies, fraction) * 1000, 2)
+            if latencies else None
+            for name, fraction in (
+                ("p50", 0.50),
+                ("p95", 0.95),
+                ("p99", 0.99),
+                ("max", 1.0),
+            )
+        },
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        "errors": dict(errors),
+    }
+
+
+def run_in_process(app, payloads, concurrency=8, rate=None):
+    """Run the load through the Flask test client and wait for the workers.
+
+    Adds to the report how many events the worker pool handled, how
+    long that took in total and how many DB queries were made. The
+    process-wide worker pool is shut down to wait for it, so call this
+    once per process.
+
+    """
+    from dungeonbot.handlers.executor import get_executor
+    from dungeonbot.handlers.slack import outbound_queue
+
+    executor = get_executor()
+    before = executor.counters
+    queries = QueryCounter()
+    queries.start()
+
+    try:
+        started = time.perf_counter()
+        report = run_load(payloads, in_process_sender(app), concurrency, rate)
+        executor.shutdown(wait=True)
+        outbound_queue.drain(timeout=30)
+        elapsed = time.perf_counter() - started
+    finally:
+        queries.stop()
+
+    after = executor.counters
+    processed = after["completed"] - before["completed"]
+    failed = after["failed"] - before["failed"]
+    handled = processed + failed
+
+    report.update(
+        processed=processed,
+        failed=failed,
+        processing_seconds=round(elapsed, 3),
+        processed_throughput=round(processed / elapsed, 1) if elapsed else 0,
+        queries=queries.count,
+        queries_per_event=round(queries.count / handled, 2)
+        if handled else None,
+    )
+
+    return report
+
+
+def format_report(report):
+    """Return a report dict as readable text."""
+    lines = [
+        "requests:    {}".format(report["requests"]),
+        "seconds:     {}".format(report["seconds"]),
+        "throughput:  {} req/s".format(report["throughput"]),
+        "latency ms:  " + "  ".join(
+            "{} {}".format(name, value)
+            for name, value in report["latency_ms"].items()
+        ),
+        "statuses:    {}".format(report["statuses"]),
+        "errors:      {}".format(report["errors"] or "none"),
+    ]
+
+    if "processed" in report:
+        lines += [
+            "processed:   {} events in {} s ({} events/s), {} failed".format(
+                report["processed"],
+                report["processing_seconds"],
+                report["processed_throughput"],
+                report["failed"],
+            ),
+            "db queries:  {} ({} per event)".format(
+                report["queries"],
+                report["queries_per_event"],
+            ),
+        ]
+
+    return "\n".join(lines)
@@ -5,6 +5,19 @@ import os
 from flask import Flask
 
 
+def env_flag(name, default=False):
+    """Read a boolean switch from the environment.
+
+    "0", "false", "no", "off" and the empty string are False; anything
+    else is True. An unset variable gives `default`.
+
+    """
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() not in ("", "0", "false", "no", "off")
+
+
 ################################
 # APP CONFIG
 #################################
@@ -24,4 +37,106 @@ app.config.update(
     SECRET_KEY=os.getenv("SECRET_KEY", "sooper seekrit"),
     SQLALCHEMY_DATABASE_URI=DB_URL,
     SQLALCHEMY_TRACK_MODIFICATIONS=False,
+
+    # "wsgi" serves the Flask app; "asgi" serves dungeonbot.asgi.
+    SERVER_INTERFACE=os.getenv("SERVER_INTERFACE", "wsgi"),
+
+    # Worker pool that runs plugins for incoming Slack events.
+    EVENT_WORKERS=int(os.getenv("EVENT_WORKERS", 8)),
+    EVENT_QUEUE_SIZE=int(os.getenv("EVENT_QUEUE_SIZE", 256)),
+    EVENT_OVERFLOW_POLICY=os.getenv("EVENT_OVERFLOW_POLICY", "reject"),
+    EVENT_ORDERING=os.getenv("EVENT_ORDERING", "team_channel"),
+    # /metrics shows the queue depth of this many of the busiest keys.
+    EVENT_METRICS_KEYS=int(os.getenv("EVENT_METRICS_KEYS", 10)),
+
+    # Admission control: past a class's share of EVENT_MAX_IN_FLIGHT,
+    # new events of that class get a 503 with Retry-After.
+    EVENT_SHED_THRESHOLDS={"low": 0.5, "normal": 0.8, "critical": 1.0},
+    EVENT_RETRY_AFTER=int(os.getenv("EVENT_RETRY_AFTER", 5)),
+
+    # Accepted events are stored in the DB until a worker has handled them.
+    EVENT_QUEUE_DURABLE=env_flag("EVENT_QUEUE_DURABLE", True),
+    EVENT_QUEUE_LEASE=int(os.getenv("EVENT_QUEUE_LEASE", 60)),
+    EVENT_QUEUE_MAX_ATTEMPTS=int(os.getenv("EVENT_QUEUE_MAX_ATTEMPTS", 5)),
+
+    # Slack retries of an already-accepted event are dropped.
+    EVENT_DEDUP_SIZE=int(os.getenv("EVENT_DEDUP_SIZE", 4096)),
+    EVENT_DEDUP_TTL=int(os.getenv("EVENT_DEDUP_TTL", 600)),
+    EVENT_DEDUP_SHARED=env_flag("EVENT_DEDUP_SHARED", False),
+
+    # Karma changes arriving within this many ms share one commit; 0 is off.
+    KARMA_BATCH_WINDOW_MS=int(os.getenv("KARMA_BATCH_WINDOW_MS", 0)),
+    KARMA_BATCH_MAX=int(os.getenv("KARMA_BATCH_MAX", 200)),
+
+    # Write karma behind: don't wait for the commit, flush every
+    # KARMA_FLUSH_MS (or every KARMA_BATCH_MAX changes) instead.
+    KARMA_WRITE_BEHIND=env_flag("KARMA_WRITE_BEHIND"),
+    KARMA_FLUSH_MS=int(os.getenv("KARMA_FLUSH_MS", 1000)),
+
+    # Top and bottom karma entries kept in memory for the leaderboards,
+    # reloaded every KARMA_LEADERBOARD_TTL seconds (0: never).
+    KARMA_LEADERBOARD_SIZE=int(os.getenv("KARMA_LEADERBOARD_SIZE", 100)),
+    KARMA_LEADERBOARD_TTL=int(os.getenv("KARMA_LEADERBOARD_TTL", 60)),
+
+    # Record every vote in the karma ledger and its hourly/daily rollups.
+    # `manage.py compact_karma` deletes ledger rows older than
+    # KARMA_LEDGER_DAYS and hourly rollups older than KARMA_HOURLY_DAYS.
+    KARMA_LEDGER=env_flag("KARMA_LEDGER", True),
+    KARMA_LEDGER_DAYS=int(os.getenv("KARMA_LEDGER_DAYS", 30)),
+    KARMA_HOURLY_DAYS=int(os.getenv("KARMA_HOURLY_DAYS", 14)),
+
+    # Base URL of Slack's Web API; point it at auxiliaries/fake_slack.py
+    # to exercise the outbound path offline.
+    SLACK_API_URL=os.getenv("SLACK_API_URL", "https://slack.com/api/"),
+
+    # Connections to Slack kept open for reuse by the shared client.
+    SLACK_POOL_SIZE=int(os.getenv("SLACK_POOL_SIZE", 10)),
+
+    # Posts to Slack are queued and sent by SLACK_SENDERS threads, at
+    # most SLACK_CHANNEL_RATE per second per channel (bursts of
+    # SLACK_CHANNEL_BURST) and SLACK_TEAM_RATE per second per workspace.
+    SLACK_OUTBOUND_QUEUE=env_flag("SLACK_OUTBOUND_QUEUE", True),
+    SLACK_SENDERS=int(os.getenv("SLACK_SENDERS", 2)),
+    SLACK_CHANNEL_RATE=float(os.getenv("SLACK_CHANNEL_RATE", 1.0)),
+    SLACK_CHANNEL_BURST=int(os.getenv("SLACK_CHANNEL_BURST", 3)),
+    SLACK_TEAM_RATE=float(os.getenv("SLACK_TEAM_RATE", 5.0)),
+    SLACK_TEAM_BURST=int(os.getenv("SLACK_TEAM_BURST", 20)),
+    SLACK_OUTBOUND_MAX=int(os.getenv("SLACK_OUTBOUND_MAX", 1000)),
+    SLACK_POST_ATTEMPTS=int(os.getenv("SLACK_POST_ATTEMPTS", 5)),
+
+    # Replies to one channel within this many ms are merged into a single
+    # post of at most SLACK_COALESCE_MAX characters; 0 is off.
+    SLACK_COALESCE_MS=int(os.getenv("SLACK_COALESCE_MS", 0)),
+    SLACK_COALESCE_MAX=int(os.getenv("SLACK_COALESCE_MAX", 4000)),
+
+    # Timeouts for each Slack request, in seconds.
+    SLACK_CONNECT_TIMEOUT=float(os.getenv("SLACK_CONNECT_TIMEOUT", 3.05)),
+    SLACK_READ_TIMEOUT=float(os.getenv("SLACK_READ_TIMEOUT", 10)),
+
+    # After this many failures in a row, calls to a Slack method fail at
+    # once for SLACK_BREAKER_RESET seconds, then one trial call is made.
+    SLACK_BREAKER_THRESHOLDS={"chat.postMessage": 5, "users.list": 3},
+    SLACK_BREAKER_RESET=float(os.getenv("SLACK_BREAKER_RESET", 30)),
+
+    # Seconds before the cached Slack user list is refreshed.
+    SLACK_USERS_TTL=int(os.getenv("SLACK_USERS_TTL", 300)),
+
+    # Plugins to import at startup rather than on first use: a
+    # comma-separated list of command names or suffixes, or "*" for all.
+    PLUGIN_PRELOAD=[
+        name.strip()
+        for name in os.getenv("PLUGIN_PRELOAD", "").split(",")
+        if name.strip()
+    ],
+
+    # Logging: records past LOG_QUEUE_SIZE are dropped rather than waited
+    # on; only one in LOG_SAMPLE_UNIMPORTANT ignored events is logged.
+    LOG_LEVEL=os.getenv("LOG_LEVEL", "INFO").upper(),
+    LOG_QUEUE_SIZE=int(os.getenv("LOG_QUEUE_SIZE", 10000)),
+    LOG_MAX_FIELD=int(os.getenv("LOG_MAX_FIELD", 200)),
+    LOG_SAMPLE_UNIMPORTANT=int(os.getenv("LOG_SAMPLE_UNIMPORTANT", 100)),
 )
+app.config["EVENT_MAX_IN_FLIGHT"] = int(os.getenv(
+    "EVENT_MAX_IN_FLIGHT",
+    app.config["EVENT_WORKERS"] + app.config["EVENT_QUEUE_SIZE"],
+))
@@ -0,0 +1,165 @@
+"""Define an ASGI application serving the same routes as the Flask app.
+
+Requests are handled on the event loop, so one process can hold many
+concurrent connections from Slack. Work that touches the database
+(deduplication in shared mode, writing to the durable event queue) runs
+as a job on the loop's default thread pool, and the events themselves
+are processed by the same EventExecutor the Flask app uses.
+
+Serve it with any ASGI server, e.g. `python manage.py serve -i asgi`.
+
+"""
+
+import asyncio
+import json
+import time
+
+from dungeonbot import app, routes
+from dungeonbot.models import db
+from dungeonbot.handlers.executor import get_executor
+from dungeonbot.metrics import command_label, timings
+from dungeonbot.log import get_logger
+
+
+log = get_logger(__name__)
+
+
+def _accept_event(payload, retry_num):
+    """Run routes.accept_event() and release the thread's DB session."""
+    try:
+        return routes.accept_event(payload, retry_num)
+    finally:
+        db.session.remove()
+
+
+async def _read_body(receive):
+    body = b""
+    more_body = True
+
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+    return body
+
+
+async def _respond(send, status, headers=None, body=b""):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": headers or [],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+
+        if message["type"] == "lifespan.startup":
+            # The worker has forked by now; replay events left in storage.
+            routes.event_queue.start()
+            await send({"type": "lifespan.startup.complete"})
+
+        elif message["type"] == "lifespan.shutdown":
+            # Joining the worker threads blocks; keep it off the loop.
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, get_executor().shutdown)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def root(scope, receive, send):
+    """Define the root route.
+
+    Same behavior as routes.root(): POSTed events are queued for
+    processing, and GET requests are redirected to the readme.
+
+    """
+    log.debug("hit / route")
+
+    if scope["method"] == "GET":
+        await _respond(send, 302, [
+            (b"location", routes.README_URL.encode()),
+        ])
+        return
+
+    body = await _read_body(receive)
+    started = time.perf_counter()
+
+    try:
+        payload = json.loads(body.decode("utf-8"))
+    except ValueError:
+        await _respond(send, 400)
+        return
+
+    command = command_label(payload.get("event", {}))
+    timings.observe("parse", command, time.perf_counter() - started)
+
+    headers = dict(scope.get("headers", []))
+    retry_num = headers.get(b"x-slack-retry-num")
+    if retry_num is not None:
+        retry_num = retry_num.decode("latin-1")
+
+    loop = asyncio.get_event_loop()
+    with timings.time("accept", command):
+        status = await loop.run_in_executor(
+            None,
+            _accept_event,
+            payload,
+            retry_num,
+        )
+
+    if status == 503:
+        retry_after = str(app.config["EVENT_RETRY_AFTER"]).encode()
+        await _respond(send, 503, [(b"retry-after", retry_after)])
+        return
+
+    await _respond(send, status)
+
+
+async def oauth(scope, receive, send):
+    """Define OAuth route for adding dungeonbot to Slack teams."""
+    log.debug("hit /oauth route")
+
+    await _respond(send, 200)
+
+
+async def metrics(scope, receive, send):
+    """Expose stage timings and pipeline counters to Prometheus."""
+    await _respond(
+        send,
+        200,
+        [(b"content-type", b"text/plain; version=0.0.4")],
+        routes.render_metrics().encode("utf-8"),
+    )
+
+
+ROUTES = {
+    "/": (root, ("GET", "POST")),
+    "/oauth": (oauth, ("GET", "POST")),
+    "/metrics": (metrics, ("GET",)),
+}
+
+
+async def application(scope, receive, send):
+    """Dispatch an ASGI connection to the matching route."""
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+
+    if scope["type"] != "http":
+        return
+
+    if scope["path"] not in ROUTES:
+        await _respond(send, 404)
+        return
+
+    handler, methods = ROUTES[scope["path"]]
+
+    if scope["method"] not in methods:
+        await _respond(send, 405)
+        return
+
+    await handler(scope, receive, send)
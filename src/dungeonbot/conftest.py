@@ -2,6 +2,8 @@
 
 from dungeonbot import app
 from dungeonbot.models import db
+from dungeonbot.handlers.slack import user_directory
+from dungeonbot.plugins.helpers.leaderboard import leaderboard
 
 from flask_testing import TestCase
 
@@ -31,6 +33,8 @@ class BaseTest(TestCase):
 
     def setUp(self):
         """Setup the test DB before any tests."""
+        user_directory.clear()
+        leaderboard.clear()
         db.create_all()
         self.db = db
 
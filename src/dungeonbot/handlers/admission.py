@@ -0,0 +1,105 @@
+"""Define the AdmissionController class."""
+
+import threading
+
+from dungeonbot import app
+from dungeonbot.handlers.executor import get_executor
+from dungeonbot.handlers.tokenizer import tokenize
+from dungeonbot.log import fields, get_logger
+
+
+log = get_logger(__name__)
+
+
+# Which class of load each bang command belongs to. Suffix commands
+# (karma writes) are "critical"; anything not listed here is "normal".
+COMMAND_CLASSES = {
+    'help': "low",
+    'karma': "low",
+    'karma_newest': "low",
+    'karma_top': "low",
+    'karma_bottom': "low",
+}
+
+
+def command_class(event):
+    """Return the load class of an event: low, normal or critical."""
+    text = event.get("text") or ""
+
+    if text[:1] == "!":
+        command = text[1:].split(" ", 1)[0]
+        return COMMAND_CLASSES.get(command, "normal")
+
+    if tokenize(text):
+        return "critical"
+
+    return "low"
+
+
+class AdmissionController(object):
+    """Turn events away when too many are already in flight.
+
+    Each class of event has a threshold, as a fraction of `capacity`.
+    An event is admitted only while the number of in-flight events is
+    below its class's share, so cheap-to-lose commands like `!help` are
+    shed first and karma writes last.
+
+    """
+
+    def __init__(self, capacity, thresholds, in_flight=None):
+        """Initialize AdmissionController with its capacity and thresholds.
+
+        `in_flight` is a callable returning the current number of
+        in-flight events; it defaults to the process-wide executor's
+        queued plus active jobs.
+
+        """
+        self.capacity = capacity
+        self.thresholds = thresholds
+        self.in_flight = in_flight if in_flight else self._executor_in_flight
+
+        self.admitted = 0
+        self.shed = {}
+
+        self._lock = threading.Lock()
+
+    def admit(self, event):
+        """Return True if the event may be queued."""
+        cls = command_class(event)
+        limit = self.capacity * self.thresholds.get(cls, 1.0)
+        in_flight = self.in_flight()
+
+        with self._lock:
+            if in_flight < limit:
+                self.admitted += 1
+                return True
+
+            self.shed[cls] = self.shed.get(cls, 0) + 1
+
+        log.warning("shedding event", extra=fields(
+            load_class=cls,
+            in_flight=in_flight,
+            capacity=self.capacity,
+            text=event.get("text"),
+        ))
+        return False
+
+    @property
+    def counters(self):
+        """Return a snapshot of the controller's counters."""
+        with self._lock:
+            return {
+                "admitted": self.admitted,
+                "shed": dict(self.shed),
+            }
+
+    @staticmethod
+    def _executor_in_flight():
+        counters = get_executor().counters
+        return counters["queued"] + counters["active"]
+
+
+admission = AdmissionController(
+    capacity=app.config["EVENT_MAX_IN_FLIGHT"],
+    thresholds=app.config["EVENT_SHED_THRESHOLDS"],
+)
@@ -0,0 +1,175 @@
+"""Define the CircuitBreaker and BreakerBoard classes."""
+
+import threading
+import time
+
+from slacker import Error as SlackError
+
+from dungeonbot.log import fields, get_logger
+
+
+log = get_logger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling Slack while a circuit is open."""
+
+    def __init__(self, name, retry_after):
+        """Initialize CircuitOpenError with seconds until the next trial."""
+        super().__init__("circuit for {} is open; retry in {:.1f}s".format(
+            name,
+            retry_after,
+        ))
+        self.name = name
+        self.retry_after = retry_after
+
+
+def is_failure(error):
+    """Return True if an error means Slack is unhealthy.
+
+    Slack API errors (`ok: false`) and rate limiting (429) are answers
+    from a working Slack, so they don't count.
+
+    """
+    if isinstance(error, (SlackError, CircuitOpenError)):
+        return False
+
+    response = getattr(error, "response", None)
+    if response is not None and getattr(response, "status_code", None) == 429:
+        return False
+
+    return True
+
+
+class CircuitBreaker(object):
+    """Stop calling something that keeps failing.
+
+    After `threshold` failures in a row the circuit opens and calls fail
+    at once with CircuitOpenError. After `reset_timeout` seconds it goes
+    half-open and lets one trial call through: success closes the
+    circuit, failure opens it again.
+
+    """
+
+    def __init__(self, name, threshold=5, reset_timeout=30.0):
+        """Initialize a closed CircuitBreaker."""
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+
+        self.state = CLOSED
+        self.failures = 0
+        self.rejected = 0
+        self.opened_at = 0.0
+
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def call(self, func, *args, **kwargs):
+        """Call `func`, unless the circuit is open."""
+        self._before_call()
+
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self._after_call(failed=is_failure(e))
+            raise
+
+        self._after_call(failed=False)
+        return result
+
+    def _before_call(self):
+        with self._lock:
+            if self.state == CLOSED:
+                return
+
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+
+            if self.state == OPEN and remaining <= 0:
+                self.state = HALF_OPEN
+
+            if self.state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return
+
+            self.rejected += 1
+            raise CircuitOpenError(self.name, max(remaining, 0.0))
+
+    def _after_call(self, failed):
+        with self._lock:
+            trial = self._trial_running
+            self._trial_running = False
+
+            if not failed:
+                if self.state != CLOSED:
+                    log.info("circuit closed", extra=fields(method=self.name))
+                self.state = CLOSED
+                self.failures = 0
+                return
+
+            self.failures += 1
+
+            if trial or self.failures >= self.threshold:
+                if self.state != OPEN:
+                    log.warning("circuit opened", extra=fields(
+                        method=self.name,
+                        failures=self.failures,
+                    ))
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+
+class BreakerBoard(object):
+    """One CircuitBreaker per Slack Web API method.
+
+    `thresholds` maps method names to their failure threshold; methods
+    not listed use `default_threshold`.
+
+    """
+
+    def __init__(self, thresholds=None, default_threshold=5,
+                 reset_timeout=30.0):
+        """Initialize BreakerBoard with no breakers yet."""
+        self.thresholds = thresholds or {}
+        self.default_threshold = default_threshold
+        self.reset_timeout = reset_timeout
+
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, method):
+        """Return the breaker for a Slack method, creating it if needed."""
+        breaker = self._breakers.get(method)
+
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(method, CircuitBreaker(
+                    method,
+                    threshold=self.thresholds.get(
+                        method,
+                        self.default_threshold,
+                    ),
+                    reset_timeout=self.reset_timeout,
+                ))
+
+        return breaker
+
+    def call(self, method, func, *args, **kwargs):
+        """Call `func` through the breaker for `method`."""
+        return self.get(method).call(func, *args, **kwargs)
+
+    @property
+    def counters(self):
+        """Return each breaker's state, failures and rejected calls."""
+        with self._lock:
+            breakers = list(self._breakers.values())
+
+        return {
+            "open": {b.name: int(b.state != CLOSED) for b in breakers},
+            "failures": {b.name: b.failures for b in breakers},
+            "rejected": {b.name: b.rejected for b in breakers},
+        }
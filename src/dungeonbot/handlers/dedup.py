@@ -0,0 +1,150 @@
+"""Define the EventDeduplicator class."""
+
+from collections import OrderedDict
+
+import threading
+import time
+
+from dungeonbot import app
+from dungeonbot.models.seen_event import SeenEventModel
+
+
+class EventDeduplicator(object):
+    """Recognize Slack events that have already been accepted.
+
+    Slack resends an event when we are slow to answer, with the same
+    `event_id`. Ids seen in the last `ttl` seconds are kept in an LRU of
+    at most `max_size` entries, so a check is one dict lookup.
+
+    With `shared` set, ids missing from the LRU are also recorded in the
+    database, so that a retry landing on a different server process is
+    still recognized.
+
+    """
+
+    PRUNE_EVERY = 1000
+
+    def __init__(self, max_size=4096, ttl=600, shared=False):
+        """Initialize EventDeduplicator with its size and TTL."""
+        self.max_size = max_size
+        self.ttl = ttl
+        self.shared = shared
+
+        self.hits = 0
+        self.misses = 0
+
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    def is_duplicate(self, key):
+        """Record `key` and return True if it was seen before.
+
+        A key of None is never a duplicate.
+
+        """
+        if key is None:
+            return False
+
+        now = time.monotonic()
+
+        with self._lock:
+            seen_at = self._seen.get(key)
+
+            if seen_at is not None and now - seen_at < self.ttl:
+                self._seen.move_to_end(key)
+                self.hits += 1
+                return True
+
+        # Only remember the key once it's recorded everywhere it needs to
+        # be; if recording it raises, a retry must still get through.
+        duplicate = self.shared and not self._mark_shared(key)
+
+        with self._lock:
+            self._remember(key, now)
+            if duplicate:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        return duplicate
+
+    def forget(self, key):
+        """Forget `key`, e.g. because its event was turned away after all."""
+        if key is None:
+            return
+
+        with self._lock:
+            self._seen.pop(key, None)
+
+        if self.shared:
+            SeenEventModel.unmark(key)
+
+    def clear(self):
+        """Forget every key and reset the counters."""
+        with self._lock:
+            self._seen.clear()
+            self.hits = 0
+            self.misses = 0
+
+    @property
+    def counters(self):
+        """Return a snapshot of the deduplicator's counters."""
+        with self._lock:
+            return {
+                "size": len(self._seen),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _remember(self, key, now):
+        self._seen[key] = now
+        self._seen.move_to_end(key)
+
+        while len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+
+        # Entries are kept in insertion order, so expired ones are at the
+        # front.
+        while self._seen:
+            oldest = next(iter(self._seen))
+            if now - self._seen[oldest] < self.ttl:
+                break
+            del self._seen[oldest]
+
+    def _mark_shared(self, key):
+        marked = SeenEventModel.mark(key)
+
+        if marked and (self.misses + 1) % self.PRUNE_EVERY == 0:
+            SeenEventModel.prune(self.ttl)
+
+        return marked
+
+
+def event_key(payload):
+    """Return the key identifying a Slack Events API payload.
+
+    Slack's `event_id` is used when present; older payloads fall back to
+    the team, channel and event timestamp.
+
+    """
+    if payload.get("event_id"):
+        return payload["event_id"]
+
+    event = payload.get("event", {})
+    event_ts = event.get("event_ts") or event.get("ts")
+
+    if not event_ts:
+        return None
+
+    return "{}:{}:{}".format(
+        payload.get("team_id"),
+        event.get("channel"),
+        event_ts,
+    )
+
+
+deduplicator = EventDeduplicator(
+    max_size=app.config["EVENT_DEDUP_SIZE"],
+    ttl=app.config["EVENT_DEDUP_TTL"],
+    shared=app.config["EVENT_DEDUP_SHARED"],
+)
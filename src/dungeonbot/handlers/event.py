@@ -1,96 +1,88 @@
 """Define the EventHandler class."""
 
+from collections import OrderedDict
+
 from dungeonbot.handlers.slack import SlackHandler
-from dungeonbot.plugins import (
-    help,
-    karma,
-    roll,
-    quest,
-    highlights,
-    attribute,
-)
+from dungeonbot.handlers.tokenizer import tokenize
+from dungeonbot.metrics import timings
+from dungeonbot.plugins import registry
 
 
 class EventHandler(object):
-    """Parse events and call the appropriate plugin."""
+    """Parse events and call the appropriate plugin.
+
+    Plugins are looked up in the registry, which imports each plugin's
+    module the first time its command is used.
+
+    """
+
+    valid_commands = registry.commands
+    valid_suffixes = registry.suffixes
 
     def __init__(self, event):
         """Initialize EventHandler with an event passed in."""
         self.event = event
-
-        self.valid_commands = {
-            'help': help.HelpPlugin,
-            'karma': karma.KarmaPlugin,
-            'karma_newest': karma.KarmaNewestPlugin,
-            'karma_top': karma.KarmaTopPlugin,
-            'karma_bottom': karma.KarmaBottomPlugin,
-            'roll': roll.RollPlugin,
-            'quest': quest.QuestPlugin,
-            'attr': attribute.AttrPlugin,
-        }
-
-        self.valid_suffixes = {
-            '++': karma.KarmaModifyPlugin,
-            '--': karma.KarmaModifyPlugin,
-        }
-
         self.bot = SlackHandler()
 
     def process_event(self):
         """Decide type of command.
 
-        Commands can either be bang-commands or suffix-commands.
+        Commands can either be bang-commands or suffix-commands. Any
+        message that isn't a bang-command may hold suffix-commands.
 
         """
         if self.event['text'][0] == "!":
             self.parse_bang_command()
 
-        elif self.event['text'][-2:] in self.valid_suffixes:
+        else:
             self.parse_suffix_command()
 
     def parse_bang_command(self):
         """Parse a bang-command and call the appropriate plugin."""
-        valid_commands = {
-            'help': help.HelpPlugin,
-            'karma': karma.KarmaPlugin,
-            'karma_newest': karma.KarmaNewestPlugin,
-            'karma_top': karma.KarmaTopPlugin,
-            'karma_bottom': karma.KarmaBottomPlugin,
-            'roll': roll.RollPlugin,
-            'quest': quest.QuestPlugin,
-            'log': highlights.HighlightPlugin,
-            'attr': attribute.AttrPlugin,
-        }
-
-        evt_string = self.event['text']
-        cmd_string = evt_string[1:]
-
-        try:
-            command, arg_string = cmd_string.split(' ', 1)
-        except ValueError:
-            command, arg_string = cmd_string, ""
-
-        if command in self.valid_commands.keys():
-            plugin = self.valid_commands[command](
-                self.event,
-                arg_string,
-            )
-            plugin.run()
+        with timings.time("dispatch"):
+            evt_string = self.event['text']
+            cmd_string = evt_string[1:]
+
+            try:
+                command, arg_string = cmd_string.split(' ', 1)
+            except ValueError:
+                command, arg_string = cmd_string, ""
+
+            plugin_class = self.valid_commands.get(command)
+            plugin = plugin_class(self.event, arg_string) \
+                if plugin_class else None
+
+        if plugin is not None:
+            with timings.time("plugin"):
+                plugin.run()
 
         else:
             message = "Sorry, '!{}' is not a valid command.".format(command)
             self.bot.make_post(self.event, message)
 
     def parse_suffix_command(self):
-        """Parse a suffix-command and call the appropriate plugin."""
-        evt_string = self.event['text']
-
-        arg_string, suffix = evt_string[:-2], evt_string[-2:]
-
-        if arg_string and (suffix in self.valid_suffixes.keys()):
-            plugin = self.valid_suffixes[suffix](
-                self.event,
-                arg_string,
-                suffix
-            )
-            plugin.run()
+        """Parse suffix-commands and call the appropriate plugins.
+
+        A message can hold several suffix-commands ("alice++ bob--").
+        Each plugin is called once per message: it gets the first
+        command as its arg string and suffix, and all of its commands,
+        in order, as `ops`.
+
+        """
+        with timings.time("dispatch"):
+            grouped = OrderedDict()
+
+            for op in tokenize(self.event['text'], self.valid_suffixes):
+                plugin_class = self.valid_suffixes.get(op.suffix)
+                if plugin_class:
+                    grouped.setdefault(plugin_class, []).append(op)
+
+            plugins = [
+                plugin_class(self.event, ops[0].subject, ops[0].suffix,
+                             ops=ops)
+                for plugin_class, ops in grouped.items()
+            ]
+
+        for plugin in plugins:
+            with timings.time("plugin"):
+                plugin.run()
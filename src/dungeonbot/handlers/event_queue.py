@@ -0,0 +1,260 @@
+"""Define the DurableEventQueue class."""
+
+import threading
+import time
+
+from sqlalchemy.exc import OperationalError
+
+from dungeonbot import app
+from dungeonbot.models import db
+from dungeonbot.models.event_queue import QueuedEventModel
+from dungeonbot.handlers.executor import get_executor, ordering_key
+from dungeonbot.metrics import command_label, timings
+from dungeonbot.log import fields, get_logger, summarize
+
+
+log = get_logger(__name__)
+
+# Failures that may go away on their own (e.g. the database connection
+# dropped); an event that fails with anything else would fail the same
+# way every time it is replayed.
+RETRYABLE_ERRORS = (OperationalError,)
+
+
+class DurableEventQueue(object):
+    """Hand events to the worker pool without losing them on a crash.
+
+    `put()` stores the event in the database with a single INSERT and
+    then submits it to the executor, ordered behind earlier events from
+    the same channel. A worker deletes the stored event only after
+    `process` has returned, so an event that was in flight when the
+    process died is still in the table.
+
+    A sweeper thread, started by `start()` when the server begins
+    handling requests (or by the first `put()`), renews the claims
+    on events still waiting in the executor and replays stored events
+    whose claim is older than `lease` seconds: immediately on startup,
+    then every half lease. Events that have been claimed `max_attempts`
+    times are discarded. A worker renews the claim again when it picks
+    an event up, and skips the event if it has been claimed since it
+    was submitted, so a replayed event is only handled once.
+
+    An event whose processing raises is deleted, since replaying it
+    would fail the same way, unless the error is one of
+    RETRYABLE_ERRORS; then it is left for the sweeper.
+
+    Delivery is at-least-once: an event may be processed twice if a
+    worker dies between handling it and deleting it.
+
+    """
+
+    def __init__(self, process, executor=None, durable=True, lease=60,
+                 max_attempts=5):
+        """Initialize DurableEventQueue with the function that handles events.
+
+        If `executor` is None, the process-wide executor is used.
+
+        """
+        self.process = process
+        self.executor = executor
+        self.durable = durable
+        self.lease = lease
+        self.max_attempts = max_attempts
+
+        self._sweeper = None
+        self._lock = threading.Lock()
+        self._waiting = {}
+
+    def put(self, event):
+        """Store an event and submit it to the executor.
+
+        Returns True if a worker accepted the event straight away. A
+        stored event that the executor rejected is picked up again by
+        the sweeper once its lease expires.
+
+        """
+        if not self.durable:
+            return self._executor().submit_ordered(
+                ordering_key(event),
+                self.consume,
+                None,
+                event,
+                queued_at=time.perf_counter(),
+            )
+
+        self.start()
+        queued_id = QueuedEventModel.push(event)
+
+        return self._submit(queued_id, 1, event,
+                            queued_at=time.perf_counter())
+
+    def consume(self, queued_id, event, queued_at=None, attempt=1):
+        """Process an event, then delete it from storage.
+
+        `queued_at` is the `time.perf_counter()` reading taken when the
+        event was handed to the executor; the wait is recorded as the
+        "queue_wait" stage. `attempt` is the claim the event was
+        submitted under.
+
+        """
+        if queued_at is not None:
+            timings.observe(
+                "queue_wait",
+                command_label(event),
+                time.perf_counter() - queued_at,
+            )
+
+        try:
+            if queued_id is None:
+                self.process(event=event)
+                return
+
+            with self._lock:
+                self._waiting.pop(queued_id, None)
+
+            if not QueuedEventModel.take(queued_id, attempt):
+                log.info("skipping event claimed again", extra=fields(
+                    attempt=attempt,
+                    **summarize(event)
+                ))
+                return
+
+            try:
+                self.process(event=event)
+            except RETRYABLE_ERRORS:
+                raise
+            except Exception:
+                log.warning("dropping event that failed", extra=fields(
+                    attempt=attempt,
+                    **summarize(event)
+                ))
+                db.session.remove()
+                QueuedEventModel.ack(queued_id)
+                raise
+
+            QueuedEventModel.ack(queued_id)
+        finally:
+            db.session.remove()
+
+    def renew(self):
+        """Renew the claims on events still waiting for a worker.
+
+        Events that have waited longer than `max_attempts` leases are
+        forgotten (the executor may have dropped them), and will be
+        replayed once their claim expires.
+
+        Returns the number of claims renewed.
+
+        """
+        cutoff = time.monotonic() - self.lease * self.max_attempts
+
+        with self._lock:
+            for queued_id, submitted in list(self._waiting.items()):
+                if submitted < cutoff:
+                    del self._waiting[queued_id]
+            waiting = list(self._waiting)
+
+        try:
+            QueuedEventModel.renew(waiting)
+        finally:
+            db.session.remove()
+
+        return len(waiting)
+
+    def replay(self):
+        """Resubmit stored events whose claim has expired.
+
+        Returns the number of events resubmitted.
+
+        """
+        replayed = 0
+
+        try:
+            expired = QueuedEventModel.list_expired(lease=self.lease)
+
+            for queued in expired:
+                if queued.attempts >= self.max_attempts:
+                    log.warning("discarding stored event", extra=fields(
+                        attempts=queued.attempts,
+                        **summarize(queued.event)
+                    ))
+                    QueuedEventModel.ack(queued.id)
+                    continue
+
+                attempt = queued.attempts + 1
+                event = queued.event
+
+                if QueuedEventModel.claim(queued.id, lease=self.lease):
+                    self._submit(queued.id, attempt, event)
+                    replayed += 1
+
+        finally:
+            db.session.remove()
+
+        if replayed:
+            log.info("replayed stored events", extra=fields(count=replayed))
+
+        return replayed
+
+    def _submit(self, queued_id, attempt, event, **kwargs):
+        with self._lock:
+            self._waiting[queued_id] = time.monotonic()
+
+        accepted = self._executor().submit_ordered(
+            ordering_key(event),
+            self.consume,
+            queued_id,
+            event,
+            attempt=attempt,
+            **kwargs
+        )
+
+        if not accepted:
+            with self._lock:
+                self._waiting.pop(queued_id, None)
+
+        return accepted
+
+    def _executor(self):
+        return self.executor if self.executor else get_executor()
+
+    def start(self):
+        """Start the sweeper, which first replays events left in storage.
+
+        Call this once the worker process is running (after any fork);
+        put() also calls it. Does nothing when durability is off.
+
+        """
+        if self._sweeper or not self.durable:
+            return
+
+        with self._lock:
+            if self._sweeper:
+                return
+
+            self._sweeper = threading.Thread(
+                target=self._sweep,
+                name="event-queue-sweeper",
+                daemon=True,
+            )
+            self._sweeper.start()
+
+    def _sweep(self):
+        while True:
+            try:
+                self.renew()
+                self.replay()
+            except Exception:
+                log.exception("event queue replay failed")
+
+            time.sleep(self.lease / 2)
+
+
+def make_event_queue(process):
+    """Return a DurableEventQueue configured from the app config."""
+    return DurableEventQueue(
+        process,
+        durable=app.config["EVENT_QUEUE_DURABLE"],
+        lease=app.config["EVENT_QUEUE_LEASE"],
+        max_attempts=app.config["EVENT_QUEUE_MAX_ATTEMPTS"],
+    )
@@ -0,0 +1,302 @@
+"""Define the EventExecutor class."""
+
+from collections import deque
+
+import heapq
+import threading
+
+from dungeonbot import app
+from dungeonbot.log import fields, get_logger
+
+
+log = get_logger(__name__)
+
+
+OVERFLOW_POLICIES = ("reject", "drop_oldest", "block")
+
+
+class EventExecutor(object):
+    """Run submitted jobs on a fixed number of worker threads.
+
+    Jobs may be submitted with an ordering key (e.g. a Slack channel).
+    Jobs sharing a key run one at a time, in the order they were
+    submitted; jobs with different keys run in parallel. Keys with
+    waiting jobs are served round-robin, one job per turn, so a busy
+    key can't starve the others. Jobs without a key are unordered.
+
+    At most `queue_size` jobs wait for a worker. When that many are
+    waiting, `overflow` decides what happens to a new job:
+
+        reject       the new job is refused and counted as rejected
+        drop_oldest  the oldest job of the longest-waiting key is
+                     discarded to make room
+        block        the caller waits up to `block_timeout` seconds for
+                     room, then the job is rejected
+
+    Worker threads are started on the first submit, so that forking
+    servers (gunicorn with `--preload`) don't inherit dead threads.
+
+    """
+
+    def __init__(self, workers=8, queue_size=256, overflow="reject",
+                 block_timeout=1.0):
+        """Initialize EventExecutor with its size and overflow policy."""
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(
+                "Unknown overflow policy '{}'; expected one of: {}".format(
+                    overflow,
+                    ", ".join(OVERFLOW_POLICIES),
+                )
+            )
+
+        self.workers = workers
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.active = 0
+        self.queued = 0
+
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._pending = {}
+        self._ready = deque()
+        self._busy = set()
+        self._threads = []
+        self._running = True
+
+    def submit(self, func, *args, **kwargs):
+        """Queue `func(*args, **kwargs)` to run on a worker thread.
+
+        Returns True if the job was accepted, False if it was rejected.
+
+        """
+        return self.submit_ordered(None, func, *args, **kwargs)
+
+    def submit_ordered(self, key, func, *args, **kwargs):
+        """Queue `func(*args, **kwargs)` behind earlier jobs with `key`.
+
+        A key of None means the job has no ordering constraint.
+        Returns True if the job was accepted, False if it was rejected.
+
+        """
+        if not self._running:
+            return False
+
+        self._start_workers()
+
+        if key is None:
+            key = object()
+
+        with self._changed:
+            if self.queued >= self.queue_size and not self._make_room():
+                self.rejected += 1
+                counters = self._counters()
+                rejected = True
+            else:
+                self._pending.setdefault(key, deque()).append(
+                    (func, args, kwargs)
+                )
+                if len(self._pending[key]) == 1 and key not in self._busy:
+                    self._ready.append(key)
+
+                self.queued += 1
+                self.submitted += 1
+                self._changed.notify_all()
+                rejected = False
+
+        if rejected:
+            log.warning("event executor full; job rejected", extra=fields(
+                **counters
+            ))
+
+        return not rejected
+
+    def shutdown(self, wait=True):
+        """Stop accepting jobs and let the workers finish the queue."""
+        with self._changed:
+            self._running = False
+            self._changed.notify_all()
+
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    @property
+    def counters(self):
+        """Return a snapshot of the executor's counters."""
+        with self._lock:
+            return self._counters()
+
+    def depths(self, top=None):
+        """Return the number of waiting jobs for each ordering key.
+
+        With `top`, only the `top` keys with the most waiting jobs are
+        returned.
+
+        """
+        with self._lock:
+            depths = {
+                key: len(jobs)
+                for key, jobs in self._pending.items()
+                if isinstance(key, str) and jobs
+            }
+
+        if top is not None and len(depths) > top:
+            depths = dict(heapq.nlargest(
+                top,
+                depths.items(),
+                key=lambda item: item[1],
+            ))
+
+        return depths
+
+    def _counters(self):
+        return {
+            "queued": self.queued,
+            "active": self.active,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "dropped": self.dropped,
+            "keys": len(self._pending),
+        }
+
+    def _make_room(self):
+        """Free a queue slot according to the overflow policy.
+
+        Called with the lock held. Returns True if there is room.
+
+        """
+        if self.overflow == "block":
+            return self._changed.wait_for(
+                lambda: self.queued < self.queue_size or not self._running,
+                timeout=self.block_timeout,
+            ) and self._running
+
+        if self.overflow == "drop_oldest" and self._ready:
+            key = self._ready[0]
+            self._pending[key].popleft()
+
+            if not self._pending[key]:
+                self._ready.popleft()
+                del self._pending[key]
+
+            self.queued -= 1
+            self.dropped += 1
+            return True
+
+        return False
+
+    def _start_workers(self):
+        if self._threads:
+            return
+
+        with self._lock:
+            if self._threads:
+                return
+
+            for idx in range(self.workers):
+                thread = threading.Thread(
+                    target=self._work,
+                    name="event-worker-{}".format(idx),
+                    daemon=True,
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def _next_job(self):
+        """Wait for a job whose key isn't running; None means stop."""
+        with self._changed:
+            self._changed.wait_for(lambda: self._ready or not self._running)
+
+            if not self._ready:
+                return None
+
+            key = self._ready.popleft()
+            func, args, kwargs = self._pending[key].popleft()
+
+            self._busy.add(key)
+            self.queued -= 1
+            self.active += 1
+            self._changed.notify_all()
+
+            return key, func, args, kwargs
+
+    def _finish_job(self, key, failed):
+        with self._changed:
+            self._busy.discard(key)
+            self.active -= 1
+
+            if failed:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+            if self._pending.get(key):
+                self._ready.append(key)
+                self._changed.notify_all()
+            else:
+                self._pending.pop(key, None)
+
+    def _work(self):
+        while True:
+            job = self._next_job()
+
+            if job is None:
+                return
+
+            key, func, args, kwargs = job
+            failed = False
+
+            try:
+                func(*args, **kwargs)
+            except Exception:
+                failed = True
+                log.exception("event job raised")
+            finally:
+                self._finish_job(key, failed)
+
+
+def ordering_key(event):
+    """Return the key that orders an event's processing.
+
+    Controlled by EVENT_ORDERING: "channel" orders events per channel,
+    "team_channel" per channel within a team, and "none" not at all.
+
+    """
+    ordering = app.config["EVENT_ORDERING"]
+
+    if ordering == "channel":
+        return event.get("channel")
+
+    if ordering == "team_channel" and event.get("channel"):
+        return "{}:{}".format(event.get("team_id"), event["channel"])
+
+    return None
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the process-wide EventExecutor, creating it if needed."""
+    global _executor
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = EventExecutor(
+                    workers=app.config["EVENT_WORKERS"],
+                    queue_size=app.config["EVENT_QUEUE_SIZE"],
+                    overflow=app.config["EVENT_OVERFLOW_POLICY"],
+                )
+
+    return _executor
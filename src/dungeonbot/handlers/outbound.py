@@ -0,0 +1,369 @@
+"""Define the OutboundQueue class."""
+
+from collections import deque
+
+import random
+import threading
+import time
+
+from slacker import Error as SlackError
+
+from dungeonbot.handlers.breaker import CircuitOpenError
+from dungeonbot.log import fields, get_logger
+from dungeonbot.metrics import current_command, timings
+
+
+log = get_logger(__name__)
+
+
+class TokenBucket(object):
+    """Allow `rate` events per second, with bursts of up to `burst`."""
+
+    def __init__(self, rate, burst):
+        """Initialize a full TokenBucket."""
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def delay(self, now):
+        """Return how many seconds until a token is available."""
+        self.tokens = min(
+            self.burst,
+            self.tokens + (now - self.updated) * self.rate,
+        )
+        self.updated = now
+
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.paused_until - now)
+
+    def take(self):
+        """Use up one token; call only after delay() returned 0."""
+        self.tokens -= 1
+
+    def pause(self, until):
+        """Hand out no tokens before `until` (a time.monotonic() value)."""
+        self.paused_until = max(self.paused_until, until)
+
+
+class OutboundMessage(object):
+    """A message waiting to be posted to Slack."""
+
+    __slots__ = (
+        "channel", "text", "team_id", "thread_ts",
+        "command", "enqueued", "not_before", "attempts",
+    )
+
+    def __init__(self, channel, text, team_id=None, thread_ts=None):
+        """Initialize OutboundMessage, stamped with the time it was queued."""
+        self.channel = channel
+        self.text = text
+        self.team_id = team_id
+        self.thread_ts = thread_ts
+        self.command = current_command()
+        self.enqueued = time.monotonic()
+        self.not_before = 0.0
+        self.attempts = 0
+
+
+class OutboundQueue(object):
+    """Post messages to Slack from background threads, within rate limits.
+
+    `put()` returns at once. Sender threads post each channel's messages
+    in the order they were queued, taking a token from the channel's
+    bucket and from the workspace's bucket before each post.
+
+    A 429 from Slack pauses the workspace for the Retry-After it asks
+    for, then the message is tried again. Other failures are retried
+    with jittered exponential backoff, up to `max_attempts` posts; Slack
+    API errors (`ok: false`) are not retried.
+
+    If `coalesce_window` is set, each message is held for that many
+    seconds so that replies arriving right behind it can join it: when
+    it is sent, the messages queued after it for the same channel and
+    thread are merged into it, one per line, in order, as long as the
+    merged text stays within `coalesce_max` characters.
+
+    """
+
+    def __init__(self, send, senders=2, channel_rate=1.0, channel_burst=3,
+                 team_rate=5.0, team_burst=20, max_size=1000,
+                 max_attempts=5, backoff=1.0, max_backoff=30.0,
+                 coalesce_window=0.0, coalesce_max=4000):
+        """Initialize OutboundQueue; `send(message)` does the posting."""
+        self.send = send
+        self.senders = senders
+        self.channel_rate = channel_rate
+        self.channel_burst = channel_burst
+        self.team_rate = team_rate
+        self.team_burst = team_burst
+        self.max_size = max_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.coalesce_window = coalesce_window
+        self.coalesce_max = coalesce_max
+
+        self.queued = 0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+        self._pending = {}
+        self._busy = set()
+        self._channel_buckets = {}
+        self._team_buckets = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._threads = []
+
+    def put(self, channel, text, team_id=None, thread_ts=None):
+        """Queue a message for posting; return False if the queue is full."""
+        self._start()
+
+        message = OutboundMessage(channel, text, team_id, thread_ts)
+        if self.coalesce_window:
+            message.not_before = message.enqueued + self.coalesce_window
+
+        with self._changed:
+            if self.queued >= self.max_size:
+                self.dropped += 1
+                full = True
+            else:
+                self._pending.setdefault(channel, deque()).append(message)
+                self.queued += 1
+                self._changed.notify_all()
+                full = False
+
+        if full:
+            log.warning("outbound queue full; message dropped", extra=fields(
+                channel=channel,
+            ))
+
+        return not full
+
+    def drain(self, timeout=5.0):
+        """Wait up to `timeout` seconds for queued messages to be sent."""
+        with self._changed:
+            return self._changed.wait_for(
+                lambda: not self.queued and not self._busy,
+                timeout=timeout,
+            )
+
+    @property
+    def counters(self):
+        """Return a snapshot of the queue's counters.
+
+        `oldest_age` is how long, in seconds, the oldest queued message
+        has been waiting.
+
+        """
+        now = time.monotonic()
+
+        with self._lock:
+            heads = [lane[0].enqueued for lane in self._pending.values()]
+
+            return {
+                "queued": self.queued,
+                "sent": self.sent,
+                "retried": self.retried,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                "coalesced": self.coalesced,
+                "oldest_age": round(now - min(heads), 3) if heads else 0,
+            }
+
+    def _start(self):
+        if self._threads:
+            return
+
+        with self._lock:
+            if self._threads:
+                return
+
+            for n in range(self.senders):
+                thread = threading.Thread(
+                    target=self._run,
+                    name="slack-sender-{}".format(n),
+                    daemon=True,
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def _bucket(self, buckets, key, rate, burst):
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = TokenBucket(rate, burst)
+        return bucket
+
+    def _next_message(self):
+        """Wait for a channel whose next message may be sent; pop it.
+
+        Must be called with the lock held.
+
+        """
+        while True:
+            now = time.monotonic()
+            soonest = None
+
+            for channel, lane in self._pending.items():
+                if channel in self._busy:
+                    continue
+
+                message = lane[0]
+                channel_bucket = self._bucket(
+                    self._channel_buckets, channel,
+                    self.channel_rate, self.channel_burst,
+                )
+                team_bucket = self._bucket(
+                    self._team_buckets, message.team_id,
+                    self.team_rate, self.team_burst,
+                )
+
+                wait = max(
+                    message.not_before - now,
+                    channel_bucket.delay(now),
+                    team_bucket.delay(now),
+                )
+
+                if wait <= 0:
+                    channel_bucket.take()
+                    team_bucket.take()
+                    message = self._take(lane)
+                    if not lane:
+                        del self._pending[channel]
+                    self._busy.add(channel)
+                    return message
+
+                if soonest is None or wait < soonest:
+                    soonest = wait
+
+            self._changed.wait(timeout=soonest)
+
+    def _take(self, lane):
+        """Pop the next message off a lane, merging followers into it.
+
+        Must be called with the lock held.
+
+        """
+        message = lane.popleft()
+
+        if not self.coalesce_window:
+            return message
+
+        texts = [message.text]
+        size = len(message.text)
+
+        while (
+            lane and
+            lane[0].thread_ts == message.thread_ts and
+            size + 1 + len(lane[0].text) <= self.coalesce_max
+        ):
+            follower = lane.popleft()
+            texts.append(follower.text)
+            size += 1 + len(follower.text)
+
+        if len(texts) > 1:
+            message.text = "\n".join(texts)
+            self.queued -= len(texts) - 1
+            self.coalesced += len(texts) - 1
+
+        return message
+
+    def _run(self):
+        while True:
+            with self._changed:
+                message = self._next_message()
+
+            message.attempts += 1
+            outcome = self._post(message)
+
+            with self._changed:
+                self._busy.discard(message.channel)
+
+                if outcome == "retry":
+                    self._pending.setdefault(
+                        message.channel,
+                        deque(),
+                    ).appendleft(message)
+                    self.retried += 1
+                else:
+                    self.queued -= 1
+                    if outcome == "sent":
+                        self.sent += 1
+                    else:
+                        self.failed += 1
+
+                self._changed.notify_all()
+
+    def _post(self, message):
+        """Send one message; return "sent", "retry" or "failed"."""
+        timings.observe(
+            "slack_queue",
+            message.command,
+            time.monotonic() - message.enqueued,
+        )
+
+        try:
+            self.send(message)
+            return "sent"
+
+        except SlackError as e:
+            log.warning("Slack rejected message", extra=fields(
+                channel=message.channel,
+                error=str(e),
+            ))
+            return "failed"
+
+        except Exception as e:
+            retry_after = _retry_after(e)
+
+            if message.attempts >= self.max_attempts:
+                log.warning("giving up on message", extra=fields(
+                    channel=message.channel,
+                    attempts=message.attempts,
+                    error=repr(e),
+                ))
+                return "failed"
+
+            now = time.monotonic()
+
+            if retry_after is not None:
+                with self._lock:
+                    self._bucket(
+                        self._team_buckets, message.team_id,
+                        self.team_rate, self.team_burst,
+                    ).pause(now + retry_after)
+                message.not_before = now + retry_after
+
+            else:
+                delay = min(
+                    self.max_backoff,
+                    self.backoff * 2 ** (message.attempts - 1),
+                )
+                message.not_before = now + delay * random.uniform(0.5, 1.5)
+
+            return "retry"
+
+
+def _retry_after(error):
+    """Return the Retry-After of a 429 error, in seconds, or None.
+
+    An open circuit is retried once it allows a trial call.
+
+    """
+    if isinstance(error, CircuitOpenError):
+        return max(error.retry_after, 1.0)
+
+    response = getattr(error, "response", None)
+
+    if response is None or getattr(response, "status_code", None) != 429:
+        return None
+
+    try:
+        return float(response.headers.get("Retry-After", 1))
+    except (TypeError, ValueError):
+        return 1.0
@@ -1,62 +1,188 @@
 """Define the SlackHandler class."""
 
+import atexit
 import os
+import threading
+
+from requests import Session
+from requests.adapters import HTTPAdapter
 from slacker import Slacker
-from auxiliaries.helpers import eprint
+
+from dungeonbot import app
+from dungeonbot.metrics import timings
+from dungeonbot.log import fields, get_logger
+from dungeonbot.handlers.breaker import BreakerBoard
+from dungeonbot.handlers.outbound import OutboundQueue
+from dungeonbot.handlers.users import UserDirectory
+
+
+SLACK_API_URL = "https://slack.com/api/"
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+# Calls to each Slack method fail fast after repeated failures.
+breakers = BreakerBoard(
+    thresholds=app.config["SLACK_BREAKER_THRESHOLDS"],
+    reset_timeout=app.config["SLACK_BREAKER_RESET"],
+)
+
+
+class _RebasedSession(Session):
+    """A requests Session that sends Slack API calls to `base_url`."""
+
+    def __init__(self, base_url):
+        """Initialize _RebasedSession with the API's base URL.
+
+        The URL may be given with or without a trailing slash.
+
+        """
+        super().__init__()
+        self.base_url = base_url.rstrip('/') + '/'
+
+    def request(self, method, url, *args, **kwargs):
+        """Rewrite Slack API URLs onto the base URL, then send."""
+        if url.startswith(SLACK_API_URL):
+            url = self.base_url + url[len(SLACK_API_URL):]
+
+        return super().request(method, url, *args, **kwargs)
+
+
+def get_slack_client():
+    """Return the process-wide Slack client.
+
+    The client is built on first use with a requests Session whose
+    connection pool keeps up to SLACK_POOL_SIZE connections to Slack
+    alive, so posts reuse warm TLS connections. Requests time out after
+    SLACK_CONNECT_TIMEOUT seconds connecting and SLACK_READ_TIMEOUT
+    seconds waiting for a response. Sessions aren't shared across a
+    fork: a child process builds its own client.
+
+    Calls go to SLACK_API_URL, which can point at a stand-in such as
+    auxiliaries/fake_slack.py instead of Slack.
+
+    """
+    global _client, _client_pid
+
+    if _client is not None and _client_pid == os.getpid():
+        return _client
+
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            pool_size = app.config["SLACK_POOL_SIZE"]
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=pool_size,
+            )
+
+            session = _RebasedSession(app.config["SLACK_API_URL"])
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+
+            _client = Slacker(
+                os.environ.get("BOT_ACCESS_TOKEN"),
+                session=session,
+                timeout=(
+                    app.config["SLACK_CONNECT_TIMEOUT"],
+                    app.config["SLACK_READ_TIMEOUT"],
+                ),
+            )
+            _client_pid = os.getpid()
+
+    return _client
 
 
 class SlackHandler(object):
     """Handle interacting with Slack."""
 
     def __init__(self):
-        """Initialize SlackHandler with a Slacker connection.
+        """Initialize SlackHandler with the shared Slack client.
+
+        Creating a SlackHandler is cheap: every instance in the process
+        talks to Slack through the same pooled client.
 
         `self.vocal` is set based upon the environment variable
         "PERMISSION_TO_SPEAK". If this is False, SlackHandler will
-        print to stdout instead of posting directly to Slack.
+        log the message instead of posting directly to Slack.
 
         """
-        self.slack = Slacker(os.environ.get("BOT_ACCESS_TOKEN"))
+        self.slack = get_slack_client()
         self.vocal = os.getenv("PERMISSION_TO_SPEAK")
-        self.eprint = eprint
+        self.log = get_logger(__name__)
 
     def make_post(self, event, message):
-        """Post a message to Slack."""
-        if self.vocal:
-            self.slack.chat.post_message(
+        """Post a message to Slack.
+
+        A reply to a message in a thread goes to that thread. With
+        SLACK_OUTBOUND_QUEUE on, the message is queued and posted by a
+        background thread within Slack's rate limits, and this returns
+        at once.
+
+        """
+        if self.vocal and app.config["SLACK_OUTBOUND_QUEUE"]:
+            outbound_queue.put(
                 event['channel'],
                 message,
-                as_user=True,
+                team_id=event.get('team_id'),
+                thread_ts=event.get('thread_ts'),
             )
 
-        else:
-            self.eprint(
-                "Message that would have been sent to Slack:\n\n{}\n".format(
-                    message
+        elif self.vocal:
+            kwargs = {"as_user": True}
+            if event.get('thread_ts'):
+                kwargs["thread_ts"] = event['thread_ts']
+
+            with timings.time("slack_post"):
+                breakers.call(
+                    "chat.postMessage",
+                    self.slack.chat.post_message,
+                    event['channel'],
+                    message,
+                    **kwargs
                 )
+
+        else:
+            self.log.info(
+                "message that would have been sent to Slack",
+                extra=fields(channel=event.get('channel'), message=message),
             )
 
-    def get_userid_from_name(self, username):
+    def get_userid_from_name(self, username, team_id=None):
         """Lookup Slack user ID given username."""
         if self.vocal:
-            return self.slack.users.get_user_id(username)
+            user_obj = user_directory.by_name(username, team_id)
+            return user_obj['id'] if user_obj else None
 
-    def get_username_from_id(self, user_id):
+    def get_username_from_id(self, user_id, team_id=None):
         """Lookup Slack username given user ID."""
         if self.vocal:
-            user_obj = self.get_user_obj_from_id(user_id)
+            user_obj = self.get_user_obj_from_id(user_id, team_id)
             return user_obj['name'] if user_obj else None
 
-    def get_user_obj_from_id(self, user_id):
-        """Fetch a user dict object from Slack."""
-        members_dict = self._fetch_users_list()
-        for entry in members_dict:
-            if user_id in entry['id']:
-                return entry
+    def get_users_from_ids(self, user_ids, team_id=None):
+        """Lookup many Slack user IDs at once.
 
-    def _fetch_users_list(self):
+        Returns {user_id: user dict} for those that are Slack users.
+
+        """
         if self.vocal:
-            return self.slack.users.list().body['members']
+            return user_directory.by_ids(user_ids, team_id)
+        return {}
+
+    def get_user_obj_from_id(self, user_id, team_id=None):
+        """Return a user dict object from the cached user directory."""
+        return user_directory.by_id(user_id, team_id)
+
+    def _fetch_users_list(self, team_id=None):
+        if self.vocal:
+            params = {"team_id": team_id} if team_id else {}
+            return breakers.call(
+                "users.list",
+                self.slack.users.get,
+                "users.list",
+                params=params,
+            ).body['members']
 
         else:
             return [{
@@ -94,3 +220,45 @@ class SlackHandler(object):
                 'tz_label': 'Pacific Daylight Time',
                 'tz_offset': -25200
             }]
+
+
+def _fetch_members(team_id):
+    return SlackHandler()._fetch_users_list(team_id)
+
+
+user_directory = UserDirectory(
+    fetch=_fetch_members,
+    ttl=app.config["SLACK_USERS_TTL"],
+)
+
+
+def _send_message(message):
+    kwargs = {"as_user": True}
+    if message.thread_ts:
+        kwargs["thread_ts"] = message.thread_ts
+
+    with timings.time("slack_post", message.command):
+        breakers.call(
+            "chat.postMessage",
+            get_slack_client().chat.post_message,
+            message.channel,
+            message.text,
+            **kwargs
+        )
+
+
+outbound_queue = OutboundQueue(
+    send=_send_message,
+    senders=app.config["SLACK_SENDERS"],
+    channel_rate=app.config["SLACK_CHANNEL_RATE"],
+    channel_burst=app.config["SLACK_CHANNEL_BURST"],
+    team_rate=app.config["SLACK_TEAM_RATE"],
+    team_burst=app.config["SLACK_TEAM_BURST"],
+    max_size=app.config["SLACK_OUTBOUND_MAX"],
+    max_attempts=app.config["SLACK_POST_ATTEMPTS"],
+    coalesce_window=app.config["SLACK_COALESCE_MS"] / 1000.0,
+    coalesce_max=app.config["SLACK_COALESCE_MAX"],
+)
+
+# Give queued messages a few seconds to go out when the process exits.
+atexit.register(outbound_queue.drain)
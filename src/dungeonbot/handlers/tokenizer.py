@@ -0,0 +1,80 @@
+"""Find the suffix-commands (karma operations) in a message."""
+
+from collections import namedtuple
+
+
+SUFFIXES = ("++", "--")
+
+# Closing delimiter -> opening delimiter, for multi-word subjects.
+DELIMITERS = {'"': '"', ")": "("}
+
+SuffixOp = namedtuple("SuffixOp", "subject suffix")
+
+
+def tokenize(text, suffixes=SUFFIXES):
+    """Return every suffix-command in `text` as a list of SuffixOps.
+
+    A suffix counts when it is attached to the text before it and is
+    followed by whitespace or the end of the message, so "x -- y" and
+    "a+-b" are left alone. Its subject is the text since the previous
+    suffix-command, with surrounding whitespace stripped, and must be
+    one of:
+
+    - a single word: "alice++ thanks!"
+    - a Slack mention ("<@U123>" or "<@U123|alice>"), which becomes the
+      mentioned user's ID: "thanks <@U123>++"
+    - several words in quotes or parentheses: 'the "slow dm"-- again'
+    - anything at all, for the suffix that ends the message:
+      "alice++ bob++ the dm--"
+
+    Any other suffix is ordinary text, so "I love c++ and rust" has no
+    suffix-commands. `suffixes` holds two-character suffixes and only
+    needs to support `in`.
+
+    The message is scanned once and each character is copied into at
+    most one subject, so the cost is linear in the message's length.
+
+    """
+    ops = []
+    start = 0
+    end = len(text) - 2
+    last = len(text.rstrip()) - 2
+    i = 1
+
+    while i <= end:
+        suffix = text[i:i + 2]
+
+        if (
+            suffix in suffixes and
+            not text[i - 1].isspace() and
+            (i == end or text[i + 2].isspace())
+        ):
+            subject = _subject(text[start:i], whole=(i == last))
+            if subject:
+                ops.append(SuffixOp(subject, suffix))
+            start = i + 2
+            i += 3
+
+        else:
+            i += 1
+
+    return ops
+
+
+def _subject(chunk, whole=False):
+    subject = chunk.strip()
+
+    if subject.endswith(">"):
+        mention = subject.rfind("<@")
+        if mention != -1:
+            return subject[mention + 2:-1].split("|", 1)[0]
+
+    if subject[-1:] in DELIMITERS:
+        opening = subject.rfind(DELIMITERS[subject[-1]], 0, -1)
+        if opening != -1:
+            return subject[opening + 1:-1].strip()
+
+    if whole or len(subject.split(None, 1)) == 1:
+        return subject
+
+    return ""
@@ -0,0 +1,224 @@
+"""Define the UserDirectory class."""
+
+from concurrent.futures import Future
+
+import threading
+import time
+
+from dungeonbot.log import fields, get_logger
+
+
+log = get_logger(__name__)
+
+# Slack events that carry an updated user object in event["user"].
+USER_EVENTS = ("user_change", "team_join")
+
+
+class _TeamIndex(object):
+    """One team's users, indexed by id and by name."""
+
+    def __init__(self, members):
+        self.by_id = {}
+        self.by_name = {}
+        self.loaded = time.monotonic()
+
+        for member in members:
+            self.add(member)
+
+    def add(self, member):
+        old = self.by_id.get(member['id'])
+        if old and self.by_name.get(old.get('name')) is old:
+            del self.by_name[old['name']]
+
+        self.by_id[member['id']] = member
+        if member.get('name'):
+            self.by_name[member['name']] = member
+
+
+class UserDirectory(object):
+    """Cache of Slack users, kept separately for each team.
+
+    A team's users are fetched with `fetch(team_id)` (one `users.list`
+    call) the first time the team is looked up, and indexed by id and by
+    name; concurrent first lookups for a team wait for that one fetch.
+    Once the index is older than `ttl` seconds it is refreshed on a
+    background thread while lookups keep using the old one.
+
+    Lookups that miss don't touch Slack: most strings that get karma are
+    not usernames. New and changed users arrive through `update()`, fed
+    by the `team_join` and `user_change` events.
+
+    """
+
+    def __init__(self, fetch, ttl=300):
+        """Initialize an empty UserDirectory."""
+        self.fetch = fetch
+        self.ttl = ttl
+
+        self.fetches = 0
+        self.hits = 0
+        self.misses = 0
+
+        self._teams = {}
+        self._loading = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def by_id(self, user_id, team_id=None):
+        """Return the user dict for a Slack user ID, or None."""
+        return self._lookup(self._index(team_id).by_id, user_id)
+
+    def by_name(self, name, team_id=None):
+        """Return the user dict for a Slack username, or None."""
+        return self._lookup(self._index(team_id).by_name, name)
+
+    def by_ids(self, user_ids, team_id=None):
+        """Return {user_id: user dict} for those IDs that are Slack users.
+
+        The whole list is looked up in one index, so the team's users
+        are fetched at most once however long it is.
+
+        """
+        table = self._index(team_id).by_id
+        found = {
+            user_id: table[user_id]
+            for user_id in user_ids
+            if user_id in table
+        }
+
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(set(user_ids)) - len(found)
+
+        return found
+
+    def update(self, member, team_id=None):
+        """Add or replace one user, e.g. from a `user_change` event.
+
+        Teams that haven't been loaded yet are left alone; they'll get
+        the user with their first fetch.
+
+        """
+        team_id = team_id or member.get('team_id')
+
+        with self._lock:
+            index = self._teams.get(team_id)
+            if index is not None:
+                index.add(member)
+
+    def invalidate(self, team_id=None):
+        """Forget a team's users, so the next lookup fetches them."""
+        with self._lock:
+            self._teams.pop(team_id, None)
+
+    def clear(self):
+        """Forget every team's users."""
+        with self._lock:
+            self._teams.clear()
+
+    @property
+    def counters(self):
+        """Return a snapshot of the directory's counters."""
+        with self._lock:
+            return {
+                "teams": len(self._teams),
+                "fetches": self.fetches,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _lookup(self, table, key):
+        member = table.get(key)
+
+        with self._lock:
+            if member is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return member
+
+    def _index(self, team_id):
+        index = self._teams.get(team_id)
+
+        if index is None:
+            try:
+                return self._load_once(team_id)
+            except Exception as e:
+                # Slack is unreachable: answer "unknown user" for now and
+                # try again on the next lookup.
+                log.warning("user directory load failed", extra=fields(
+                    team_id=team_id,
+                    error=repr(e),
+                ))
+                return _TeamIndex([])
+
+        if time.monotonic() - index.loaded > self.ttl:
+            self._refresh_in_background(team_id)
+
+        return index
+
+    def _load_once(self, team_id):
+        # The first lookup for a team fetches it; lookups arriving while
+        # that fetch runs wait for its result (or its error).
+        with self._lock:
+            index = self._teams.get(team_id)
+            if index is not None:
+                return index
+
+            loading = self._loading.get(team_id)
+            first = loading is None
+            if first:
+                loading = self._loading[team_id] = Future()
+
+        if first:
+            try:
+                loading.set_result(self._load(team_id))
+            except Exception as e:
+                loading.set_exception(e)
+            finally:
+                with self._lock:
+                    del self._loading[team_id]
+
+        return loading.result()
+
+    def _load(self, team_id):
+        members = self.fetch(team_id) or []
+        index = _TeamIndex(members)
+
+        with self._lock:
+            self.fetches += 1
+            self._teams[team_id] = index
+
+        return index
+
+    def _refresh_in_background(self, team_id):
+        with self._lock:
+            if team_id in self._refreshing:
+                return
+            self._refreshing.add(team_id)
+
+        threading.Thread(
+            target=self._refresh,
+            args=(team_id,),
+            name="user-directory-refresh",
+            daemon=True,
+        ).start()
+
+    def _refresh(self, team_id):
+        try:
+            self._load(team_id)
+        except Exception:
+            log.exception(
+                "user directory refresh failed",
+                extra=fields(team_id=team_id),
+            )
+
+            # Keep serving the old index; try again after another ttl.
+            with self._lock:
+                index = self._teams.get(team_id)
+                if index is not None:
+                    index.loaded = time.monotonic()
+        finally:
+            with self._lock:
+                self._refreshing.discard(team_id)
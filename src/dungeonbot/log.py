@@ -0,0 +1,230 @@
+"""Configure structured, non-blocking logging.
+
+Loggers under "dungeonbot" hand their records to an in-memory queue;
+a background thread formats them as logfmt lines (`key=value ...`) and
+writes them to stderr. Logging never waits on I/O: if the queue is
+full, the record is dropped and counted.
+
+Usage:
+
+    from dungeonbot.log import get_logger, fields, summarize
+
+    log = get_logger(__name__)
+    log.info("event accepted", extra=fields(**summarize(event)))
+
+"""
+
+import atexit
+import copy
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+
+from dungeonbot import app
+
+
+REDACTED = "[redacted]"
+
+# Payload keys whose values never reach the log.
+REDACTED_KEYS = frozenset([
+    "token",
+    "authed_users",
+    "api_app_id",
+    "challenge",
+])
+
+# Event keys worth logging; everything else is left out by summarize().
+EVENT_FIELDS = (
+    "type",
+    "subtype",
+    "team_id",
+    "channel",
+    "user",
+    "ts",
+    "text",
+)
+
+
+def redact(value):
+    """Return a copy of `value` with secret-looking keys masked."""
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if key in REDACTED_KEYS else redact(item)
+            for key, item in value.items()
+        }
+
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+
+    return value
+
+
+def summarize(event):
+    """Return the loggable subset of a Slack event."""
+    return {key: event[key] for key in EVENT_FIELDS if key in event}
+
+
+def fields(**kwargs):
+    """Build the `extra` argument that attaches fields to a log record."""
+    return {"fields": kwargs}
+
+
+class LogfmtFormatter(logging.Formatter):
+    """Format records as one line of `key=value` pairs.
+
+    Values longer than `max_field` characters are truncated; values
+    containing spaces, quotes or `=` are quoted.
+
+    """
+
+    def __init__(self, max_field=200):
+        """Initialize LogfmtFormatter with its field length limit."""
+        super().__init__()
+        self.max_field = max_field
+
+    def format(self, record):
+        """Return the formatted line for a record."""
+        parts = [
+            "ts=" + self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level=" + record.levelname.lower(),
+            "logger=" + record.name,
+            "msg=" + self._value(record.getMessage()),
+        ]
+
+        for key, value in getattr(record, "fields", {}).items():
+            parts.append("{}={}".format(
+                key,
+                REDACTED if key in REDACTED_KEYS else self._value(value),
+            ))
+
+        if record.exc_info:
+            parts.append("exc=" + self._value(
+                self.formatException(record.exc_info)
+            ))
+
+        return " ".join(parts)
+
+    def _value(self, value):
+        if isinstance(value, (dict, list, tuple)):
+            value = json.dumps(redact(value), default=str, sort_keys=True)
+
+        text = str(value)
+
+        if len(text) > self.max_field:
+            text = text[:self.max_field] + "..."
+
+        if not text or any(c in text for c in ' ="\n\t'):
+            text = json.dumps(text)
+
+        return text
+
+
+class QueueingHandler(logging.handlers.QueueHandler):
+    """A QueueHandler that drops records when its queue is full.
+
+    Records go onto a bounded queue with a non-blocking put; a
+    QueueListener hands them to `target` on a background thread. The
+    listener is started on first use in each process, so forking
+    servers get a working writer in every child.
+
+    """
+
+    def __init__(self, target, maxsize=10000):
+        """Initialize QueueingHandler with the handler doing the writing."""
+        super().__init__(queue.Queue(maxsize=maxsize))
+        self.target = target
+        self.dropped = 0
+
+        self._pid = None
+        self._listener = None
+        self._start_lock = threading.Lock()
+
+    def emit(self, record):
+        """Queue a record, starting the listener in a new process."""
+        if self._pid != os.getpid():
+            self._start()
+
+        super().emit(record)
+
+    def prepare(self, record):
+        """Render the message, while its arguments are as the caller left them.
+
+        The target formats everything else, exceptions included.
+
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        """Put a record on the queue, or drop it if the queue is full."""
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        """Write out queued records and stop the listener."""
+        if self._listener and self._pid == os.getpid():
+            try:
+                self._listener.stop()
+            except queue.Full:
+                pass
+            self._listener = None
+
+        super().close()
+
+    def _start(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+
+            self._listener = logging.handlers.QueueListener(
+                self.queue,
+                self.target,
+            )
+            self._listener.start()
+            self._pid = os.getpid()
+
+
+class Sampler(object):
+    """Let through one call in every `every`."""
+
+    def __init__(self, every):
+        """Initialize Sampler; `every` <= 1 lets everything through."""
+        self.every = max(1, every)
+        self._calls = itertools.count()
+
+    def __call__(self):
+        """Return True if this call is sampled."""
+        return next(self._calls) % self.every == 0
+
+
+def get_logger(name):
+    """Return a logger that writes through the dungeonbot handler."""
+    return logging.getLogger(name)
+
+
+def _configure():
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(LogfmtFormatter(max_field=app.config["LOG_MAX_FIELD"]))
+
+    handler = QueueingHandler(stream, maxsize=app.config["LOG_QUEUE_SIZE"])
+
+    root = logging.getLogger("dungeonbot")
+    root.addHandler(handler)
+    root.setLevel(app.config["LOG_LEVEL"])
+    root.propagate = False
+
+    atexit.register(handler.close)
+
+    return handler
+
+
+handler = _configure()
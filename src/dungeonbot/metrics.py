@@ -0,0 +1,260 @@
+"""Record how long each stage of handling an event takes.
+
+Durations go into fixed-bucket histograms keyed by stage and command,
+and are rendered in the Prometheus text format by the `/metrics` route.
+Recording one duration is a bisect and a few integer additions under a
+lock.
+
+Each server process keeps its own numbers; scrape every process.
+
+"""
+
+from bisect import bisect_left
+
+import re
+import threading
+import time
+
+from sqlalchemy import event as sa_event
+from sqlalchemy.engine import Engine
+
+from dungeonbot.handlers.tokenizer import tokenize
+
+
+BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+MAX_COMMANDS = 64
+
+_VALID_COMMAND = re.compile(r"^[a-z_]{1,32}$")
+
+
+class Histogram(object):
+    """Counts of observed values falling in each of a fixed set of buckets."""
+
+    def __init__(self, buckets=BUCKETS):
+        """Initialize an empty Histogram with the given bucket bounds."""
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """Record one value."""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """Return (upper bound, cumulative count) pairs, ending with +Inf."""
+        total = 0
+        pairs = []
+
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            pairs.append((bound, total))
+
+        return pairs
+
+
+class StageTimings(object):
+    """Histograms of stage durations, one per (stage, command) pair.
+
+    At most `max_commands` distinct command labels are kept; any further
+    commands are recorded as "other".
+
+    """
+
+    def __init__(self, buckets=BUCKETS, max_commands=MAX_COMMANDS):
+        """Initialize StageTimings with no observations."""
+        self.buckets = buckets
+        self.max_commands = max_commands
+
+        self._histograms = {}
+        self._commands = set()
+        self._lock = threading.Lock()
+
+    def observe(self, stage, command, seconds):
+        """Record that `stage` took `seconds` for `command`."""
+        histogram = self._histograms.get((stage, command))
+
+        if histogram is None:
+            histogram = self._histogram(stage, command)
+
+        with self._lock:
+            histogram.observe(seconds)
+
+    def time(self, stage, command=None):
+        """Return a context manager timing the enclosed block as `stage`.
+
+        If `command` is None, the command being handled by the current
+        thread is used (see `set_command()`).
+
+        """
+        return _Timer(self, stage, command)
+
+    def _histogram(self, stage, command):
+        """Create (or find) the histogram for a new (stage, command)."""
+        with self._lock:
+            if command not in self._commands:
+                if len(self._commands) >= self.max_commands:
+                    command = "other"
+                self._commands.add(command)
+
+            key = (stage, command)
+            if key not in self._histograms:
+                self._histograms[key] = Histogram(self.buckets)
+
+            return self._histograms[key]
+
+    def clear(self):
+        """Forget every observation."""
+        with self._lock:
+            self._histograms.clear()
+            self._commands.clear()
+
+    def render(self):
+        """Return the histograms in the Prometheus text format."""
+        lines = [
+            "# HELP dungeonbot_stage_seconds "
+            "Time spent in each stage of handling an event.",
+            "# TYPE dungeonbot_stage_seconds histogram",
+        ]
+
+        with self._lock:
+            items = sorted(
+                (key, histogram.cumulative(), histogram.sum, histogram.count)
+                for key, histogram in self._histograms.items()
+            )
+
+        for (stage, command), cumulative, total, count in items:
+            labels = 'stage="{}",command="{}"'.format(stage, command)
+
+            for bound, running in cumulative:
+                lines.append(
+                    'dungeonbot_stage_seconds_bucket{{{},le="{}"}} {}'.format(
+                        labels,
+                        "+Inf" if bound == float("inf") else repr(bound),
+                        running,
+                    )
+                )
+
+            lines.append("dungeonbot_stage_seconds_sum{{{}}} {!r}".format(
+                labels,
+                total,
+            ))
+            lines.append("dungeonbot_stage_seconds_count{{{}}} {}".format(
+                labels,
+                count,
+            ))
+
+        return "\n".join(lines) + "\n"
+
+
+class _Timer(object):
+    """Context manager behind StageTimings.time()."""
+
+    __slots__ = ("timings", "stage", "command", "started")
+
+    def __init__(self, timings, stage, command):
+        self.timings = timings
+        self.stage = stage
+        self.command = command
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.timings.observe(
+            self.stage,
+            self.command if self.command else current_command(),
+            time.perf_counter() - self.started,
+        )
+
+
+def command_label(event):
+    """Return the command name used to label an event's timings.
+
+    Bang commands are labelled by name, messages holding suffix commands
+    ("++" and "--") become "karma_modify", and anything else is
+    "none". Names that can't be a command become "invalid".
+
+    """
+    text = event.get("text") or ""
+
+    if text[:1] == "!":
+        command = text[1:].split(" ", 1)[0]
+        return command if _VALID_COMMAND.match(command) else "invalid"
+
+    if tokenize(text):
+        return "karma_modify"
+
+    return "none"
+
+
+_current = threading.local()
+
+
+def set_command(command):
+    """Set the command label for timings taken on this thread."""
+    _current.command = command
+
+
+def current_command():
+    """Return the command label for timings taken on this thread."""
+    return getattr(_current, "command", "none")
+
+
+def render_counters(prefix, counters):
+    """Render a dict of counters as Prometheus gauges named `prefix_key`.
+
+    Nested dicts become a label named after the key, e.g. the admission
+    controller's {"shed": {"low": 3}} renders as
+    `prefix_shed{shed="low"} 3`.
+
+    """
+    lines = []
+
+    for key, value in sorted(counters.items()):
+        name = "{}_{}".format(prefix, key)
+        lines.append("# TYPE {} gauge".format(name))
+
+        if isinstance(value, dict):
+            for label, count in sorted(value.items()):
+                lines.append('{}{{{}="{}"}} {}'.format(
+                    name,
+                    key,
+                    label,
+                    count,
+                ))
+        else:
+            lines.append("{} {}".format(name, value))
+
+    return "\n".join(lines) + "\n"
+
+
+timings = StageTimings()
+
+
+@sa_event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@sa_event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    started = conn.info["query_started"].pop()
+    timings.observe("db", current_command(), time.perf_counter() - started)
+
+
+@sa_event.listens_for(Engine, "handle_error")
+def _handle_error(context):
+    started = context.connection.info.get("query_started") \
+        if context.connection is not None else None
+    if started:
+        started.pop()
@@ -0,0 +1,168 @@
+"""Define database models for the durable event queue."""
+
+from dungeonbot.models import db
+
+from datetime import datetime, timedelta
+
+import json
+
+
+class QueuedEventModel(db.Model):
+    """Model for Slack events that have been accepted but not yet handled.
+
+    An event is written here by the `/` route before Slack gets its 200,
+    and deleted once a worker has finished handling it. `claimed` holds
+    the time a process last took responsibility for the event; the
+    process renews it while the event waits for a worker and when a
+    worker picks it up, so a claim older than the lease means that
+    process died, and the event may be claimed again. `attempts` counts
+    the claims, and identifies the current one.
+
+    """
+
+    __table_args__ = {"extend_existing": True}
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True,
+    )
+    created = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+    )
+    claimed = db.Column(db.DateTime)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    payload = db.Column(db.Text, nullable=False)
+
+    @classmethod
+    def push(cls, event, session=None):
+        """Store a new event, already claimed by the calling process.
+
+        Returns the event's id. Its claim is attempt 1.
+
+        """
+        if session is None:
+            session = db.session
+        instance = cls(
+            payload=json.dumps(event),
+            claimed=datetime.utcnow(),
+            attempts=1,
+        )
+        try:
+            session.add(instance)
+            # Take the id from the INSERT; reading it after the commit
+            # would cost a SELECT.
+            session.flush()
+            queued_id = instance.id
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        return queued_id
+
+    @classmethod
+    def claim(cls, queued_id, lease=60, session=None):
+        """Claim an event whose previous claim has expired.
+
+        The claim is a single conditional UPDATE, so when several
+        processes race for the same event only one of them wins.
+
+        Returns True if the claim succeeded.
+
+        """
+        if session is None:
+            session = db.session
+        now = datetime.utcnow()
+        claimed = (
+            session.query(cls).
+            filter(cls.id == queued_id).
+            filter(
+                (cls.claimed == None) |  # noqa: E711
+                (cls.claimed < now - timedelta(seconds=lease))
+            ).
+            update(
+                {"claimed": now, "attempts": cls.attempts + 1},
+                synchronize_session=False,
+            )
+        )
+        session.commit()
+        return claimed == 1
+
+    @classmethod
+    def take(cls, queued_id, attempt, session=None):
+        """Renew the claim on an event as a worker starts handling it.
+
+        Fails if the event was claimed again (or deleted) since claim
+        number `attempt`, which means another copy of it has been
+        submitted. Returns True if the caller should handle the event.
+
+        """
+        if session is None:
+            session = db.session
+        taken = (
+            session.query(cls).
+            filter(cls.id == queued_id, cls.attempts == attempt).
+            update(
+                {"claimed": datetime.utcnow()},
+                synchronize_session=False,
+            )
+        )
+        session.commit()
+        return taken == 1
+
+    @classmethod
+    def renew(cls, queued_ids, session=None):
+        """Renew the claims on events that are still waiting for a worker."""
+        if session is None:
+            session = db.session
+        if not queued_ids:
+            return
+        (
+            session.query(cls).
+            filter(cls.id.in_(list(queued_ids))).
+            update(
+                {"claimed": datetime.utcnow()},
+                synchronize_session=False,
+            )
+        )
+        session.commit()
+
+    @classmethod
+    def ack(cls, queued_id, session=None):
+        """Delete an event once it has been handled."""
+        if session is None:
+            session = db.session
+        session.query(cls).filter_by(id=queued_id).delete()
+        session.commit()
+
+    @classmethod
+    def list_expired(cls, lease=60, how_many=100, session=None):
+        """Retrieve the n oldest events whose claim has expired."""
+        if session is None:
+            session = db.session
+        cutoff = datetime.utcnow() - timedelta(seconds=lease)
+        return (
+            session.query(cls).
+            filter((cls.claimed == None) | (cls.claimed < cutoff)).  # noqa
+            order_by(cls.id).
+            limit(how_many).
+            all()
+        )
+
+    @property
+    def event(self):
+        """Return the stored event as a dict."""
+        return json.loads(self.payload)
+
+    def __repr__(self):
+        """Define shell representation of queued events."""
+        return (
+            "<dungeonbot.models.event_queue.QueuedEventModel(" +
+            "id={}, attempts={}, claimed={}, created={})>"
+        ).format(
+            self.id,
+            self.attempts,
+            self.claimed,
+            self.created,
+        )
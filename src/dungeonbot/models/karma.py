@@ -1,8 +1,10 @@
 """Define database models for the Karma plugin."""
 
 from dungeonbot.models import db
+from dungeonbot.models.karma_ledger import KarmaEventModel
 
 from datetime import datetime
+from sqlalchemy import bindparam, text
 from sqlalchemy.orm.exc import NoResultFound
 
 
@@ -30,10 +32,10 @@ class KarmaModel(db.Model):
         nullable=False,
         default=datetime.utcnow,
     )
-    string_id = db.Column(db.String(256))
+    string_id = db.Column(db.String(256), unique=True, index=True)
     upvotes = db.Column(db.Integer)
     downvotes = db.Column(db.Integer)
-    karma = db.Column(db.Integer)
+    karma = db.Column(db.Integer, index=True)
 
     @classmethod
     def new(cls, string_id=None, upvotes=0, downvotes=0, session=None):
@@ -63,6 +65,85 @@ class KarmaModel(db.Model):
         session.commit()
         return instance
 
+    @classmethod
+    def _upsert_statement(cls):
+        """Return the statement that adds votes to an entry, creating it.
+
+        ON CONFLICT ... RETURNING works on PostgreSQL 9.5+ and SQLite
+        3.35+, and relies on the unique index on string_id. The vote
+        columns are nullable, so a missing count is taken as 0.
+
+        """
+        return text("""
+            INSERT INTO {table} (created, string_id, upvotes, downvotes, karma)
+            VALUES (:created, :string_id, :upvotes, :downvotes, :karma)
+            ON CONFLICT (string_id) DO UPDATE SET
+                upvotes = COALESCE({table}.upvotes, 0) + excluded.upvotes,
+                downvotes =
+                    COALESCE({table}.downvotes, 0) + excluded.downvotes,
+                karma = COALESCE({table}.karma, 0) + excluded.karma
+            RETURNING id, string_id, upvotes, downvotes, karma
+        """.format(table=cls.__table__.name)).bindparams(
+            bindparam("created", type_=db.DateTime),
+        )
+
+    @classmethod
+    def _upsert(cls, session, string_id, upvotes, downvotes):
+        return session.execute(cls._upsert_statement(), {
+            "created": datetime.utcnow(),
+            "string_id": string_id,
+            "upvotes": upvotes,
+            "downvotes": downvotes,
+            "karma": upvotes - downvotes,
+        }).first()
+
+    @classmethod
+    def upsert(cls, string_id=None, upvotes=0, downvotes=0, votes=None,
+               session=None):
+        """Add votes to a karma entry, creating it if it doesn't exist.
+
+        This is a single atomic statement, so concurrent changes to the
+        same entry are never lost. `votes` (see KarmaEventModel.vote())
+        are written to the karma ledger in the same transaction. Returns
+        the entry's new (id, string_id, upvotes, downvotes, karma) row.
+
+        """
+        if session is None:
+            session = db.session
+        try:
+            row = cls._upsert(session, string_id, upvotes, downvotes)
+            KarmaEventModel.record(votes, session)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        return row
+
+    @classmethod
+    def apply_deltas(cls, deltas, votes=None, session=None):
+        """Apply many karma changes in a single transaction.
+
+        `deltas` maps string_ids to (upvotes, downvotes) to be added.
+        Each entry is upserted with one statement; entries are changed
+        in string_id order so concurrent batches can't deadlock. `votes`
+        are written to the karma ledger in the same transaction. Returns
+        the entries' new rows.
+
+        """
+        if session is None:
+            session = db.session
+        try:
+            rows = [
+                cls._upsert(session, string_id, *deltas[string_id])
+                for string_id in sorted(deltas)
+            ]
+            KarmaEventModel.record(votes, session)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        return rows
+
     @classmethod
     def get_by_name(cls, string_id=None, session=None):
         """Retrieve a karma entry by its string_id."""
@@ -74,6 +155,19 @@ class KarmaModel(db.Model):
             instance = None
         return instance
 
+    @classmethod
+    def list_by_names(cls, string_ids, session=None):
+        """Retrieve the karma entries for several string_ids at once."""
+        if session is None:
+            session = db.session
+        if not string_ids:
+            return []
+        return (
+            session.query(cls).
+            filter(cls.string_id.in_(list(string_ids))).
+            all()
+        )
+
     @classmethod
     def get_by_id(cls, model_id=None, session=None):
         """Retrieve a karma entry by its primary key id."""
@@ -101,23 +195,33 @@ class KarmaModel(db.Model):
     def list_highest(cls, how_many=5, session=None):
         """Retrieve the n highest-karma karma entries.
 
-        n defaults to 5 if not specified.
+        n defaults to 5 if not specified. Ties go to the older entry.
 
         """
         if session is None:
             session = db.session
-        return session.query(cls).order_by('karma desc').limit(how_many).all()
+        return (
+            session.query(cls).
+            order_by(cls.karma.desc(), cls.id).
+            limit(how_many).
+            all()
+        )
 
     @classmethod
     def list_lowest(cls, how_many=5, session=None):
         """Retrieve the n lowest-karma karma entries.
 
-        n defaults to 5 if not specified.
+        n defaults to 5 if not specified. Ties go to the older entry.
 
         """
         if session is None:
             session = db.session
-        return session.query(cls).order_by('karma').limit(how_many).all()
+        return (
+            session.query(cls).
+            order_by(cls.karma, cls.id).
+            limit(how_many).
+            all()
+        )
 
     @property
     def json(self):
@@ -0,0 +1,239 @@
+"""Define database models for the karma ledger and its rollups."""
+
+from dungeonbot.models import db
+
+from datetime import datetime, timedelta
+from sqlalchemy import bindparam, func, text
+
+
+HOUR = "hour"
+DAY = "day"
+
+# Leaderboard windows: which rollup to read and how far back to go.
+WINDOWS = {
+    "hour": (HOUR, timedelta(hours=1)),
+    "day": (HOUR, timedelta(days=1)),
+    "week": (DAY, timedelta(days=7)),
+    "month": (DAY, timedelta(days=30)),
+    "year": (DAY, timedelta(days=365)),
+}
+
+
+def period_start(period, when):
+    """Return the start of the hour or day that `when` falls in."""
+    if period == HOUR:
+        return when.replace(minute=0, second=0, microsecond=0)
+    return when.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class KarmaEventModel(db.Model):
+    """Model for the karma ledger: one append-only row per vote.
+
+    Records who gave karma to what, where and when, so votes can be
+    audited and counted over time windows. Nothing reads the ledger to
+    answer leaderboards; every vote is also added to KarmaRollupModel
+    in the same transaction, and old ledger rows are deleted by
+    compact().
+
+    """
+
+    __table_args__ = {"extend_existing": True}
+
+    id = db.Column(db.Integer, primary_key=True)
+    created = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        index=True,
+    )
+    string_id = db.Column(db.String(256), nullable=False, index=True)
+    giver = db.Column(db.String(64), index=True)
+    channel = db.Column(db.String(64))
+    delta = db.Column(db.Integer, nullable=False)
+
+    @classmethod
+    def vote(cls, string_id, delta, giver=None, channel=None, created=None):
+        """Return a ledger row (as a dict) for one vote."""
+        return {
+            "created": created or datetime.utcnow(),
+            "string_id": string_id,
+            "giver": giver,
+            "channel": channel,
+            "delta": delta,
+        }
+
+    @classmethod
+    def record(cls, votes, session=None):
+        """Append votes to the ledger and add them to the rollups.
+
+        Doesn't commit: call this inside the transaction that changes
+        the karma totals, so the ledger and the totals agree.
+
+        """
+        if session is None:
+            session = db.session
+        if not votes:
+            return
+
+        session.execute(cls.__table__.insert(), votes)
+        KarmaRollupModel.add(votes, session)
+
+    @classmethod
+    def list_for(cls, string_id=None, giver=None, how_many=50, session=None):
+        """Retrieve the most recent votes for a subject and/or giver."""
+        if session is None:
+            session = db.session
+        query = session.query(cls)
+        if string_id is not None:
+            query = query.filter_by(string_id=string_id)
+        if giver is not None:
+            query = query.filter_by(giver=giver)
+        return query.order_by(cls.id.desc()).limit(how_many).all()
+
+    @classmethod
+    def compact(cls, ledger_days=30, hourly_days=14, session=None):
+        """Delete raw votes and hourly rollups that are no longer needed.
+
+        Votes are already counted in the rollups, so ledger rows older
+        than `ledger_days` only matter for auditing; hourly rollups older
+        than `hourly_days` are covered by the daily ones. Returns the
+        number of (ledger rows, hourly rollups) deleted.
+
+        """
+        if session is None:
+            session = db.session
+        now = datetime.utcnow()
+        try:
+            events = (
+                session.query(cls).
+                filter(cls.created < now - timedelta(days=ledger_days)).
+                delete(synchronize_session=False)
+            )
+            hourly = (
+                session.query(KarmaRollupModel).
+                filter(
+                    KarmaRollupModel.period == HOUR,
+                    KarmaRollupModel.start <
+                    period_start(HOUR, now - timedelta(days=hourly_days)),
+                ).
+                delete(synchronize_session=False)
+            )
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        return events, hourly
+
+    def __repr__(self):
+        """Define shell representation of karma ledger rows."""
+        return (
+            "<dungeonbot.models.karma_ledger.KarmaEventModel(" +
+            "string_id={}, delta={}, giver={}, channel={}" +
+            ") [id: {}, created: {}]>"
+        ).format(
+            self.string_id,
+            self.delta,
+            self.giver,
+            self.channel,
+            self.id,
+            self.created,
+        )
+
+
+class KarmaRollupModel(db.Model):
+    """Model for votes per karma subject per hour and per day."""
+
+    __table_args__ = (
+        db.UniqueConstraint("period", "start", "string_id"),
+        {"extend_existing": True},
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(8), nullable=False)
+    start = db.Column(db.DateTime, nullable=False)
+    string_id = db.Column(db.String(256), nullable=False)
+    upvotes = db.Column(db.Integer, nullable=False)
+    downvotes = db.Column(db.Integer, nullable=False)
+    karma = db.Column(db.Integer, nullable=False)
+
+    @classmethod
+    def _add_statement(cls):
+        return text("""
+            INSERT INTO {table}
+                (period, start, string_id, upvotes, downvotes, karma)
+            VALUES
+                (:period, :start, :string_id, :upvotes, :downvotes, :karma)
+            ON CONFLICT (period, start, string_id) DO UPDATE SET
+                upvotes = {table}.upvotes + excluded.upvotes,
+                downvotes = {table}.downvotes + excluded.downvotes,
+                karma = {table}.karma + excluded.karma
+        """.format(table=cls.__table__.name)).bindparams(
+            bindparam("start", type_=db.DateTime),
+        )
+
+    @classmethod
+    def add(cls, votes, session=None):
+        """Add ledger votes to the hourly and daily rollups.
+
+        Doesn't commit; see KarmaEventModel.record().
+
+        """
+        if session is None:
+            session = db.session
+
+        totals = {}
+        for vote in votes:
+            for period in (HOUR, DAY):
+                key = (
+                    period,
+                    period_start(period, vote["created"]),
+                    vote["string_id"],
+                )
+                total = totals.setdefault(key, [0, 0])
+                total[0 if vote["delta"] > 0 else 1] += abs(vote["delta"])
+
+        session.execute(cls._add_statement(), [
+            {
+                "period": period,
+                "start": start,
+                "string_id": string_id,
+                "upvotes": upvotes,
+                "downvotes": downvotes,
+                "karma": upvotes - downvotes,
+            }
+            for (period, start, string_id), (upvotes, downvotes)
+            in sorted(totals.items())
+        ])
+
+    @classmethod
+    def list_window(cls, window, how_many=5, lowest=False, session=None):
+        """Retrieve the n highest (or lowest) karma subjects in a window.
+
+        `window` is one of WINDOWS. Returns rows with string_id,
+        upvotes, downvotes and karma summed over the window.
+
+        Rollups are whole hours or days, so the window starts at the
+        beginning of the bucket it would otherwise start partway
+        through: "hour" at 10:20 covers 9:00 to now, and "week" covers
+        the last seven days plus the rest of the day before them.
+
+        """
+        if session is None:
+            session = db.session
+        period, length = WINDOWS[window]
+        since = period_start(period, datetime.utcnow() - length)
+        karma = func.sum(cls.karma)
+
+        return (
+            session.query(
+                cls.string_id,
+                func.sum(cls.upvotes).label("upvotes"),
+                func.sum(cls.downvotes).label("downvotes"),
+                karma.label("karma"),
+            ).
+            filter(cls.period == period, cls.start >= since).
+            group_by(cls.string_id).
+            order_by(karma if lowest else karma.desc(), cls.string_id).
+            limit(how_many).
+            all()
+        )
@@ -0,0 +1,55 @@
+"""Define database models for Slack event deduplication."""
+
+from dungeonbot.models import db
+
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+
+
+class SeenEventModel(db.Model):
+    """Model for the ids of Slack events that have already been accepted.
+
+    Lets several server processes agree on whether an event is a retry.
+
+    """
+
+    __table_args__ = {"extend_existing": True}
+
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.String(256), unique=True, nullable=False)
+    created = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    @classmethod
+    def mark(cls, event_id, session=None):
+        """Record an event id.
+
+        Returns False if the id was already recorded.
+
+        """
+        if session is None:
+            session = db.session
+        try:
+            session.add(cls(event_id=event_id))
+            session.commit()
+            return True
+        except IntegrityError:
+            session.rollback()
+            return False
+
+    @classmethod
+    def unmark(cls, event_id, session=None):
+        """Forget an event id, so the event can be accepted again."""
+        if session is None:
+            session = db.session
+        session.query(cls).filter_by(event_id=event_id).delete()
+        session.commit()
+
+    @classmethod
+    def prune(cls, ttl=600, session=None):
+        """Delete event ids older than `ttl` seconds."""
+        if session is None:
+            session = db.session
+        cutoff = datetime.utcnow() - timedelta(seconds=ttl)
+        deleted = session.query(cls).filter(cls.created < cutoff).delete()
+        session.commit()
+        return deleted
@@ -1,8 +1,10 @@
 from dungeonbot.plugins.primordials import BangCommandPlugin
+from dungeonbot.plugins.registry import register_command
 from dungeonbot.handlers.slack import SlackHandler
 from dungeonbot.models.attribute import AttrModel
 
 
+@register_command('attr')
 class AttrPlugin(BangCommandPlugin):
     """Misc. key/value storage for player stats."""
 
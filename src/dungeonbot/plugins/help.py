@@ -1,42 +1,31 @@
 """Define logic for the Help plugin."""
 
 from dungeonbot.plugins.primordials import BangCommandPlugin
-from dungeonbot.plugins.karma import (
-    KarmaPlugin,
-    KarmaNewestPlugin,
-    KarmaTopPlugin,
-    KarmaBottomPlugin,
-)
-from dungeonbot.plugins.roll import RollPlugin
-from dungeonbot.plugins.quest import QuestPlugin
-from dungeonbot.plugins.highlights import HighlightPlugin
-from dungeonbot.plugins.attribute import AttrPlugin
+from dungeonbot.plugins.registry import commands, register_command
 
 
+@register_command('help')
 class HelpPlugin(BangCommandPlugin):
-    """Switchboard for `!help` commands."""
-
-    help_topics = {
-        'karma': KarmaPlugin,
-        'karma_newest': KarmaNewestPlugin,
-        'karma_top': KarmaTopPlugin,
-        'karma_bottom': KarmaBottomPlugin,
-        'roll': RollPlugin,
-        'quest': QuestPlugin,
-        'log': HighlightPlugin,
-        'attr': AttrPlugin,
-    }
-
-    help_text = """```
-available help topics:
-    help
-    karma
-    roll
-    quest
-    attr
-
-Try `!help [topic]` for information on a specific topic.
-```"""
+    """Switchboard for `!help` commands.
+
+    Every registered bang command is a help topic.
+
+    """
+
+    help_topics = commands
+
+    @property
+    def help_text(self):
+        """List every registered bang command as a help topic."""
+        return '\n'.join(
+            ["```", "available help topics:"] +
+            ["    " + topic for topic in sorted(self.help_topics)] +
+            [
+                "",
+                "Try `!help [topic]` for information on a specific topic.",
+                "```",
+            ]
+        )
 
     def run(self):
         """Run the `help()` function of the appropriate plugin."""
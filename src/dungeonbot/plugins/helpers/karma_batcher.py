@@ -0,0 +1,270 @@
+"""Define the KarmaBatcher class."""
+
+import atexit
+import os
+import signal
+import threading
+
+from dungeonbot import app
+from dungeonbot.log import fields, get_logger
+from dungeonbot.models import db
+from dungeonbot.models.karma import KarmaModel
+from dungeonbot.plugins.helpers.leaderboard import leaderboard
+
+
+log = get_logger(__name__)
+
+
+class KarmaBatch(object):
+    """Karma changes that will be committed together."""
+
+    def __init__(self):
+        """Initialize an empty batch."""
+        self.deltas = {}
+        self.votes = []
+        self.size = 0
+        self.error = None
+        self.done = threading.Event()
+
+    def wait(self):
+        """Block until the batch is committed; re-raise if it failed."""
+        self.done.wait()
+        if self.error:
+            raise self.error
+
+
+class KarmaBatcher(object):
+    """Group karma changes that arrive close together into one commit.
+
+    The first change after a quiet spell opens a batch; every change
+    that arrives in the next `window` seconds joins it, and the whole
+    batch is then applied by KarmaModel.apply_deltas(): one transaction,
+    one statement per karma subject. A batch is flushed early once it
+    holds `max_batch` changes.
+
+    With `write_behind`, callers don't wait for the commit: changes only
+    live in memory until the next flush, `pending()` tells readers what
+    hasn't been written yet, and a batch that fails to commit is put
+    back to be retried with the next one.
+
+    """
+
+    def __init__(self, window=0.05, max_batch=200, write_behind=False):
+        """Initialize KarmaBatcher with its window (in seconds)."""
+        self.window = window
+        self.max_batch = max_batch
+        self.write_behind = write_behind
+
+        self.batches = 0
+        self.changes = 0
+        self.failures = 0
+
+        self._batch = KarmaBatch()
+        self._flushing = {}
+        self._flush_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._thread = None
+
+    def add(self, string_id, upvotes=0, downvotes=0, vote=None):
+        """Add a karma change to the open batch and return the batch.
+
+        `vote` is the change's karma ledger row, if it has one. Call
+        `wait()` on the returned batch to block until it is committed.
+
+        """
+        return self.add_many(
+            {string_id: (upvotes, downvotes)},
+            [vote] if vote is not None else (),
+        )
+
+    def add_many(self, deltas, votes=()):
+        """Add several karma changes to the same batch and return it.
+
+        `deltas` maps string_ids to (upvotes, downvotes) and `votes` are
+        their karma ledger rows; they are committed together.
+
+        """
+        self._start()
+
+        with self._changed:
+            batch = self._batch
+            for string_id, (upvotes, downvotes) in deltas.items():
+                delta = batch.deltas.setdefault(string_id, [0, 0])
+                delta[0] += upvotes
+                delta[1] += downvotes
+            batch.votes.extend(votes)
+            changes = sum(max(up + down, 1) for up, down in deltas.values())
+            batch.size += changes
+            self.changes += changes
+            self._changed.notify_all()
+
+        return batch
+
+    def pending(self, string_id):
+        """Return the (upvotes, downvotes) not yet committed for a subject."""
+        with self._lock:
+            return self._pending(string_id)
+
+    def read_with_pending(self, read, string_ids):
+        """Call `read()` and return its result with the pending changes.
+
+        Returns (what `read` returned, {string_id: (upvotes, downvotes)}
+        not yet committed). Flushes are held off while `read` runs, so
+        every change is counted exactly once: either in what `read`
+        finds in the database, or as pending.
+
+        """
+        with self._flush_lock:
+            stored = read()
+            with self._lock:
+                return stored, {
+                    string_id: self._pending(string_id)
+                    for string_id in string_ids
+                }
+
+    def flush(self):
+        """Commit the open batch now.
+
+        Flushes (from the batching thread, SIGTERM and atexit) run one at
+        a time. The batch stops being pending the moment it's committed.
+
+        """
+        rows = None
+
+        with self._flush_lock:
+            with self._changed:
+                batch, self._batch = self._batch, KarmaBatch()
+                if batch.deltas:
+                    self._flushing = batch.deltas
+
+            if batch.deltas:
+                try:
+                    rows = KarmaModel.apply_deltas(
+                        batch.deltas,
+                        votes=batch.votes,
+                    )
+                except Exception as e:
+                    batch.error = e
+                finally:
+                    db.session.remove()
+
+                with self._changed:
+                    self._flushing = {}
+                    self.batches += 1
+
+                    if batch.error:
+                        self.failures += 1
+                        if self.write_behind:
+                            self._requeue(batch)
+
+        if batch.error and self.write_behind:
+            log.error("karma flush failed; retrying", extra=fields(
+                subjects=len(batch.deltas),
+                error=batch.error,
+            ))
+
+        if rows:
+            try:
+                leaderboard.update(rows)
+            except Exception:
+                log.exception("karma leaderboard update failed")
+
+        batch.done.set()
+
+    @property
+    def counters(self):
+        """Return a snapshot of the batcher's counters."""
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "changes": self.changes,
+                "failures": self.failures,
+                "pending": self._batch.size,
+            }
+
+    def _pending(self, string_id):
+        upvotes, downvotes = 0, 0
+        for deltas in (self._flushing, self._batch.deltas):
+            delta = deltas.get(string_id)
+            if delta:
+                upvotes += delta[0]
+                downvotes += delta[1]
+        return upvotes, downvotes
+
+    def _requeue(self, batch):
+        for string_id, (upvotes, downvotes) in batch.deltas.items():
+            delta = self._batch.deltas.setdefault(string_id, [0, 0])
+            delta[0] += upvotes
+            delta[1] += downvotes
+        self._batch.votes.extend(batch.votes)
+        self._batch.size += batch.size
+
+    def _start(self):
+        if self._thread:
+            return
+
+        with self._lock:
+            if self._thread:
+                return
+
+            self._thread = threading.Thread(
+                target=self._run,
+                name="karma-batcher",
+                daemon=True,
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: self._batch.size > 0)
+                self._changed.wait_for(
+                    lambda: self._batch.size >= self.max_batch,
+                    timeout=self.window,
+                )
+
+            self.flush()
+
+
+def flush_on_sigterm():
+    """Flush unwritten karma before the process is terminated.
+
+    Chains to whatever SIGTERM handler was installed before. Signal
+    handlers can only be installed from the main thread; elsewhere this
+    does nothing and relies on the atexit flush.
+
+    """
+    if threading.current_thread() is not threading.main_thread():
+        log.warning("not flushing karma on SIGTERM: not the main thread")
+        return
+
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def handler(signum, frame):
+        # The interrupted code may hold the batcher's lock; flush from
+        # another thread so this can't deadlock, just time out.
+        flusher = threading.Thread(target=karma_batcher.flush)
+        flusher.start()
+        flusher.join(timeout=10)
+
+        if callable(previous):
+            previous(signum, frame)
+        elif previous != signal.SIG_IGN:
+            signal.signal(signum, signal.SIG_DFL)
+            os.kill(os.getpid(), signum)
+
+    signal.signal(signal.SIGTERM, handler)
+
+
+karma_batcher = KarmaBatcher(
+    window=(
+        app.config["KARMA_FLUSH_MS"] if app.config["KARMA_WRITE_BEHIND"]
+        else app.config["KARMA_BATCH_WINDOW_MS"]
+    ) / 1000.0,
+    max_batch=app.config["KARMA_BATCH_MAX"],
+    write_behind=app.config["KARMA_WRITE_BEHIND"],
+)
+
+# Don't lose changes that are still in memory when the process exits.
+atexit.register(karma_batcher.flush)
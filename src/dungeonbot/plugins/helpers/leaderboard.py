@@ -0,0 +1,185 @@
+"""Define the KarmaLeaderboard class."""
+
+from collections import namedtuple
+
+from dungeonbot import app
+from dungeonbot.models.karma import KarmaModel
+
+import bisect
+import threading
+import time
+
+
+Entry = namedtuple("Entry", "id string_id upvotes downvotes karma")
+
+
+class _Board(object):
+    """The best `capacity` karma entries by one ordering, best first.
+
+    Whatever isn't kept ranks below the worst kept entry, so an entry
+    that changes is kept only while it still ranks at least that high;
+    one that drops below it is forgotten and the board shrinks.
+
+    """
+
+    def __init__(self, sign):
+        self.sign = sign
+        self.entries = {}
+        self.order = []
+        self.complete = False
+
+    def key(self, entry):
+        # Rank by karma (descending for sign 1), then by age.
+        return (-self.sign * entry.karma, entry.id, entry.string_id)
+
+    def load(self, entries, capacity):
+        self.entries = {entry.string_id: entry for entry in entries}
+        self.order = sorted(self.key(entry) for entry in entries)
+        self.complete = len(entries) < capacity
+
+    def update(self, entry, capacity):
+        old = self.entries.get(entry.string_id)
+        floor = self.order[-1] if self.order else None
+
+        if old is not None:
+            del self.order[bisect.bisect_left(self.order, self.key(old))]
+            del self.entries[entry.string_id]
+
+        key = self.key(entry)
+
+        if self.complete or (floor is not None and key <= floor):
+            bisect.insort(self.order, key)
+            self.entries[entry.string_id] = entry
+
+            if len(self.order) > capacity:
+                del self.entries[self.order.pop()[2]]
+                self.complete = False
+
+    def best(self, how_many):
+        return [self.entries[key[2]] for key in self.order[:how_many]]
+
+
+class KarmaLeaderboard(object):
+    """The highest- and lowest-karma entries, kept in memory.
+
+    Each side is loaded from the database (by the karma index) on first
+    use and then kept up to date from every karma write, so reading the
+    top or bottom n entries costs O(n). A side is reloaded once it has
+    shrunk below what's asked for, and every `ttl` seconds to pick up
+    changes made by other processes (0 never reloads). Requests for more
+    than `capacity` entries go to the database.
+
+    """
+
+    def __init__(self, capacity=100, ttl=60):
+        """Initialize an empty KarmaLeaderboard."""
+        self.capacity = capacity
+        self.ttl = ttl
+
+        self.hits = 0
+        self.loads = 0
+
+        self._loaders = {
+            1: KarmaModel.list_highest,
+            -1: KarmaModel.list_lowest,
+        }
+        self._boards = {}
+        self._loaded_at = {}
+        self._lock = threading.Lock()
+
+    def highest(self, how_many=5):
+        """Return the `how_many` highest-karma entries."""
+        return self._best(1, how_many)
+
+    def lowest(self, how_many=5):
+        """Return the `how_many` lowest-karma entries."""
+        return self._best(-1, how_many)
+
+    def update(self, rows):
+        """Apply committed karma rows to the leaderboard.
+
+        Rows are anything with id, string_id, upvotes, downvotes and
+        karma; NULL counts as 0. A row older than what's already held
+        (fewer votes in total) is ignored, so late updates can't roll an
+        entry back.
+
+        """
+        with self._lock:
+            for row in rows:
+                entry = _entry(row)
+
+                for board in self._boards.values():
+                    held = board.entries.get(entry.string_id)
+                    if held and (
+                        held.upvotes + held.downvotes >
+                        entry.upvotes + entry.downvotes
+                    ):
+                        continue
+                    board.update(entry, self.capacity)
+
+    def clear(self):
+        """Forget everything; the next read reloads from the database."""
+        with self._lock:
+            self._boards.clear()
+            self._loaded_at.clear()
+
+    @property
+    def counters(self):
+        """Return a snapshot of the leaderboard's counters."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "loads": self.loads,
+                "held": sum(len(b.order) for b in self._boards.values()),
+            }
+
+    def _best(self, sign, how_many):
+        if how_many > self.capacity:
+            return [
+                _entry(model)
+                for model in self._loaders[sign](how_many=how_many)
+            ]
+
+        with self._lock:
+            board = self._boards.get(sign)
+
+            if (
+                board is None or
+                (self.ttl and
+                 time.monotonic() - self._loaded_at[sign] > self.ttl) or
+                (len(board.order) < how_many and not board.complete)
+            ):
+                board = _Board(sign)
+                board.load(
+                    [
+                        _entry(model)
+                        for model in self._loaders[sign](
+                            how_many=self.capacity
+                        )
+                    ],
+                    self.capacity,
+                )
+                self._boards[sign] = board
+                self._loaded_at[sign] = time.monotonic()
+                self.loads += 1
+            else:
+                self.hits += 1
+
+            return board.best(how_many)
+
+
+def _entry(model):
+    # The vote and karma columns are nullable; count NULL as 0.
+    return Entry(
+        model.id,
+        model.string_id,
+        model.upvotes or 0,
+        model.downvotes or 0,
+        model.karma or 0,
+    )
+
+
+leaderboard = KarmaLeaderboard(
+    capacity=app.config["KARMA_LEADERBOARD_SIZE"],
+    ttl=app.config["KARMA_LEADERBOARD_TTL"],
+)
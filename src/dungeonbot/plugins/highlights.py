@@ -1,9 +1,11 @@
 from dungeonbot.plugins.primordials import BangCommandPlugin
+from dungeonbot.plugins.registry import register_command
 from dungeonbot.handlers.slack import SlackHandler
 from dungeonbot.models.highlights import HighlightModel
 import calendar
 
 
+@register_command('log')
 class HighlightPlugin(BangCommandPlugin):
     """Plugin for campaign Highlights."""
 
@@ -1,11 +1,25 @@
 """Define logic for the Karma plugin."""
 
+from collections import OrderedDict
+
+from dungeonbot import app
 from dungeonbot.plugins.primordials import (
     BangCommandPlugin,
     SuffixCommandPlugin,
 )
+from dungeonbot.plugins.registry import (
+    register_command,
+    register_suffix,
+)
 from dungeonbot.handlers.slack import SlackHandler
 from dungeonbot.models.karma import KarmaModel
+from dungeonbot.models.karma_ledger import (
+    WINDOWS,
+    KarmaEventModel,
+    KarmaRollupModel,
+)
+from dungeonbot.plugins.helpers.karma_batcher import karma_batcher
+from dungeonbot.plugins.helpers.leaderboard import leaderboard
 
 
 class KarmaAssistant(object):
@@ -25,12 +39,13 @@ class KarmaAssistant(object):
         Returns a Slack user ID or None.
 
         """
-        user_id = self.bot.get_userid_from_name(possible_username)
+        team_id = event.get('team_id')
+        user_id = self.bot.get_userid_from_name(possible_username, team_id)
 
         # If we get an id back, let's make sure it's from the same team as
         # the team from which the event originated.
         if user_id:
-            user_obj = self.bot.get_user_obj_from_id(user_id)
+            user_obj = self.bot.get_user_obj_from_id(user_id, team_id)
             user_team = user_obj['team_id']
             if user_team == event['team_id']:
                 return user_id
@@ -41,59 +56,140 @@ class KarmaAssistant(object):
         Returns a Slack username or None.
 
         """
-        username = self.bot.get_username_from_id(possible_userid)
+        team_id = event.get('team_id')
+        username = self.bot.get_username_from_id(possible_userid, team_id)
 
         # If we get a username back, let's make sure it's from the same team as
         # the team from which the event originated.
         if username:
-            user_obj = self.bot.get_user_obj_from_id(possible_userid)
+            user_obj = self.bot.get_user_obj_from_id(possible_userid, team_id)
             user_team = user_obj['team_id']
             if user_team == event['team_id']:
                 return username
 
+    def usernames_for(self, event, string_ids):
+        """Map those string_ids that are Slack user IDs to usernames.
+
+        Resolves the whole list with one user directory lookup. As with
+        check_if_correlates_to_username(), only users from the event's
+        team count.
+
+        """
+        users = self.bot.get_users_from_ids(string_ids, event.get('team_id'))
+
+        return {
+            user_id: user['name']
+            for user_id, user in users.items()
+            if user['team_id'] == event['team_id']
+        }
+
 
+@register_suffix('++', '--')
 class KarmaModifyPlugin(SuffixCommandPlugin):
     """Add positive or negative karma to a string."""
 
-    def __init__(self):
-        """Set up KarmaAssistant."""
+    def __init__(self, event=None, arg_string=None, suffix=None, ops=None):
+        """Initialize plugin and set up KarmaAssistant."""
+        super().__init__(event, arg_string, suffix, ops)
         self.ka = KarmaAssistant()
 
     def run(self):
         """Run the plugin.
 
+        self.ops: every (string, suffix) in the message, in order; if
+            not given, the single change in self.arg_string and
+            self.suffix
         self.arg_string: just a string that's getting karma
         self.suffix: '++' or '--'
 
-        Should check if the arg_string is a string that correlates to a
-        userid. If so, attribute the karma to that userid. Otherwise,
-        just use the string.
+        Should check if each string correlates to a userid. If so,
+        attribute the karma to that userid. Otherwise, just use the
+        string.
 
-        """
-        possible_userid = self.ka.check_if_correlates_to_userid(
-            self.event,
-            self.arg_string
-        )
+        All of the message's changes are committed in one transaction,
+        then a single reply lists the new karma of every subject, in
+        the order they were mentioned.
 
-        karma_subject = possible_userid if possible_userid else self.arg_string
+        If KARMA_BATCH_WINDOW_MS is set, the changes are committed
+        together with any others arriving in the same window. With
+        KARMA_WRITE_BEHIND, they are only recorded in memory and written
+        by the next periodic flush.
 
-        upvotes = 1 if self.suffix == '++' else 0
-        downvotes = 1 if self.suffix == '--' else 0
+        """
+        ops = self.ops or [(self.arg_string, self.suffix)]
+        deltas = OrderedDict()
+        votes = []
 
-        if KarmaModel.get_by_name(karma_subject):
-            KarmaModel.modify(
-                string_id=karma_subject,
-                upvotes=upvotes,
-                downvotes=downvotes,
+        for arg_string, suffix in ops:
+            possible_userid = self.ka.check_if_correlates_to_userid(
+                self.event,
+                arg_string
             )
+
+            karma_subject = possible_userid if possible_userid else arg_string
+
+            upvotes = 1 if suffix == '++' else 0
+            downvotes = 1 if suffix == '--' else 0
+
+            delta = deltas.setdefault(karma_subject, [0, 0])
+            delta[0] += upvotes
+            delta[1] += downvotes
+
+            if app.config["KARMA_LEDGER"]:
+                votes.append(KarmaEventModel.vote(
+                    karma_subject,
+                    upvotes - downvotes,
+                    giver=self.event.get('user'),
+                    channel=self.event.get('channel'),
+                ))
+
+        if app.config["KARMA_WRITE_BEHIND"] or app.config[
+            "KARMA_BATCH_WINDOW_MS"
+        ]:
+            batch = karma_batcher.add_many(deltas, votes)
+            if not app.config["KARMA_WRITE_BEHIND"]:
+                batch.wait()
+
+            entries, pending = karma_batcher.read_with_pending(
+                lambda: KarmaModel.list_by_names(deltas),
+                deltas,
+            )
+            stored = {
+                entry.string_id: (entry.upvotes, entry.downvotes)
+                for entry in entries
+            }
+
+            totals = {}
+            for karma_subject in deltas:
+                upvotes, downvotes = stored.get(karma_subject, (0, 0))
+                totals[karma_subject] = (
+                    upvotes + pending[karma_subject][0],
+                    downvotes + pending[karma_subject][1],
+                )
+
         else:
-            KarmaModel.new(
-                string_id=karma_subject,
-                upvotes=upvotes,
-                downvotes=downvotes,
+            rows = KarmaModel.apply_deltas(deltas, votes=votes)
+            leaderboard.update(rows)
+
+            totals = {
+                row.string_id: (row.upvotes, row.downvotes) for row in rows
+            }
+
+        usernames = self.ka.usernames_for(self.event, list(deltas))
+
+        message = "\n".join(
+            "*{}* has *{}* karma _({} ++, {} --)_".format(
+                usernames.get(karma_subject, karma_subject),
+                totals[karma_subject][0] - totals[karma_subject][1],
+                totals[karma_subject][0],
+                totals[karma_subject][1],
             )
+            for karma_subject in deltas
+        )
+        self.bot.make_post(self.event, message)
 
 
+@register_command('karma')
 class KarmaPlugin(BangCommandPlugin):
     """Post karma status for a given string."""
 
@@ -108,6 +204,12 @@ class KarmaPlugin(BangCommandPlugin):
         "    For any string (whitespace-inclusive), you can award positive or",
         "    negative karma by appending '++' or '--' to the end.",
         "",
+        "    One message can give karma to several strings at once; each",
+        "    '++' or '--' ends a string, and must be followed by a space or",
+        "    the end of the message. Before the end of the message, a",
+        "    string of several words needs quotes or parentheses.",
+        "    dungeonbot replies with the new karma of each string.",
+        "",
         "    Calling the '!karma' command with a specific string as an",
         "    argument will display the karma for the string, if it exists.",
         "",
@@ -129,6 +231,8 @@ class KarmaPlugin(BangCommandPlugin):
         "examples:",
         "    dungeonbot++",
         "    slack teams without dungeonbot--",
+        "    dungeonbot++ <@U123>++ slack teams without dungeonbot--",
+        "    thanks (slack teams)++ and dungeonbot++ for the help",
         "    !karma dungeonbot",
         "    !karma slack teams without dungeonbot",
         "```",
@@ -153,6 +257,9 @@ class KarmaPlugin(BangCommandPlugin):
         username. If so, use the username in the message posted to Slack.
         Otherwise, use the record's string_id.
 
+        Karma not yet written by the batcher is added to what's stored,
+        so the answer is exact in write-behind mode.
+
         """
         possible_userid = self.ka.check_if_correlates_to_userid(
             self.event,
@@ -161,10 +268,19 @@ class KarmaPlugin(BangCommandPlugin):
 
         karma_subject = possible_userid if possible_userid else self.arg_string
 
-        karma_entry = KarmaModel.get_by_name(karma_subject)
+        karma_entry, pending = karma_batcher.read_with_pending(
+            lambda: KarmaModel.get_by_name(karma_subject),
+            [karma_subject],
+        )
+        upvotes, downvotes = pending[karma_subject]
 
-        if karma_entry:
-            entry_name = karma_entry.string_id
+        if karma_entry or upvotes or downvotes:
+            if karma_entry:
+                entry_name = karma_entry.string_id
+                upvotes += karma_entry.upvotes
+                downvotes += karma_entry.downvotes
+            else:
+                entry_name = karma_subject
 
             possible_username = self.ka.check_if_correlates_to_username(
                 self.event,
@@ -178,9 +294,9 @@ class KarmaPlugin(BangCommandPlugin):
 
             message = "*{}* has *{}* karma _({} ++, {} --)_".format(
                 subject_name,
-                karma_entry.karma,
-                karma_entry.upvotes,
-                karma_entry.downvotes,
+                upvotes - downvotes,
+                upvotes,
+                downvotes,
             )
 
             self.bot.make_post(self.event, message)
@@ -190,6 +306,7 @@ class KarmaPlugin(BangCommandPlugin):
             self.bot.make_post(self.event, message)
 
 
+@register_command('karma_newest')
 class KarmaNewestPlugin(BangCommandPlugin):
     """Post recently-created karma entries."""
 
@@ -242,13 +359,10 @@ examples:
 
         karma_objects = KarmaModel.list_newest(how_many=how_many)
 
-        for item in karma_objects:
-            possible_username = self.ka.check_if_correlates_to_username(
-                self.event,
-                item.string_id,
-            )
-            if possible_username:
-                item.string_id = possible_username
+        usernames = self.ka.usernames_for(
+            self.event,
+            [item.string_id for item in karma_objects],
+        )
 
         message = "*The {} most-recently created karma subjects:*\n\n".format(
             how_many,
@@ -256,7 +370,7 @@ examples:
 
         for item in karma_objects:
             message += "*{}* with *{}* karma _({} ++, {} --)_\n".format(
-                item.string_id,
+                usernames.get(item.string_id, item.string_id),
                 item.karma,
                 item.upvotes,
                 item.downvotes,
@@ -265,6 +379,7 @@ examples:
         self.bot.make_post(self.event, message)
 
 
+@register_command('karma_top')
 class KarmaTopPlugin(BangCommandPlugin):
     """Post highest-karma karma entries."""
 
@@ -277,13 +392,18 @@ description:
     otherwise provided.
 
 usage:
-    !karma_top [INT]
+    !karma_top [INT] [hour|day|week|month|year]
+
+    With a time window, only karma given in that window counts. The
+    window is rounded back to the start of the hour (for hour and day)
+    or of the day (for week, month and year).
 
     (<PARAMS> are required; [PARAMS] are optional)
 
 examples:
     !karma_top
     !karma_top 10
+    !karma_top 10 week
 ```"""
 
     def __init__(self, event, arg_string):
@@ -296,10 +416,15 @@ examples:
     def run(self):
         """Run the plugin."""
         how_many = 5
+        window = None
+        args = str(self.arg_string or "").split()
 
-        if self.arg_string:
+        if args and args[-1].lower() in WINDOWS:
+            window = args.pop().lower()
+
+        if args:
             try:
-                how_many = int(self.arg_string)
+                how_many = int(" ".join(args))
             except ValueError:
                 self.bot.make_post(
                     self.event,
@@ -317,23 +442,28 @@ examples:
                 )
                 return
 
-        karma_objects = KarmaModel.list_highest(how_many=how_many)
-
-        for item in karma_objects:
-            possible_username = self.ka.check_if_correlates_to_username(
-                self.event,
-                item.string_id,
+        if window:
+            karma_objects = KarmaRollupModel.list_window(
+                window,
+                how_many,
+                lowest=False,
             )
-            if possible_username:
-                item.string_id = possible_username
+        else:
+            karma_objects = leaderboard.highest(how_many)
 
-        message = "*The {} highest-rated karma subjects:*\n\n".format(
+        usernames = self.ka.usernames_for(
+            self.event,
+            [item.string_id for item in karma_objects],
+        )
+
+        message = "*The {} highest-rated karma subjects{}:*\n\n".format(
             how_many,
+            " in the last {}".format(window) if window else "",
         )
 
         for item in karma_objects:
             message += "*{}* with *{}* karma _({} ++, {} --)_\n".format(
-                item.string_id,
+                usernames.get(item.string_id, item.string_id),
                 item.karma,
                 item.upvotes,
                 item.downvotes,
@@ -342,6 +472,7 @@ examples:
         self.bot.make_post(self.event, message)
 
 
+@register_command('karma_bottom')
 class KarmaBottomPlugin(BangCommandPlugin):
     """Post lowest-karma karma entries."""
 
@@ -354,13 +485,18 @@ description:
     otherwise provided.
 
 usage:
-    !karma_bottom [INT]
+    !karma_bottom [INT] [hour|day|week|month|year]
+
+    With a time window, only karma given in that window counts. The
+    window is rounded back to the start of the hour (for hour and day)
+    or of the day (for week, month and year).
 
     (<PARAMS> are required; [PARAMS] are optional)
 
 examples:
     !karma_bottom
     !karma_bottom 10
+    !karma_bottom 10 week
 ```"""
 
     def __init__(self, event, arg_string):
@@ -373,10 +509,15 @@ examples:
     def run(self):
         """Run the plugin."""
         how_many = 5
+        window = None
+        args = str(self.arg_string or "").split()
 
-        if self.arg_string:
+        if args and args[-1].lower() in WINDOWS:
+            window = args.pop().lower()
+
+        if args:
             try:
-                how_many = int(self.arg_string)
+                how_many = int(" ".join(args))
             except ValueError:
                 self.bot.make_post(
                     self.event,
@@ -394,23 +535,28 @@ examples:
                 )
                 return
 
-        karma_objects = KarmaModel.list_lowest(how_many=how_many)
-
-        for item in karma_objects:
-            possible_username = self.ka.check_if_correlates_to_username(
-                self.event,
-                item.string_id,
+        if window:
+            karma_objects = KarmaRollupModel.list_window(
+                window,
+                how_many,
+                lowest=True,
             )
-            if possible_username:
-                item.string_id = possible_username
+        else:
+            karma_objects = leaderboard.lowest(how_many)
+
+        usernames = self.ka.usernames_for(
+            self.event,
+            [item.string_id for item in karma_objects],
+        )
 
-        message = "*The {} lowest-rated karma subjects:*\n\n".format(
+        message = "*The {} lowest-rated karma subjects{}:*\n\n".format(
             how_many,
+            " in the last {}".format(window) if window else "",
         )
 
         for item in karma_objects:
             message += "*{}* with *{}* karma _({} ++, {} --)_\n".format(
-                item.string_id,
+                usernames.get(item.string_id, item.string_id),
                 item.karma,
                 item.upvotes,
                 item.downvotes,
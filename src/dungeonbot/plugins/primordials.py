@@ -43,8 +43,14 @@ class BangCommandPlugin(SlackEnabledPlugin):
 class SuffixCommandPlugin(SlackEnabledPlugin):
     """Base plugin for handling suffixed commands."""
 
-    def __init__(self, event, arg_string, suffix=None):
-        """Initialize plugin with event, arg string, and suffix."""
+    def __init__(self, event, arg_string, suffix=None, ops=None):
+        """Initialize plugin with event, arg string, and suffix.
+
+        `ops` lists every (subject, suffix) for this plugin in the
+        message, when there may be more than one.
+
+        """
         super().__init__(event)
         self.arg_string = arg_string
         self.suffix = suffix
+        self.ops = ops
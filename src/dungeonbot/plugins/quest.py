@@ -3,10 +3,12 @@
 from dungeonbot.handlers.slack import SlackHandler
 from dungeonbot.models.quest import QuestModel
 from dungeonbot.plugins.primordials import BangCommandPlugin
+from dungeonbot.plugins.registry import register_command
 
 TIME_FMT = "%b %d, %Y %H:%M"
 
 
+@register_command('quest')
 class QuestPlugin(BangCommandPlugin):
     """Plugin for managing quests."""
 
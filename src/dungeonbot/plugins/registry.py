@@ -0,0 +1,138 @@
+"""Keep track of which plugin handles which command.
+
+Plugins join the registry with a class decorator:
+
+    @register_command("roll")
+    class RollPlugin(BangCommandPlugin):
+        ...
+
+    @register_suffix("++", "--")
+    class KarmaModifyPlugin(SuffixCommandPlugin):
+        ...
+
+The same maps serve EventHandler's dispatch and HelpPlugin's topics,
+so a command is reachable and documented as soon as it's registered.
+
+Plugin modules aren't imported up front. COMMAND_MODULES and
+SUFFIX_MODULES say where each command's plugin lives; the module (and
+the models it uses) is imported the first time the command is looked
+up, and its decorators fill in the class. Commands named in
+PLUGIN_PRELOAD are imported at startup instead. The tables must match
+the decorators; test_registry checks that they do.
+
+"""
+
+from collections.abc import Mapping
+
+import importlib
+
+
+# Bang command name (without the "!") -> module defining its plugin.
+COMMAND_MODULES = {
+    'help': "dungeonbot.plugins.help",
+    'karma': "dungeonbot.plugins.karma",
+    'karma_newest': "dungeonbot.plugins.karma",
+    'karma_top': "dungeonbot.plugins.karma",
+    'karma_bottom': "dungeonbot.plugins.karma",
+    'roll': "dungeonbot.plugins.roll",
+    'quest': "dungeonbot.plugins.quest",
+    'log': "dungeonbot.plugins.highlights",
+    'attr': "dungeonbot.plugins.attribute",
+}
+
+# Command suffix, e.g. "++" -> module defining its plugin.
+SUFFIX_MODULES = {
+    '++': "dungeonbot.plugins.karma",
+    '--': "dungeonbot.plugins.karma",
+}
+
+
+class LazyPluginMap(Mapping):
+    """Read-only map of command -> plugin class, importing on first use.
+
+    Membership tests (`name in plugins`) never import anything; looking
+    a name up does, once.
+
+    """
+
+    def __init__(self, modules):
+        """Initialize LazyPluginMap with its command -> module table."""
+        self.modules = modules
+        self.loaded = {}
+
+    def __getitem__(self, key):
+        """Return the plugin class for `key`, importing it if needed."""
+        try:
+            return self.loaded[key]
+        except KeyError:
+            pass
+
+        if key not in self.modules:
+            raise KeyError(key)
+
+        importlib.import_module(self.modules[key])
+
+        if key not in self.loaded:
+            raise LookupError(
+                "'{}' is listed as living in {}, which doesn't register "
+                "it; fix COMMAND_MODULES or SUFFIX_MODULES".format(
+                    key,
+                    self.modules[key],
+                )
+            )
+
+        return self.loaded[key]
+
+    def __contains__(self, key):
+        """Return True if `key` is a known command, without importing."""
+        return key in self.loaded or key in self.modules
+
+    def __iter__(self):
+        """Iterate over every known command name."""
+        return iter(set(self.modules) | set(self.loaded))
+
+    def __len__(self):
+        """Return the number of known command names."""
+        return len(set(self.modules) | set(self.loaded))
+
+    def register(self, keys, plugin):
+        """Record `plugin` as the handler for each of `keys`."""
+        for key in keys:
+            current = self.loaded.get(key)
+            if current is not None and current is not plugin:
+                raise ValueError("'{}' is already handled by {}".format(
+                    key,
+                    current.__name__,
+                ))
+            self.loaded[key] = plugin
+
+        return plugin
+
+    def preload(self, keys):
+        """Import the plugins for `keys` now; "*" means every plugin."""
+        if "*" in keys:
+            keys = list(self.modules)
+
+        for key in keys:
+            if key in self.modules:
+                self[key]
+
+
+commands = LazyPluginMap(COMMAND_MODULES)
+suffixes = LazyPluginMap(SUFFIX_MODULES)
+
+
+def register_command(*names):
+    """Register the decorated plugin as the handler for `!name`."""
+    return lambda plugin: commands.register(names, plugin)
+
+
+def register_suffix(*suffix_strings):
+    """Register the decorated plugin for text ending in each suffix."""
+    return lambda plugin: suffixes.register(suffix_strings, plugin)
+
+
+def preload(names):
+    """Import the plugins for the given command names and suffixes."""
+    commands.preload(names)
+    suffixes.preload(names)
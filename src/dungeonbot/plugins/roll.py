@@ -1,12 +1,14 @@
 """Define logic for the Roll plugin."""
 
 from dungeonbot.plugins.primordials import BangCommandPlugin
+from dungeonbot.plugins.registry import register_command
 from dungeonbot.handlers.slack import SlackHandler
 
 from dungeonbot.plugins.helpers.die_roll import DieRoll
 from dungeonbot.models.roll import RollModel
 
 
+@register_command('roll')
 class RollPlugin(BangCommandPlugin):
     """Plugin for roll."""
 
@@ -1,6 +1,7 @@
 """Define API routes."""
 
 import os
+import time
 
 from flask import (
     request,
@@ -8,11 +9,36 @@ from flask import (
     Response,
 )
 
-from threading import Thread
-
 from dungeonbot import app
+from dungeonbot.models import db
 from dungeonbot.handlers.event import EventHandler
-from auxiliaries.helpers import eprint
+from dungeonbot.handlers.event_queue import make_event_queue
+from dungeonbot.handlers.dedup import deduplicator, event_key
+from dungeonbot.handlers.admission import admission
+from dungeonbot.handlers.executor import get_executor
+from dungeonbot.handlers.tokenizer import tokenize
+from dungeonbot.handlers.slack import (
+    breakers,
+    outbound_queue,
+    user_directory,
+)
+from dungeonbot.handlers.users import USER_EVENTS
+from dungeonbot.plugins import registry
+from dungeonbot.metrics import (
+    command_label,
+    render_counters,
+    set_command,
+    timings,
+)
+from dungeonbot.log import Sampler, fields, get_logger, summarize
+
+
+README_URL = "http://gitlab.com/tannerlake/dungeonbot/blob/master/README.md"
+
+log = get_logger(__name__)
+
+# Most events are chatter we ignore; only log a sample of them.
+sample_unimportant = Sampler(app.config["LOG_SAMPLE_UNIMPORTANT"])
 
 
 ################################
@@ -20,14 +46,21 @@ from auxiliaries.helpers import eprint
 ################################
 
 def event_is_important(event):
-    """Assert event is valid command and not posted by dungeonbot."""
-    suffixes = ["++", "--"]
+    """Assert event is valid command and not posted by dungeonbot.
+
+    Events without a user or text (edits, deletions, bot messages)
+    are never important.
+
+    """
+    user = event.get('user')
+    text = event.get('text')
 
     if (
-        event['user'] != os.getenv("BOT_ID") and
+        user and text and
+        user != os.getenv("BOT_ID") and
         (
-            event['text'][0] == "!" or
-            event['text'][-2:] in suffixes
+            text[0] == "!" or
+            tokenize(text)
         )
     ):
         return True
@@ -42,20 +75,121 @@ def process_event(event=None):
     consider important and that should be acted upon, spin up an
     EventHandler to handle that event.
 
+    Events announcing a new or changed Slack user update the cached
+    user directory instead.
+
+    Worker threads are reused between events, so the thread's database
+    session is released once the event has been handled.
+
     """
-    eprint("Thread started!")
-    eprint("Event obtained:", event)
+    if event.get('type') in USER_EVENTS:
+        user_directory.update(event['user'], event.get('team_id'))
+        return
+
+    set_command(command_label(event))
+
+    try:
+        with timings.time("important"):
+            important = event_is_important(event)
+
+        if important:
+            log.info(
+                "event considered important",
+                extra=fields(**summarize(event)),
+            )
+
+            with timings.time("handle"):
+                handler = EventHandler(event)
+                handler.process_event()
+
+        elif sample_unimportant():
+            log.debug(
+                "event not considered important",
+                extra=fields(
+                    sampled=sample_unimportant.every,
+                    **summarize(event)
+                ),
+            )
+
+    finally:
+        db.session.remove()
 
-    if event_is_important(event):
-        eprint("event considered important:")
-        eprint(event)
 
-        handler = EventHandler(event)
-        handler.process_event()
+event_queue = make_event_queue(process_event)
 
-    else:
-        eprint("event not considered important:")
-        eprint(event)
+
+@app.before_first_request
+def start_event_queue():
+    """Replay events left in storage, once this worker is serving."""
+    event_queue.start()
+
+
+registry.preload(app.config["PLUGIN_PRELOAD"])
+
+if app.config["KARMA_WRITE_BEHIND"]:
+    from dungeonbot.plugins.helpers.karma_batcher import flush_on_sigterm
+    flush_on_sigterm()
+
+
+def accept_event(payload, retry_num=None):
+    """Queue the event from an Events API payload for processing.
+
+    Events are turned away while the worker pool is over capacity for
+    their class of command, or when the executor rejects them and they
+    weren't stored for replay. Events that Slack resends because we
+    were slow to answer are dropped.
+
+    Returns the HTTP status to answer Slack with: 200, or 503 if the
+    event was shed and Slack should retry later.
+
+    """
+    event = payload['event']
+    event['team_id'] = payload['team_id']
+
+    if not admission.admit(event):
+        return 503
+
+    key = event_key(payload)
+
+    if deduplicator.is_duplicate(key):
+        log.info("dropping duplicate event", extra=fields(
+            retry=retry_num,
+            **summarize(event)
+        ))
+        return 200
+
+    try:
+        accepted = event_queue.put(event)
+    except Exception:
+        # The event wasn't stored; let Slack's retry through.
+        db.session.rollback()
+        deduplicator.forget(key)
+        raise
+
+    if not accepted and not event_queue.durable:
+        # Nothing will replay the event; let Slack's retry through.
+        deduplicator.forget(key)
+        return 503
+
+    return 200
+
+
+def render_metrics():
+    """Return stage timings and pipeline counters for Prometheus."""
+    return "".join([
+        timings.render(),
+        render_counters("dungeonbot_executor", get_executor().counters),
+        render_counters("dungeonbot_executor", {
+            "depth": get_executor().depths(
+                top=app.config["EVENT_METRICS_KEYS"],
+            ),
+        }),
+        render_counters("dungeonbot_dedup", deduplicator.counters),
+        render_counters("dungeonbot_admission", admission.counters),
+        render_counters("dungeonbot_users", user_directory.counters),
+        render_counters("dungeonbot_outbound", outbound_queue.counters),
+        render_counters("dungeonbot_slack_breaker", breakers.counters),
+    ])
 
 
 ################################
@@ -73,26 +207,44 @@ def root():
     redirects to the readme file in master branch of the repository.
 
     """
-    eprint("hit / route")
+    log.debug("hit / route")
 
     if request.method == "GET":
-        return redirect(
-            "http://gitlab.com/tannerlake/dungeonbot/blob/master/README.md",
-            code=302
-        )
+        return redirect(README_URL, code=302)
 
-    event = request.json['event']
-    event['team_id'] = request.json['team_id']
+    started = time.perf_counter()
+    payload = request.json
+    command = command_label(payload.get("event", {}))
+    timings.observe("parse", command, time.perf_counter() - started)
 
-    thread = Thread(target=process_event, kwargs={"event": event})
-    thread.start()
+    with timings.time("accept", command):
+        status = accept_event(
+            payload,
+            request.headers.get("X-Slack-Retry-Num"),
+        )
 
-    return Response(status=200)
+    if status == 503:
+        return Response(
+            status=503,
+            headers={"Retry-After": str(app.config["EVENT_RETRY_AFTER"])},
+        )
+
+    return Response(status=status)
 
 
 @app.route("/oauth", methods=["GET", "POST"])
 def oauth():
     """Define OAuth route for adding dungeonbot to Slack teams."""
-    eprint("hit /oauth route")
+    log.debug("hit /oauth route")
 
     return Response(status=200)
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Expose stage timings and pipeline counters to Prometheus."""
+    return Response(
+        render_metrics(),
+        status=200,
+        mimetype="text/plain; version=0.0.4",
+    )
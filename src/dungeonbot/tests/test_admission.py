@@ -0,0 +1,60 @@
+"""Tests for the AdmissionController."""
+
+
+from dungeonbot.conftest import BaseTest
+
+from dungeonbot.handlers import admission
+from dungeonbot.handlers.admission import AdmissionController, command_class
+
+from unittest import mock
+
+
+class AdmissionControllerUnitTests(BaseTest):
+    """Tests for the AdmissionController."""
+
+    def setUp(self):
+        """Create a controller whose in-flight count we control."""
+        super().setUp()
+        self.in_flight = 0
+        self.controller = AdmissionController(
+            capacity=10,
+            thresholds={"low": 0.5, "normal": 0.8, "critical": 1.0},
+            in_flight=lambda: self.in_flight,
+        )
+
+    def test_command_class(self):
+        """Events are classified by their command."""
+        self.assertEqual("low", command_class({"text": "!help roll"}))
+        self.assertEqual("low", command_class({"text": "!karma_top 5"}))
+        self.assertEqual("normal", command_class({"text": "!roll 1d20"}))
+        self.assertEqual("critical", command_class({"text": "dungeonbot++"}))
+        self.assertEqual("low", command_class({"text": "just chatting"}))
+        self.assertEqual("low", command_class({}))
+
+    def test_admit_under_capacity(self):
+        """Everything is admitted while the pool is quiet."""
+        for text in ("!help", "!roll 1d20", "foo++"):
+            self.assertTrue(self.controller.admit({"text": text}))
+
+        self.assertEqual(3, self.controller.counters["admitted"])
+
+    def test_help_is_shed_before_karma_writes(self):
+        """Low-priority commands are shed first, karma writes last."""
+        self.in_flight = 6
+
+        with mock.patch.object(admission, "log"):
+            self.assertFalse(self.controller.admit({"text": "!help"}))
+            self.assertTrue(self.controller.admit({"text": "!roll 1d20"}))
+            self.assertTrue(self.controller.admit({"text": "foo++"}))
+
+            self.in_flight = 9
+            self.assertFalse(self.controller.admit({"text": "!roll 1d20"}))
+            self.assertTrue(self.controller.admit({"text": "foo++"}))
+
+            self.in_flight = 10
+            self.assertFalse(self.controller.admit({"text": "foo++"}))
+
+        self.assertEqual(
+            {"low": 1, "normal": 1, "critical": 1},
+            self.controller.counters["shed"]
+        )
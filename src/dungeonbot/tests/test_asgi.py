@@ -0,0 +1,127 @@
+"""Tests for the ASGI application."""
+
+
+from dungeonbot.conftest import BaseTest
+
+from dungeonbot import asgi, routes
+
+from unittest import mock
+
+import asyncio
+import json
+import threading
+
+
+def call(scope, body=b""):
+    """Run one request through the ASGI app; return the sent messages."""
+    sent = []
+    received = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive():
+        return received.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = dict({"type": "http", "headers": []}, **scope)
+    asyncio.run(asgi.application(scope, receive, send))
+    return sent
+
+
+class ASGIApplicationUnitTests(BaseTest):
+    """Tests for the ASGI application."""
+
+    def test_root_with_get(self):
+        """Return a redirect to the readme when accessed via GET."""
+        sent = call({"method": "GET", "path": "/"})
+
+        self.assertEqual(302, sent[0]["status"])
+        self.assertIn(
+            (b"location", routes.README_URL.encode()),
+            sent[0]["headers"]
+        )
+
+    def test_root_with_post(self):
+        """Return a 200 OK and queue the event when accessed via POST."""
+        event = {"event": {"a thing": "something"}, "team_id": "some id"}
+        mock_queue = mock.MagicMock()
+
+        with mock.patch.object(routes, "event_queue", mock_queue):
+            sent = call(
+                {"method": "POST", "path": "/"},
+                json.dumps(event).encode(),
+            )
+
+        self.assertEqual(200, sent[0]["status"])
+        mock_queue.put.assert_called_with(
+            {"a thing": "something", "team_id": "some id"}
+        )
+
+    def test_root_with_bad_json(self):
+        """Return a 400 when the body isn't JSON."""
+        sent = call({"method": "POST", "path": "/"}, b"not json")
+        self.assertEqual(400, sent[0]["status"])
+
+    def test_oauth(self):
+        """The OAuth route just returns 200 for now."""
+        sent = call({"method": "GET", "path": "/oauth"})
+        self.assertEqual(200, sent[0]["status"])
+
+    def test_metrics(self):
+        """The metrics route serves Prometheus text."""
+        sent = call({"method": "GET", "path": "/metrics"})
+
+        self.assertEqual(200, sent[0]["status"])
+        self.assertIn(b"dungeonbot_executor_queued", sent[1]["body"])
+
+    def test_unknown_route_and_method(self):
+        """Unknown paths are 404s; unknown methods are 405s."""
+        self.assertEqual(
+            404,
+            call({"method": "GET", "path": "/nope"})[0]["status"]
+        )
+        self.assertEqual(
+            405,
+            call({"method": "DELETE", "path": "/"})[0]["status"]
+        )
+
+    def test_lifespan(self):
+        """Startup starts the event queue; shutdown stops the pool, off
+        the event loop."""
+        messages = [
+            {"type": "lifespan.startup"},
+            {"type": "lifespan.shutdown"},
+        ]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        mock_queue = mock.MagicMock()
+        mock_executor = mock.MagicMock()
+        shutdown_threads = []
+        mock_executor.shutdown.side_effect = (
+            lambda: shutdown_threads.append(threading.current_thread())
+        )
+
+        with mock.patch.object(
+            asgi,
+            "get_executor",
+            return_value=mock_executor,
+        ), mock.patch.object(routes, "event_queue", mock_queue):
+            asyncio.run(asgi.application(
+                {"type": "lifespan"},
+                receive,
+                send,
+            ))
+
+        self.assertTrue(mock_queue.start.called)
+        self.assertTrue(mock_executor.shutdown.called)
+        self.assertIsNot(threading.main_thread(), shutdown_threads[0])
+        self.assertEqual(
+            ["lifespan.startup.complete", "lifespan.shutdown.complete"],
+            [message["type"] for message in sent]
+        )
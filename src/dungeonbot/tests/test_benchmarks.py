@@ -0,0 +1,52 @@
+"""Tests for the micro-benchmark runner."""
+
+
+from dungeonbot.conftest import BaseTest
+
+from auxiliaries import benchmarks
+
+
+class BenchmarksUnitTests(BaseTest):
+    """Tests for auxiliaries.benchmarks."""
+
+    def test_run_and_measure(self):
+        """Benchmarks can be picked by name and report per-call times."""
+        results = benchmarks.run(pattern="die_roll", rounds=2)
+
+        self.assertEqual({"die_roll_parse", "die_roll_roll"}, set(results))
+        for stats in results.values():
+            self.assertEqual(2, stats["rounds"])
+            self.assertLessEqual(stats["min"], stats["median"])
+
+    def test_sized_benchmarks_run_once_per_size(self):
+        """A sized benchmark gets the size in its name."""
+        results = benchmarks.run(
+            pattern="karma_list_highest",
+            sizes=[10, 20],
+            rounds=2,
+        )
+
+        self.assertEqual(
+            {"karma_list_highest[10]", "karma_list_highest[20]"},
+            set(results)
+        )
+
+    def test_compare(self):
+        """Only benchmarks slower than the threshold are regressions."""
+        baseline = {
+            "fast": {"median": 1.0},
+            "slow": {"median": 1.0},
+            "removed": {"median": 1.0},
+        }
+        results = {
+            "fast": {"median": 1.1},
+            "slow": {"median": 1.5},
+            "added": {"median": 1.0},
+        }
+
+        rows = benchmarks.compare(baseline, results, threshold=0.2)
+
+        self.assertEqual(
+            {"fast": False, "slow": True},
+            {row[0]: row[4] for row in rows}
+        )
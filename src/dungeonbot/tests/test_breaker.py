@@ -0,0 +1,113 @@
+"""Tests for the circuit breakers around Slack calls."""
+
+
+from dungeonbot.conftest import BaseTest
+
+from dungeonbot.handlers import breaker
+from dungeonbot.handlers.breaker import (
+    BreakerBoard,
+    CircuitBreaker,
+    CircuitOpenError,
+)
+
+from slacker import Error as SlackError
+
+from unittest import mock
+
+
+def fail():
+    """Stand in for a Slack call that times out."""
+    raise IOError("timed out")
+
+
+class CircuitBreakerUnitTests(BaseTest):
+    """Tests for the CircuitBreaker."""
+
+    def setUp(self):
+        """Silence the breaker's log."""
+        super().setUp()
+        patcher = mock.patch.object(breaker, "log")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_opens_after_threshold_and_fails_fast(self):
+        """Threshold failures in a row open the circuit."""
+        cb = CircuitBreaker("chat.postMessage", threshold=2)
+        func = mock.Mock(side_effect=IOError("timed out"))
+
+        for _ in range(2):
+            with self.assertRaises(IOError):
+                cb.call(func)
+
+        with self.assertRaises(CircuitOpenError):
+            cb.call(func)
+
+        self.assertEqual(2, func.call_count)
+        self.assertEqual(breaker.OPEN, cb.state)
+        self.assertEqual(1, cb.rejected)
+
+    def test_success_resets_failures(self):
+        """Failures must be consecutive to open the circuit."""
+        cb = CircuitBreaker("users.list", threshold=2)
+
+        with self.assertRaises(IOError):
+            cb.call(fail)
+        self.assertEqual("ok", cb.call(lambda: "ok"))
+        with self.assertRaises(IOError):
+            cb.call(fail)
+
+        self.assertEqual(breaker.CLOSED, cb.state)
+
+    def test_slack_answers_dont_count(self):
+        """API errors and rate limiting mean Slack is up."""
+        cb = CircuitBreaker("chat.postMessage", threshold=1)
+        rate_limited = IOError("429")
+        rate_limited.response = mock.Mock(status_code=429)
+
+        for error in (SlackError("channel_not_found"), rate_limited):
+            with self.assertRaises(type(error)):
+                cb.call(mock.Mock(side_effect=error))
+
+        self.assertEqual(breaker.CLOSED, cb.state)
+
+    def test_half_open_trial(self):
+        """After the reset timeout, one trial call decides the state."""
+        cb = CircuitBreaker("chat.postMessage", threshold=1, reset_timeout=10)
+
+        with self.assertRaises(IOError):
+            cb.call(fail)
+
+        later = breaker.time.monotonic() + 11
+
+        with mock.patch.object(breaker.time, "monotonic", return_value=later):
+            with self.assertRaises(IOError):
+                cb.call(fail)
+            self.assertEqual(breaker.OPEN, cb.state)
+
+        later += 11
+
+        with mock.patch.object(breaker.time, "monotonic", return_value=later):
+            self.assertEqual("ok", cb.call(lambda: "ok"))
+            self.assertEqual(breaker.CLOSED, cb.state)
+
+
+class BreakerBoardUnitTests(BaseTest):
+    """Tests for the BreakerBoard."""
+
+    def test_breakers_are_per_method(self):
+        """Each method gets its own breaker and threshold."""
+        board = BreakerBoard(thresholds={"users.list": 1})
+
+        with mock.patch.object(breaker, "log"):
+            with self.assertRaises(IOError):
+                board.call("users.list", fail)
+
+        with self.assertRaises(CircuitOpenError):
+            board.call("users.list", fail)
+
+        self.assertEqual("ok", board.call("chat.postMessage", lambda: "ok"))
+        self.assertEqual(
+            {"users.list": 1, "chat.postMessage": 0},
+            board.counters["open"]
+        )
+        self.assertEqual(5, board.get("chat.postMessage").threshold)
@@ -0,0 +1,110 @@
+"""Tests for the EventDeduplicator."""
+
+
+from dungeonbot.conftest import BaseTest
+
+from dungeonbot.handlers import dedup
+from dungeonbot.handlers.dedup import EventDeduplicator, event_key
+from dungeonbot.models.seen_event import SeenEventModel
+
+from unittest import mock
+
+
+class EventDeduplicatorUnitTests(BaseTest):
+    """Tests for the EventDeduplicator."""
+
+    def test_repeat_key_is_duplicate(self):
+        """The second sighting of a key is a duplicate."""
+        dd = EventDeduplicator()
+
+        self.assertFalse(dd.is_duplicate("Ev1"))
+        self.assertTrue(dd.is_duplicate("Ev1"))
+        self.assertFalse(dd.is_duplicate("Ev2"))
+
+        self.assertEqual(
+            {"size": 2, "hits": 1, "misses": 2},
+            dd.counters
+        )
+
+    def test_none_is_never_duplicate(self):
+        """Payloads without a key are always let through."""
+        dd = EventDeduplicator()
+
+        self.assertFalse(dd.is_duplicate(None))
+        self.assertFalse(dd.is_duplicate(None))
+        self.assertEqual(0, dd.counters["size"])
+
+    def test_size_bound_evicts_least_recent(self):
+        """The LRU never holds more than max_size keys."""
+        dd = EventDeduplicator(max_size=2)
+
+        dd.is_duplicate("Ev1")
+        dd.is_duplicate("Ev2")
+        dd.is_duplicate("Ev3")
+
+        self.assertEqual(2, dd.counters["size"])
+        self.assertFalse(dd.is_duplicate("Ev1"))
+
+    def test_ttl_expires_keys(self):
+        """Keys older than the TTL are forgotten."""
+        dd = EventDeduplicator(ttl=10)
+
+        with mock.patch.object(dedup.time, "monotonic", return_value=100):
+            dd.is_duplicate("Ev1")
+
+        with mock.patch.object(dedup.time, "monotonic", return_value=105):
+            self.assertTrue(dd.is_duplicate("Ev1"))
+
+        with mock.patch.object(dedup.time, "monotonic", return_value=120):
+            self.assertFalse(dd.is_duplicate("Ev1"))
+
+    def test_shared_mode_uses_db(self):
+        """A key recorded by another process is a duplicate."""
+        SeenEventModel.mark("Ev1")
+        dd = EventDeduplicator(shared=True)
+
+        self.assertTrue(dd.is_duplicate("Ev1"))
+        self.assertFalse(dd.is_duplicate("Ev2"))
+        self.assertEqual(
+            2,
+            self.db.session.query(SeenEventModel).count()
+        )
+
+    def test_shared_mode_failure_isnt_remembered(self):
+        """A key that couldn't be recorded in the DB isn't a duplicate."""
+        dd = EventDeduplicator(shared=True)
+
+        with mock.patch.object(SeenEventModel, "mark",
+                               side_effect=RuntimeError("db went away")):
+            with self.assertRaises(RuntimeError):
+                dd.is_duplicate("Ev1")
+
+        self.assertEqual(0, dd.counters["size"])
+        self.assertFalse(dd.is_duplicate("Ev1"))
+        self.assertTrue(dd.is_duplicate("Ev1"))
+
+    def test_forget(self):
+        """A forgotten key is accepted again, in every process."""
+        dd = EventDeduplicator(shared=True)
+
+        self.assertFalse(dd.is_duplicate("Ev1"))
+        dd.forget("Ev1")
+        dd.forget(None)
+
+        self.assertEqual(0, self.db.session.query(SeenEventModel).count())
+        self.assertFalse(dd.is_duplicate("Ev1"))
+
+    def test_event_key(self):
+        """event_id is preferred; otherwise team, channel and ts are used."""
+        self.assertEqual(
+            "Ev1",
+            event_key({"event_id": "Ev1", "event": {"ts": "1.0"}})
+        )
+        self.assertEqual(
+            "T1:C1:1.0",
+            event_key({"team_id": "T1", "event": {
+                "channel": "C1",
+                "event_ts": "1.0",
+            }})
+        )
+        self.assertIsNone(event_key({"team_id": "T1", "event": {}}))
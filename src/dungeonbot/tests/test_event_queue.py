@@ -0,0 +1,241 @@
+"""Tests for the durable event queue."""
+
+
+from dungeonbot.conftest import BaseTest
+
+from dungeonbot.handlers import event_queue
+from dungeonbot.handlers.event_queue import DurableEventQueue
+from dungeonbot.models.event_queue import QueuedEventModel
+
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from unittest import mock
+
+import threading
+
+
+class SyncExecutor(object):
+    """Executor stand-in that records jobs and runs them on demand."""
+
+    def __init__(self):
+        """Start with no jobs."""
+        self.jobs = []
+
+    def submit_ordered(self, key, func, *args, **kwargs):
+        """Record a job."""
+        self.jobs.append((func, args, kwargs))
+        return True
+
+    def run_all(self):
+        """Run and forget every recorded job."""
+        jobs, self.jobs = self.jobs, []
+        for func, args, kwargs in jobs:
+            func(*args, **kwargs)
+
+
+class QueuedEventModelUnitTests(BaseTest):
+    """Tests for the QueuedEventModel."""
+
+    def test_push_and_ack(self):
+        """A pushed event is stored until acked."""
+        session = self.db.session
+        queued_id = QueuedEventModel.push({"text": "!roll 1d20"})
+        queued = session.query(QueuedEventModel).get(queued_id)
+
+        self.assertEqual({"text": "!roll 1d20"}, queued.event)
+        self.assertEqual(1, queued.attempts)
+        self.assertIsNotNone(queued.claimed)
+        self.assertEqual(1, session.query(QueuedEventModel).count())
+
+        QueuedEventModel.ack(queued.id)
+        self.assertEqual(0, session.query(QueuedEventModel).count())
+
+    def test_claim_only_when_expired(self):
+        """A fresh claim can't be taken over; an expired one can, once."""
+        queued = self.db.session.query(QueuedEventModel).get(
+            QueuedEventModel.push({"text": "foo++"})
+        )
+
+        self.assertFalse(QueuedEventModel.claim(queued.id, lease=60))
+        self.assertEqual([], QueuedEventModel.list_expired(lease=60))
+
+        queued.claimed = datetime.utcnow() - timedelta(seconds=120)
+        self.db.session.commit()
+
+        self.assertEqual(
+            [queued.id],
+            [q.id for q in QueuedEventModel.list_expired(lease=60)]
+        )
+        self.assertTrue(QueuedEventModel.claim(queued.id, lease=60))
+        self.assertFalse(QueuedEventModel.claim(queued.id, lease=60))
+
+        self.db.session.expire_all()
+        self.assertEqual(
+            2,
+            self.db.session.query(QueuedEventModel).get(queued.id).attempts
+        )
+
+
+class DurableEventQueueUnitTests(BaseTest):
+    """Tests for the DurableEventQueue."""
+
+    def setUp(self):
+        """Create a queue around a mock processor."""
+        super().setUp()
+        self.process = mock.MagicMock()
+        self.executor = SyncExecutor()
+        self.queue = DurableEventQueue(
+            self.process,
+            executor=self.executor,
+            lease=60,
+            max_attempts=3,
+        )
+        self.queue._sweeper = True
+
+    def _count(self):
+        return self.db.session.query(QueuedEventModel).count()
+
+    def test_put_stores_before_processing(self):
+        """The event is in the DB as soon as put() returns."""
+        event = {"text": "!help"}
+        self.assertTrue(self.queue.put(event))
+
+        self.assertEqual(1, self._count())
+        self.assertFalse(self.process.called)
+
+        self.executor.run_all()
+
+        self.process.assert_called_with(event=event)
+        self.assertEqual(0, self._count())
+
+    def test_put_is_one_insert(self):
+        """Storing an event doesn't read it back."""
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement.split()[0].upper())
+
+        event.listen(Engine, "before_cursor_execute", record)
+        try:
+            self.queue.put({"text": "foo++"})
+        finally:
+            event.remove(Engine, "before_cursor_execute", record)
+
+        self.assertEqual(["INSERT"], statements)
+
+    def test_failed_processing_keeps_event(self):
+        """An event that hit a retryable error stays stored for replay."""
+        self.process.side_effect = OperationalError(
+            "SELECT 1", {}, RuntimeError("db went away")
+        )
+        self.queue.put({"text": "foo++"})
+
+        with self.assertRaises(OperationalError):
+            self.executor.run_all()
+
+        self.assertEqual(1, self._count())
+
+    def test_failed_processing_drops_event(self):
+        """An event that would fail the same way again is deleted."""
+        self.process.side_effect = KeyError("user")
+        self.queue.put({"text": "foo++"})
+
+        with mock.patch.object(event_queue, "log") as mock_log:
+            with self.assertRaises(KeyError):
+                self.executor.run_all()
+
+        self.assertTrue(mock_log.warning.called)
+        self.assertEqual(0, self._count())
+
+    def test_replayed_event_is_handled_once(self):
+        """A copy submitted before the event was claimed again is skipped."""
+        self.queue.put({"text": "foo++"})
+        queued = self.db.session.query(QueuedEventModel).one()
+        queued.claimed = datetime.utcnow() - timedelta(seconds=120)
+        self.db.session.commit()
+
+        with mock.patch.object(event_queue, "log"):
+            self.assertEqual(1, self.queue.replay())
+            self.executor.run_all()
+
+        self.assertEqual(1, self.process.call_count)
+        self.assertEqual(0, self._count())
+
+    def test_waiting_events_keep_their_claim(self):
+        """Claims are renewed while events wait for a worker."""
+        self.queue.put({"text": "foo++"})
+        queued = self.db.session.query(QueuedEventModel).one()
+        queued.claimed = datetime.utcnow() - timedelta(seconds=120)
+        self.db.session.commit()
+
+        self.assertEqual(1, self.queue.renew())
+        self.assertEqual([], QueuedEventModel.list_expired(lease=60))
+
+        self.executor.run_all()
+        self.assertEqual(0, self.queue.renew())
+        self.assertEqual(0, self._count())
+
+    def test_replay_expired_events(self):
+        """Events left behind by a dead worker are processed again."""
+        queued = self.db.session.query(QueuedEventModel).get(
+            QueuedEventModel.push({"text": "foo++"})
+        )
+        queued.claimed = datetime.utcnow() - timedelta(seconds=120)
+        self.db.session.commit()
+
+        with mock.patch.object(event_queue, "log"):
+            self.assertEqual(1, self.queue.replay())
+            self.assertEqual(0, self.queue.replay())
+
+        self.executor.run_all()
+
+        self.process.assert_called_with(event={"text": "foo++"})
+        self.assertEqual(0, self._count())
+
+    def test_replay_discards_poison_events(self):
+        """Events that used up their attempts are dropped."""
+        queued = self.db.session.query(QueuedEventModel).get(
+            QueuedEventModel.push({"text": "foo++"})
+        )
+        queued.claimed = datetime.utcnow() - timedelta(seconds=120)
+        queued.attempts = 3
+        self.db.session.commit()
+
+        with mock.patch.object(event_queue, "log"):
+            self.assertEqual(0, self.queue.replay())
+
+        self.assertEqual([], self.executor.jobs)
+        self.assertEqual(0, self._count())
+
+    def test_start_replays_stored_events(self):
+        """Starting the queue replays stored events straight away."""
+        self.queue._sweeper = None
+        replayed = threading.Event()
+        self.queue.renew = mock.MagicMock(return_value=0)
+        self.queue.replay = mock.MagicMock(side_effect=replayed.set)
+
+        self.queue.start()
+        self.assertTrue(replayed.wait(5))
+
+        sweeper = self.queue._sweeper
+        self.queue.start()
+        self.assertIs(sweeper, self.queue._sweeper)
+        self.assertTrue(self.queue.renew.called)
+
+    def test_start_without_durability(self):
+        """With durability off there is nothing to sweep."""
+        self.queue._sweeper = None
+        self.queue.durable = False
+        self.queue.start()
+        self.assertIsNone(self.queue._sweeper)
+
+    def test_non_durable_put(self):
+        """With durability off, nothing touches the DB."""
+        self.queue.durable = False
+        self.queue.put({"text": "!help"})
+        self.assertEqual(0, self._count())
+
+        self.executor.run_all()
+        self.process.assert_called_with(event={"text": "!help"})
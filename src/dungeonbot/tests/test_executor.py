@@ -0,0 +1,205 @@
+"""Tests for the EventExecutor."""
+
+
+from dungeonbot.conftest import BaseTest
+
+from dungeonbot.handlers import executor
+from dungeonbot.handlers.executor import EventExecutor
+
+from unittest import mock
+
+import threading
+
+
+class EventExecutorUnitTests(BaseTest):
+    """Tests for the EventExecutor."""
+
+    def setUp(self):
+        """Create a gate that keeps worker threads busy until opened."""
+        super().setUp()
+        self.gate = threading.Event()
+
+    def tearDown(self):
+        """Release any blocked workers."""
+        self.gate.set()
+        super().tearDown()
+
+    def test_invalid_overflow_policy(self):
+        """An unknown overflow policy is refused."""
+        with self.assertRaises(ValueError):
+            EventExecutor(overflow="explode")
+
+    def test_submitted_jobs_run(self):
+        """Accepted jobs run on a worker thread and are counted."""
+        pool = EventExecutor(workers=2, queue_size=4)
+        results = []
+
+        for idx in range(4):
+            self.assertTrue(pool.submit(results.append, idx))
+
+        pool.shutdown()
+
+        self.assertEqual([0, 1, 2, 3], sorted(results))
+        self.assertEqual(4, pool.counters["submitted"])
+        self.assertEqual(4, pool.counters["completed"])
+        self.assertEqual(0, pool.counters["active"])
+
+    def test_failing_job_is_counted(self):
+        """A job that raises doesn't kill its worker."""
+        pool = EventExecutor(workers=1, queue_size=4)
+        results = []
+
+        with mock.patch.object(executor, "log"):
+            pool.submit(lambda: 1 / 0)
+            pool.submit(results.append, "still alive")
+            pool.shutdown()
+
+        self.assertEqual(["still alive"], results)
+        self.assertEqual(1, pool.counters["failed"])
+        self.assertEqual(1, pool.counters["completed"])
+
+    def test_reject_when_full(self):
+        """With the reject policy, jobs beyond the queue are refused."""
+        pool = EventExecutor(workers=1, queue_size=1, overflow="reject")
+        started = threading.Event()
+
+        def block():
+            started.set()
+            self.gate.wait()
+
+        with mock.patch.object(executor, "log"):
+            self.assertTrue(pool.submit(block))
+            started.wait()
+            self.assertTrue(pool.submit(lambda: None))
+            self.assertFalse(pool.submit(lambda: None))
+
+        self.assertEqual(1, pool.counters["active"])
+        self.assertEqual(1, pool.counters["queued"])
+        self.assertEqual(1, pool.counters["rejected"])
+
+        self.gate.set()
+        pool.shutdown()
+
+    def test_drop_oldest_when_full(self):
+        """With the drop_oldest policy, the oldest waiting job is discarded."""
+        pool = EventExecutor(workers=1, queue_size=1, overflow="drop_oldest")
+        started = threading.Event()
+        results = []
+
+        def block():
+            started.set()
+            self.gate.wait()
+
+        pool.submit(block)
+        started.wait()
+        self.assertTrue(pool.submit(results.append, "old"))
+        self.assertTrue(pool.submit(results.append, "new"))
+
+        self.gate.set()
+        pool.shutdown()
+
+        self.assertEqual(["new"], results)
+        self.assertEqual(1, pool.counters["dropped"])
+
+    def test_block_then_reject_when_full(self):
+        """With the block policy, the caller gives up after the timeout."""
+        pool = EventExecutor(
+            workers=1,
+            queue_size=1,
+            overflow="block",
+            block_timeout=0.01,
+        )
+        started = threading.Event()
+
+        def block():
+            started.set()
+            self.gate.wait()
+
+        with mock.patch.object(executor, "log"):
+            pool.submit(block)
+            started.wait()
+            pool.submit(lambda: None)
+            self.assertFalse(pool.submit(lambda: None))
+
+        self.assertEqual(1, pool.counters["rejected"])
+
+        self.gate.set()
+        pool.shutdown()
+
+    def test_same_key_runs_in_order(self):
+        """Jobs sharing a key never overlap and run in submission order."""
+        pool = EventExecutor(workers=4, queue_size=64)
+        results = []
+        running = set()
+        overlaps = []
+
+        def job(key, idx):
+            if key in running:
+                overlaps.append(key)
+            running.add(key)
+            results.append((key, idx))
+            running.discard(key)
+
+        for idx in range(10):
+            for key in ("C1", "C2"):
+                pool.submit_ordered(key, job, key, idx)
+
+        pool.shutdown()
+
+        self.assertEqual([], overlaps)
+        for key in ("C1", "C2"):
+            self.assertEqual(
+                list(range(10)),
+                [idx for k, idx in results if k == key]
+            )
+
+    def test_busy_key_does_not_block_other_keys(self):
+        """A blocked channel doesn't hold up jobs for other channels."""
+        pool = EventExecutor(workers=2, queue_size=8)
+        started = threading.Event()
+        done = threading.Event()
+
+        def block():
+            started.set()
+            self.gate.wait()
+
+        pool.submit_ordered("C1", block)
+        started.wait()
+        pool.submit_ordered("C1", lambda: None)
+        pool.submit_ordered("C2", done.set)
+
+        self.assertTrue(done.wait(1))
+        self.assertEqual({"C1": 1}, pool.depths())
+        self.assertEqual({}, pool.depths(top=0))
+
+        self.gate.set()
+        pool.shutdown()
+        self.assertEqual({}, pool.depths())
+
+    def test_ordering_key(self):
+        """The ordering key follows the EVENT_ORDERING setting."""
+        event = {"channel": "C1", "team_id": "T1"}
+
+        with mock.patch.dict(self.app.config, EVENT_ORDERING="channel"):
+            self.assertEqual("C1", executor.ordering_key(event))
+
+        with mock.patch.dict(self.app.config, EVENT_ORDERING="team_channel"):
+            self.assertEqual("T1:C1", executor.ordering_key(event))
+
+        with mock.patch.dict(self.app.config, EVENT_ORDERING="none"):
+            self.assertIsNone(executor.ordering_key(event))
+
+    def test_no_submit_after_shutdown(self):
+        """A shut-down executor refuses new jobs."""
+        pool = EventExecutor(workers=1)
+        pool.shutdown()
+        self.assertFalse(pool.submit(lambda: None))
+
+    def test_get_executor_is_process_wide(self):
+        """get_executor() builds one executor from the app config."""
+        with mock.patch.object(executor, "_executor", None):
+            first = executor.get_executor()
+            second = executor.get_executor()
+
+            self.assertIs(first, second)
+            self.assertEqual(self.app.config["EVENT_WORKERS"], first.workers)
@@ -0,0 +1,77 @@
+"""Tests for pointing SlackHandler at the fake Slack server."""
+
+
+from dungeonbot.conftest import BaseTest
+
+from dungeonbot.handlers import slack
+from dungeonbot.handlers.slack import SlackHandler
+
+from auxiliaries.fake_slack import FakeSlack
+
+from requests import HTTPError
+
+from unittest import mock
+
+
+class FakeSlackUnitTests(BaseTest):
+    """Tests for SlackHandler against auxiliaries.fake_slack."""
+
+    def setUp(self):
+        """Start a fake Slack and point a fresh Slack client at it."""
+        super().setUp()
+
+        self.fake = FakeSlack(users=50).start()
+        self.addCleanup(self.fake.stop)
+
+        for patcher in (
+            mock.patch.object(slack, "_client", None),
+            mock.patch.dict(slack.app.config, {
+                "SLACK_API_URL": self.fake.url,
+                "SLACK_OUTBOUND_QUEUE": False,
+            }),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.handler = SlackHandler()
+        self.handler.vocal = True
+
+    def test_base_url_without_trailing_slash(self):
+        """SLACK_API_URL works with or without its trailing slash."""
+        with mock.patch.object(slack, "_client", None):
+            with mock.patch.dict(slack.app.config, {
+                "SLACK_API_URL": self.fake.url.rstrip("/"),
+            }):
+                handler = SlackHandler()
+                handler.vocal = True
+                self.assertTrue(handler._fetch_users_list())
+
+        self.assertEqual(1, self.fake.stats["users.list"])
+
+    def test_users_and_posts_go_to_the_fake(self):
+        """users.list and chat.postMessage are answered by the fake."""
+        members = self.handler._fetch_users_list()
+        self.assertEqual(50, len(members))
+        self.assertEqual("user00001", members[0]["name"])
+
+        self.handler.make_post({"channel": "C1"}, "hello")
+
+        self.assertEqual([("C1", "hello")], self.fake.posts)
+        self.assertEqual(
+            {"users.list": 1, "chat.postMessage": 1},
+            self.fake.stats
+        )
+
+    def test_rate_limiting(self):
+        """A fake configured to rate limit answers 429 with Retry-After."""
+        self.fake.rate_limit_rate = 1.0
+        self.fake.retry_after = 7
+
+        with self.assertRaises(HTTPError) as raised:
+            self.handler.make_post({"channel": "C1"}, "hello")
+
+        self.assertEqual(429, raised.exception.response.status_code)
+        self.assertEqual(
+            "7",
+            raised.exception.response.headers["Retry-After"]
+        )
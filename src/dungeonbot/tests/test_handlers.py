@@ -3,7 +3,9 @@
 
 from dungeonbot.conftest import BaseTest
 
+from dungeonbot.handlers import slack
 from dungeonbot.handlers.event import EventHandler, SlackHandler
+from dungeonbot.handlers.outbound import OutboundQueue
 
 from unittest import mock
 
@@ -155,6 +157,33 @@ class EventHandlerUnitTests(BaseTest):
                 handler.parse_suffix_command()
                 self.assertTrue(mock_suffixes[key].called)
 
+    def test_parse_several_suffix_commands(self):
+        """Each plugin is called once with all of its commands."""
+        evt = self.mock_event
+        evt['text'] = "alice++ bob++ the dm--"
+        handler = EventHandler(evt)
+
+        mock_karma_modify_plugin = mock.Mock(name="MockKarmaModifyPlugin")
+        mock_suffixes = {
+            '++': mock_karma_modify_plugin,
+            '--': mock_karma_modify_plugin,
+        }
+
+        with mock.patch.object(
+            handler,
+            "valid_suffixes",
+            mock_suffixes
+        ):
+            handler.parse_suffix_command()
+
+        mock_karma_modify_plugin.assert_called_once_with(
+            evt,
+            "alice",
+            "++",
+            ops=[("alice", "++"), ("bob", "++"), ("the dm", "--")],
+        )
+        self.assertTrue(mock_karma_modify_plugin.return_value.run.called)
+
     def test_invalid_parse_suffix_command(self):
         """Test parse_suffix_command method when invalid."""
         evt = self.mock_event
@@ -194,15 +223,38 @@ class SlackHandlerUnitTests(BaseTest):
             "team_id": "T1N7FEJHE",
         }
 
+    def test_handlers_share_one_pooled_client(self):
+        """Every SlackHandler in a process uses the same Slack client."""
+        first, second = SlackHandler(), SlackHandler()
+
+        self.assertIs(first.slack, second.slack)
+
+        adapter = first.slack.chat.session.get_adapter("https://slack.com")
+        self.assertEqual(
+            slack.app.config["SLACK_POOL_SIZE"],
+            adapter._pool_maxsize
+        )
+
+    def test_forked_process_gets_its_own_client(self):
+        """A new process id means a new client and session."""
+        client = slack.get_slack_client()
+
+        with mock.patch.object(slack.os, "getpid", return_value=-1):
+            self.assertIsNot(client, slack.get_slack_client())
+
     def test_vocal_make_post(self):
         """Test that vocal switch works."""
         mock_func = mock.Mock(name="mock_func")
         handler = SlackHandler()
 
         with mock.patch.object(handler.slack.chat, "post_message", mock_func):
-            handler.vocal = True
-            message = "Prove to me that you work."
-            handler.make_post(self.mock_event, message)
+            with mock.patch.dict(
+                slack.app.config,
+                {"SLACK_OUTBOUND_QUEUE": False},
+            ):
+                handler.vocal = True
+                message = "Prove to me that you work."
+                handler.make_post(self.mock_event, message)
 
             mock_func.assert_called_with(
                 self.mock_event['channel'],
@@ -210,32 +262,111 @@ class SlackHandlerUnitTests(BaseTest):
                 as_user=True
             )
 
+    def test_queued_make_post(self):
+        """With the outbound queue on, posts are queued, not sent inline."""
+        handler = SlackHandler()
+        handler.vocal = True
+        message = "Prove to me that you work."
+
+        with mock.patch.object(slack, "outbound_queue") as mock_queue:
+            with mock.patch.dict(
+                slack.app.config,
+                {"SLACK_OUTBOUND_QUEUE": True},
+            ):
+                handler.make_post(self.mock_event, message)
+
+            mock_queue.put.assert_called_with(
+                self.mock_event['channel'],
+                message,
+                team_id=self.mock_event['team_id'],
+                thread_ts=None,
+            )
+
+    def test_threaded_make_post(self):
+        """A reply to a threaded message is posted to the thread."""
+        mock_func = mock.Mock(name="mock_func")
+        handler = SlackHandler()
+        handler.vocal = True
+        self.mock_event["thread_ts"] = "1472164000.000001"
+
+        with mock.patch.object(handler.slack.chat, "post_message", mock_func):
+            with mock.patch.dict(
+                slack.app.config,
+                {"SLACK_OUTBOUND_QUEUE": False},
+            ):
+                handler.make_post(self.mock_event, "in the thread")
+
+        mock_func.assert_called_with(
+            self.mock_event['channel'],
+            "in the thread",
+            as_user=True,
+            thread_ts="1472164000.000001",
+        )
+
+    def test_queued_replies_keep_their_threads(self):
+        """Queued replies to different threads aren't merged."""
+        sent = []
+        queue = OutboundQueue(
+            lambda message: sent.append((message.thread_ts, message.text)),
+            coalesce_window=0.05,
+        )
+        handler = SlackHandler()
+        handler.vocal = True
+
+        with mock.patch.object(slack, "outbound_queue", queue):
+            with mock.patch.dict(
+                slack.app.config,
+                {"SLACK_OUTBOUND_QUEUE": True},
+            ):
+                for thread_ts, text in (
+                    ("1.0", "one"),
+                    ("1.0", "two"),
+                    ("2.0", "three"),
+                    (None, "four"),
+                ):
+                    event = dict(self.mock_event)
+                    if thread_ts:
+                        event["thread_ts"] = thread_ts
+                    handler.make_post(event, text)
+
+        self.assertTrue(queue.drain(timeout=5))
+        self.assertEqual(
+            [("1.0", "one\ntwo"), ("2.0", "three"), (None, "four")],
+            sent
+        )
+
     def test_silent_make_post(self):
         """Test that vocal switch works."""
-        mock_eprint = mock.MagicMock()
+        mock_log = mock.MagicMock()
         handler = SlackHandler()
         handler.vocal = False
         message = "Prove to me that you work."
 
-        with mock.patch.object(handler, "eprint", mock_eprint):
+        with mock.patch.object(handler, "log", mock_log):
             handler.make_post(self.mock_event, message)
 
-            mock_eprint.assert_called_with(
-                "Message that would have been sent to Slack:\n\n{}\n".format(
-                    message
-                )
+            mock_log.info.assert_called_with(
+                "message that would have been sent to Slack",
+                extra={"fields": {
+                    "channel": self.mock_event['channel'],
+                    "message": message,
+                }},
             )
 
     def test_vocal_get_userid_from_name(self):
         """Test that a Slack ID is returned from a username."""
         mock_func = mock.Mock(name="mock_func")
+        mock_func.return_value = [{"id": "U123", "name": "literally anything"}]
         handler = SlackHandler()
         handler.vocal = True
 
-        with mock.patch.object(handler.slack.users, "get_user_id", mock_func):
-            username = "literally anything"
-            handler.get_userid_from_name(username)
-            mock_func.assert_called_with(username)
+        with mock.patch.object(SlackHandler, "_fetch_users_list", mock_func):
+            self.assertEqual(
+                "U123",
+                handler.get_userid_from_name("literally anything")
+            )
+            self.assertIsNone(handler.get_userid_from_name("nobody"))
+            self.assertEqual(1, mock_func.call_count)
 
     def test_silent_get_userid_from_name(self):
         """Test that a Slack ID is returned from a username."""
@@ -256,7 +387,7 @@ class SlackHandlerUnitTests(BaseTest):
                 handler.get_username_from_id(slack_id),
                 "A_SLACK_USERNAME"
             )
-            mock_func.assert_called_with(slack_id)
+            mock_func.assert_called_with(slack_id, None)
 
     def test_vocal_get_username_from_id_when_no_user_found(self):
         """Test that a Slack username is returned from an ID."""
@@ -270,7 +401,7 @@ class SlackHandlerUnitTests(BaseTest):
                 handler.get_username_from_id(slack_id),
                 None
             )
-            mock_func.assert_called_with(slack_id)
+            mock_func.assert_called_with(slack_id, None)
 
     def test_silent_get_username_from_id(self):
         """Test that a Slack username is returned from an ID."""
@@ -279,6 +410,15 @@ class SlackHandlerUnitTests(BaseTest):
         slack_id = "000111000"
         self.assertIsNone(handler.get_username_from_id(slack_id))
 
+    def test_user_directory_fetches_the_team(self):
+        """The user directory asks Slack for the team being looked up."""
+        mock_func = mock.MagicMock(return_value=[])
+
+        with mock.patch.object(SlackHandler, "_fetch_users_list", mock_func):
+            slack._fetch_members("T1")
+
+        mock_func.assert_called_with("T1")
+
     def test_get_user_obj_from_id(self):
         """Test that function properly parses a Slack member dict."""
         mock_func = mock.MagicMock()
@@ -305,7 +445,7 @@ class SlackHandlerUnitTests(BaseTest):
         handler = SlackHandler()
         slack_id = "000111000"
 
-        with mock.patch.object(handler, "_fetch_users_list", mock_func):
+        with mock.patch.object(SlackHandler, "_fetch_users_list", mock_func):
             self.assertEqual(
                 handler.get_user_obj_from_id(slack_id),
                 {
@@ -317,4 +457,4 @@ class SlackHandlerUnitTests(BaseTest):
                     'other_shit': True,
                 }
             )
-            mock_func.assert_called_with()
+            mock_func.assert_called_with(None)
@@ -42,3 +42,22 @@ class HelpPluginUnitTests(BaseTest):
 
                 self.assertFalse(mock_external_plugin.called)
                 self.assertTrue(mock_help_method.called)
+
+    def test_help_text_lists_registered_commands(self):
+        """Every registered bang command is listed as a topic."""
+        plugin = HelpPlugin(mock.MagicMock(), "")
+
+        with mock.patch.object(plugin, "help_topics", {'b': 1, 'a': 2}):
+            self.assertEqual(
+                "```\n"
+                "available help topics:\n"
+                "    a\n"
+                "    b\n"
+                "\n"
+                "Try `!help [topic]` for information on a specific topic.\n"
+                "```",
+                plugin.help_text
+            )
+
+        for topic in ("help", "karma_top", "log", "attr"):
+            self.assertIn("\n    {}\n".format(topic), plugin.help_text)
@@ -4,6 +4,8 @@
 from dungeonbot.conftest import BaseTest
 
 from dungeonbot.models.karma import KarmaModel
+from dungeonbot.plugins import karma
+from dungeonbot.plugins.helpers.karma_batcher import KarmaBatcher
 from dungeonbot.plugins.karma import (
     KarmaAssistant,
     KarmaModifyPlugin,
@@ -14,6 +16,7 @@ from dungeonbot.plugins.karma import (
 )
 
 from datetime import datetime
+from sqlalchemy.exc import IntegrityError
 from unittest import mock
 
 
@@ -119,6 +122,54 @@ class KarmaModelUnitTests(BaseTest):
         self.assertEqual(3, session.query(KarmaModel).first().downvotes)
         self.assertEqual(1, session.query(KarmaModel).first().karma)
 
+    def test_classmethod_upsert(self):
+        """Assert that KarmaModel.upsert() creates, then adds to, an entry."""
+        session = self.db.session
+
+        row = KarmaModel.upsert(string_id="upserted", upvotes=1)
+        self.assertEqual((1, 0, 1), (row.upvotes, row.downvotes, row.karma))
+
+        row = KarmaModel.upsert(string_id="upserted", upvotes=2, downvotes=4)
+        self.assertEqual((3, 4, -1), (row.upvotes, row.downvotes, row.karma))
+
+        self.assertEqual(1, session.query(KarmaModel).count())
+        self.assertEqual(row.id, KarmaModel.get_by_name("upserted").id)
+
+    def test_upsert_onto_null_counts(self):
+        """Assert that upsert() counts NULL votes on an entry as 0."""
+        session = self.db.session
+        session.add(KarmaModel(string_id="unset"))
+        session.commit()
+
+        row = KarmaModel.upsert(string_id="unset", upvotes=2, downvotes=1)
+        self.assertEqual((2, 1, 1), (row.upvotes, row.downvotes, row.karma))
+
+    def test_string_id_is_unique(self):
+        """Assert that two entries can't share a string_id."""
+        self._populate_db([self.test_model_0])
+
+        with self.assertRaises(IntegrityError):
+            self._populate_db([self.test_model_0])
+
+    def test_classmethod_apply_deltas(self):
+        """Assert that KarmaModel.apply_deltas() functions properly."""
+        self._populate_db([self.test_model_1])
+
+        KarmaModel.apply_deltas({
+            self.test_model_1["name"]: (2, 1),
+            "a brand new subject": (0, 3),
+        })
+
+        existing = KarmaModel.get_by_name(self.test_model_1["name"])
+        self.assertEqual(5, existing.upvotes)
+        self.assertEqual(2, existing.downvotes)
+        self.assertEqual(3, existing.karma)
+
+        new = KarmaModel.get_by_name("a brand new subject")
+        self.assertEqual(0, new.upvotes)
+        self.assertEqual(3, new.downvotes)
+        self.assertEqual(-3, new.karma)
+
     def test_classmethod_get_by_name(self):
         """Assert that KarmaModel.get_by_name() functions properly."""
         self._populate_db([self.test_model_0, self.test_model_1])
@@ -449,6 +500,29 @@ class KarmaAssistantUnitTests(BaseTest):
 
             self.assertIsNone(userid)
 
+    def test_usernames_for(self):
+        """Assert usernames_for() maps only same-team user IDs."""
+        mock_handler = mock.MagicMock(name="MockSlackHandler")
+        mock_handler.get_users_from_ids.return_value = {
+            "U1": {"name": "alice", "team_id": "SOME TEAM ID"},
+            "U2": {"name": "mallory", "team_id": "OTHER TEAM ID"},
+        }
+
+        fake_event = {
+            "team_id": "SOME TEAM ID",
+        }
+
+        ka = KarmaAssistant()
+
+        with mock.patch.object(ka, "bot", mock_handler):
+            usernames = ka.usernames_for(fake_event, ["U1", "U2", "pizza"])
+
+        self.assertEqual({"U1": "alice"}, usernames)
+        mock_handler.get_users_from_ids.assert_called_once_with(
+            ["U1", "U2", "pizza"],
+            "SOME TEAM ID",
+        )
+
 
 class KarmaModifyPluginUnitTests(BaseTest):
     """Tests for the KarmaModifyPlugin."""
@@ -457,6 +531,8 @@ class KarmaModifyPluginUnitTests(BaseTest):
         """Configure."""
         super().setUp()
 
+        self.event = {"user": "U1", "channel": "C1", "team_id": "T1"}
+
         KarmaModel.new(
             string_id="some existing string",
             upvotes=1,
@@ -475,7 +551,7 @@ class KarmaModifyPluginUnitTests(BaseTest):
         mock_assistant.check_if_correlates_to_userid.return_value = None
 
         plugin = KarmaModifyPlugin()
-        plugin.event = mock.MagicMock()
+        plugin.event = self.event
         plugin.arg_string = "some new string"
         plugin.suffix = "++"
 
@@ -497,7 +573,7 @@ class KarmaModifyPluginUnitTests(BaseTest):
         mock_assistant.check_if_correlates_to_userid.return_value = None
 
         plugin = KarmaModifyPlugin()
-        plugin.event = mock.MagicMock()
+        plugin.event = self.event
         plugin.arg_string = "some new string"
         plugin.suffix = "--"
 
@@ -519,7 +595,7 @@ class KarmaModifyPluginUnitTests(BaseTest):
         mock_assistant.check_if_correlates_to_userid.return_value = None
 
         plugin = KarmaModifyPlugin()
-        plugin.event = mock.MagicMock()
+        plugin.event = self.event
         plugin.arg_string = "some existing string"
         plugin.suffix = "++"
 
@@ -540,7 +616,7 @@ class KarmaModifyPluginUnitTests(BaseTest):
         mock_assistant.check_if_correlates_to_userid.return_value = None
 
         plugin = KarmaModifyPlugin()
-        plugin.event = mock.MagicMock()
+        plugin.event = self.event
         plugin.arg_string = "some existing string"
         plugin.suffix = "--"
 
@@ -562,7 +638,7 @@ class KarmaModifyPluginUnitTests(BaseTest):
             "some new slack id"
 
         plugin = KarmaModifyPlugin()
-        plugin.event = mock.MagicMock()
+        plugin.event = self.event
         plugin.arg_string = "some slack username"
         plugin.suffix = "++"
 
@@ -584,7 +660,7 @@ class KarmaModifyPluginUnitTests(BaseTest):
             "some new slack id"
 
         plugin = KarmaModifyPlugin()
-        plugin.event = mock.MagicMock()
+        plugin.event = self.event
         plugin.arg_string = "some slack username"
         plugin.suffix = "--"
 
@@ -606,7 +682,7 @@ class KarmaModifyPluginUnitTests(BaseTest):
             "some existing slack id"
 
         plugin = KarmaModifyPlugin()
-        plugin.event = mock.MagicMock()
+        plugin.event = self.event
         plugin.arg_string = "some slack username"
         plugin.suffix = "++"
 
@@ -628,7 +704,7 @@ class KarmaModifyPluginUnitTests(BaseTest):
             "some existing slack id"
 
         plugin = KarmaModifyPlugin()
-        plugin.event = mock.MagicMock()
+        plugin.event = self.event
         plugin.arg_string = "some slack username"
         plugin.suffix = "--"
 
@@ -643,6 +719,108 @@ class KarmaModifyPluginUnitTests(BaseTest):
         newest = KarmaModel.list_newest()
         self.assertEqual(2, len(newest))
 
+    def test_batched_votes(self):
+        """With batching on, votes are committed through the batcher."""
+        mock_assistant = mock.MagicMock()
+        mock_assistant.check_if_correlates_to_userid.return_value = None
+        batcher = KarmaBatcher(window=0.01)
+
+        plugin = KarmaModifyPlugin()
+        plugin.event = self.event
+        plugin.arg_string = "some existing string"
+        plugin.suffix = "++"
+
+        with mock.patch.dict(self.app.config, KARMA_BATCH_WINDOW_MS=10):
+            with mock.patch.object(karma, "karma_batcher", batcher):
+                with mock.patch.object(plugin, "ka", mock_assistant):
+                    plugin.run()
+
+        self.db.session.expire_all()
+        model = KarmaModel.get_by_name("some existing string")
+        self.assertEqual(2, model.upvotes)
+        self.assertEqual(1, batcher.counters["batches"])
+
+    def test_single_vote_reply(self):
+        """A single change gets the same kind of reply as several."""
+        mock_assistant = mock.MagicMock()
+        mock_assistant.check_if_correlates_to_userid.return_value = None
+        mock_assistant.usernames_for.return_value = {}
+        mock_bot = mock.MagicMock()
+
+        plugin = KarmaModifyPlugin(self.event, "some existing string", "--")
+
+        with mock.patch.object(plugin, "ka", mock_assistant):
+            with mock.patch.object(plugin, "bot", mock_bot):
+                plugin.run()
+
+        mock_bot.make_post.assert_called_once_with(
+            self.event,
+            "*some existing string* has *0* karma _(1 ++, 1 --)_"
+        )
+
+    def test_several_votes_in_one_message(self):
+        """Every change is applied in one transaction, with one reply."""
+        mock_assistant = mock.MagicMock()
+        mock_assistant.check_if_correlates_to_userid.return_value = None
+        mock_assistant.usernames_for.return_value = {"U2": "bob"}
+        mock_bot = mock.MagicMock()
+
+        plugin = KarmaModifyPlugin(self.event, ops=[
+            ("some existing string", "++"),
+            ("U2", "++"),
+            ("some existing string", "++"),
+            ("brand new", "--"),
+        ])
+
+        with mock.patch.object(plugin, "ka", mock_assistant):
+            with mock.patch.object(plugin, "bot", mock_bot):
+                with mock.patch.object(
+                    KarmaModel,
+                    "apply_deltas",
+                    wraps=KarmaModel.apply_deltas,
+                ) as apply_deltas:
+                    plugin.run()
+
+        self.assertEqual(1, apply_deltas.call_count)
+        self.assertEqual(
+            3,
+            KarmaModel.get_by_name("some existing string").karma
+        )
+        self.assertEqual(-1, KarmaModel.get_by_name("brand new").karma)
+
+        mock_bot.make_post.assert_called_once_with(
+            self.event,
+            "*some existing string* has *3* karma _(3 ++, 0 --)_\n"
+            "*bob* has *1* karma _(1 ++, 0 --)_\n"
+            "*brand new* has *-1* karma _(0 ++, 1 --)_"
+        )
+
+    def test_several_batched_votes(self):
+        """With batching on, a message's changes share one batch."""
+        mock_assistant = mock.MagicMock()
+        mock_assistant.check_if_correlates_to_userid.return_value = None
+        mock_assistant.usernames_for.return_value = {}
+        mock_bot = mock.MagicMock()
+        batcher = KarmaBatcher(window=0.01)
+
+        plugin = KarmaModifyPlugin(self.event, ops=[
+            ("some existing string", "--"),
+            ("brand new", "++"),
+        ])
+
+        with mock.patch.dict(self.app.config, KARMA_BATCH_WINDOW_MS=10):
+            with mock.patch.object(karma, "karma_batcher", batcher):
+                with mock.patch.object(plugin, "ka", mock_assistant):
+                    with mock.patch.object(plugin, "bot", mock_bot):
+                        plugin.run()
+
+        self.assertEqual(1, batcher.counters["batches"])
+        mock_bot.make_post.assert_called_once_with(
+            self.event,
+            "*some existing string* has *0* karma _(1 ++, 1 --)_\n"
+            "*brand new* has *1* karma _(1 ++, 0 --)_"
+        )
+
 
 class KarmaPluginUnitTests(BaseTest):
     """Tests for the KarmaPlugin."""
@@ -708,6 +886,37 @@ class KarmaPluginUnitTests(BaseTest):
                     )
                 )
 
+    def test_unflushed_karma_is_counted(self):
+        """Assert that karma still in the write-behind batcher is shown."""
+        mock_bot = mock.MagicMock()
+        mock_ka = mock.MagicMock()
+        mock_ka.check_if_correlates_to_userid.return_value = None
+        mock_ka.check_if_correlates_to_username.return_value = None
+        batcher = KarmaBatcher(window=60, write_behind=True)
+        batcher.add("some karma entry", 2, 0)
+        batcher.add("not written yet", 0, 1)
+
+        event = mock.MagicMock()
+
+        with mock.patch.object(karma, "karma_batcher", batcher):
+            for arg_string, expected in (
+                ("some karma entry", (3, 4, 1)),
+                ("not written yet", (-1, 0, 1)),
+            ):
+                plugin = KarmaPlugin(event, arg_string)
+
+                with mock.patch.object(plugin, "bot", mock_bot):
+                    with mock.patch.object(plugin, "ka", mock_ka):
+                        plugin.run()
+
+                mock_bot.make_post.assert_called_with(
+                    event,
+                    "*{}* has *{}* karma _({} ++, {} --)_".format(
+                        arg_string,
+                        *expected
+                    )
+                )
+
     def test_target_entry_correlates_to_slack_user_id(self):
         """."""
         mock_bot = mock.MagicMock()
@@ -817,7 +1026,7 @@ class KarmaNewestPluginUnitTests(BaseTest):
         """Call run() with an empty arg_string."""
         mock_bot = mock.MagicMock()
         mock_ka = mock.MagicMock()
-        mock_ka.check_if_correlates_to_username.return_value = None
+        mock_ka.usernames_for.return_value = {}
         event = mock.MagicMock()
         arg_string = None
         plugin = KarmaNewestPlugin(event, arg_string)
@@ -844,7 +1053,7 @@ class KarmaNewestPluginUnitTests(BaseTest):
         """Default is 5 - try calling with not-5."""
         mock_bot = mock.MagicMock()
         mock_ka = mock.MagicMock()
-        mock_ka.check_if_correlates_to_username.return_value = None
+        mock_ka.usernames_for.return_value = {}
         event = mock.MagicMock()
         arg_string = 7
         plugin = KarmaNewestPlugin(event, arg_string)
@@ -871,7 +1080,7 @@ class KarmaNewestPluginUnitTests(BaseTest):
         """There are 11 entries. Call for more, should only get 11."""
         mock_bot = mock.MagicMock()
         mock_ka = mock.MagicMock()
-        mock_ka.check_if_correlates_to_username.return_value = None
+        mock_ka.usernames_for.return_value = {}
         event = mock.MagicMock()
         arg_string = 70
         plugin = KarmaNewestPlugin(event, arg_string)
@@ -897,7 +1106,9 @@ class KarmaNewestPluginUnitTests(BaseTest):
         """There are 11 entries. Call for more, should only get 11."""
         mock_bot = mock.MagicMock()
         mock_ka = mock.MagicMock()
-        mock_ka.check_if_correlates_to_username.return_value = "some username"
+        mock_ka.usernames_for.side_effect = lambda event, ids: {
+            string_id: "some username" for string_id in ids
+        }
         event = mock.MagicMock()
         arg_string = None
         plugin = KarmaNewestPlugin(event, arg_string)
@@ -977,7 +1188,7 @@ class KarmaTopPluginUnitTests(BaseTest):
         """Call run() with an empty arg_string."""
         mock_bot = mock.MagicMock()
         mock_ka = mock.MagicMock()
-        mock_ka.check_if_correlates_to_username.return_value = None
+        mock_ka.usernames_for.return_value = {}
         event = mock.MagicMock()
         arg_string = None
         plugin = KarmaTopPlugin(event, arg_string)
@@ -1004,7 +1215,7 @@ class KarmaTopPluginUnitTests(BaseTest):
         """Default is 5 - try calling with not-5."""
         mock_bot = mock.MagicMock()
         mock_ka = mock.MagicMock()
-        mock_ka.check_if_correlates_to_username.return_value = None
+        mock_ka.usernames_for.return_value = {}
         event = mock.MagicMock()
         arg_string = 7
         plugin = KarmaTopPlugin(event, arg_string)
@@ -1031,7 +1242,7 @@ class KarmaTopPluginUnitTests(BaseTest):
         """There are 11 entries. Call for more, should only get 11."""
         mock_bot = mock.MagicMock()
         mock_ka = mock.MagicMock()
-        mock_ka.check_if_correlates_to_username.return_value = None
+        mock_ka.usernames_for.return_value = {}
         event = mock.MagicMock()
         arg_string = 70
         plugin = KarmaTopPlugin(event, arg_string)
@@ -1057,7 +1268,9 @@ class KarmaTopPluginUnitTests(BaseTest):
         """There are 11 entries. Call for more, should only get 11."""
         mock_bot = mock.MagicMock()
         mock_ka = mock.MagicMock()
-        mock_ka.check_if_correlates_to_username.return_value = "some username"
+        mock_ka.usernames_for.side_effect = lambda event, ids: {
+            string_id: "some username" for string_id in ids
+        }
         event = mock.MagicMock()
         arg_string = None
         plugin = KarmaTopPlugin(event, arg_string)
@@ -1137,7 +1350,7 @@ class KarmaBottomPluginUnitTests(BaseTest):
         """Call run() with an empty arg_string."""
         mock_bot = mock.MagicMock()
         mock_ka = mock.MagicMock()
-        mock_ka.check_if_correlates_to_username.return_value = None
+        mock_ka.usernames_for.return_value = {}
         event = mock.MagicMock()
         arg_string = None
         plugin = KarmaBottomPlugin(event, arg_string)
@@ -1164,7 +1377,7 @@ class KarmaBottomPluginUnitTests(BaseTest):
         """Default is 5 - try calling with not-5."""
         mock_bot = mock.MagicMock()
         mock_ka = mock.MagicMock()
-        mock_ka.check_if_correlates_to_username.return_value = None
+        mock_ka.usernames_for.return_value = {}
         event = mock.MagicMock()
         arg_string = 7
         plugin = KarmaBottomPlugin(event, arg_string)
@@ -1191,7 +1404,7 @@ class KarmaBottomPluginUnitTests(BaseTest):
         """There are 11 entries. Call for more, should only get 11."""
         mock_bot = mock.MagicMock()
         mock_ka = mock.MagicMock()
-        mock_ka.check_if_correlates_to_username.return_value = None
+        mock_ka.usernames_for.return_value = {}
         event = mock.MagicMock()
         arg_string = 70
         plugin = KarmaBottomPlugin(event, arg_string)
@@ -1217,7 +1430,9 @@ class KarmaBottomPluginUnitTests(BaseTest):
         """There are 11 entries. Call for more, should only get 11."""
         mock_bot = mock.MagicMock()
         mock_ka = mock.MagicMock()
-        mock_ka.check_if_correlates_to_username.return_value = "some username"
+        mock_ka.usernames_for.side_effect = lambda event, ids: {
+            string_id: "some username" for string_id in ids
+        }
         event = mock.MagicMock()
         arg_string = None
         plugin = KarmaBottomPlugin(event, arg_string)
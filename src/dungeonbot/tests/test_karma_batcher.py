@@ -0,0 +1,151 @@
+"""Tests for the KarmaBatcher."""
+
+
+from dungeonbot.conftest import BaseTest
+
+from dungeonbot.models.karma import KarmaModel
+from dungeonbot.plugins.helpers import karma_batcher
+from dungeonbot.plugins.helpers.karma_batcher import KarmaBatcher
+
+from unittest import mock
+
+import threading
+
+
+class KarmaBatcherUnitTests(BaseTest):
+    """Tests for the KarmaBatcher."""
+
+    def test_concurrent_changes_share_one_commit(self):
+        """Changes arriving inside the window are committed together."""
+        batcher = KarmaBatcher(window=0.2)
+        batches = []
+
+        def vote(subject, up, down):
+            batches.append(batcher.add(subject, up, down))
+
+        threads = [
+            threading.Thread(target=vote, args=("foo", 1, 0))
+            for _ in range(20)
+        ] + [
+            threading.Thread(target=vote, args=("bar", 0, 1))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for batch in batches:
+            batch.wait()
+
+        foo = KarmaModel.get_by_name("foo")
+        bar = KarmaModel.get_by_name("bar")
+
+        self.assertEqual((20, 0, 20), (foo.upvotes, foo.downvotes, foo.karma))
+        self.assertEqual((0, 5, -5), (bar.upvotes, bar.downvotes, bar.karma))
+        self.assertEqual(1, batcher.counters["batches"])
+        self.assertEqual(25, batcher.counters["changes"])
+
+    def test_full_batch_flushes_early(self):
+        """A batch at max_batch is committed without waiting the window."""
+        batcher = KarmaBatcher(window=60, max_batch=2)
+
+        batcher.add("foo", 1, 0)
+        batch = batcher.add("foo", 1, 0)
+
+        self.assertTrue(batch.done.wait(5))
+        self.assertEqual(2, KarmaModel.get_by_name("foo").upvotes)
+
+    def test_failed_commit_is_reported(self):
+        """Waiters see the error if the batch couldn't be committed."""
+        batcher = KarmaBatcher(window=0.01)
+        error = RuntimeError("db went away")
+
+        with mock.patch.object(KarmaModel, "apply_deltas",
+                               side_effect=error):
+            batch = batcher.add("foo", 1, 0)
+
+            with self.assertRaises(RuntimeError):
+                batch.wait()
+
+    def test_write_behind_pending_and_flush(self):
+        """Unflushed changes are visible through pending() until written."""
+        batcher = KarmaBatcher(window=60, write_behind=True)
+
+        batcher.add("foo", 1, 0)
+        batcher.add("foo", 1, 0)
+        batcher.add("foo", 0, 1)
+
+        self.assertEqual((2, 1), batcher.pending("foo"))
+        self.assertEqual((0, 0), batcher.pending("bar"))
+        self.assertIsNone(KarmaModel.get_by_name("foo"))
+
+        batcher.flush()
+
+        self.assertEqual((0, 0), batcher.pending("foo"))
+        self.assertEqual(1, KarmaModel.get_by_name("foo").karma)
+
+    def test_write_behind_failed_flush_is_retried(self):
+        """A batch that couldn't be written is kept for the next flush."""
+        batcher = KarmaBatcher(window=60, write_behind=True)
+        error = RuntimeError("db went away")
+
+        batcher.add("foo", 1, 0)
+
+        with mock.patch.object(karma_batcher, "log") as log:
+            with mock.patch.object(KarmaModel, "apply_deltas",
+                                   side_effect=error):
+                batcher.flush()
+
+        self.assertTrue(log.error.called)
+        self.assertEqual((1, 0), batcher.pending("foo"))
+        self.assertEqual(1, batcher.counters["failures"])
+
+        batcher.flush()
+
+        self.assertEqual(1, KarmaModel.get_by_name("foo").upvotes)
+
+    def test_leaderboard_failure_doesnt_requeue(self):
+        """A batch is never written twice, even if the leaderboard fails."""
+        batcher = KarmaBatcher(window=60, write_behind=True)
+        batcher.add("foo", 1, 0)
+
+        with mock.patch.object(karma_batcher, "log") as log:
+            with mock.patch.object(karma_batcher.leaderboard, "update",
+                                   side_effect=RuntimeError("oops")):
+                batcher.flush()
+
+        self.assertTrue(log.exception.called)
+        self.assertEqual((0, 0), batcher.pending("foo"))
+        self.assertEqual(0, batcher.counters["failures"])
+
+        batcher.flush()
+
+        self.assertEqual(1, KarmaModel.get_by_name("foo").upvotes)
+
+    def test_reads_wait_for_a_flush_in_progress(self):
+        """A read during a flush sees the changes once: as committed."""
+        batcher = KarmaBatcher(window=60, write_behind=True)
+        batcher.add("foo", 1, 0)
+        apply_deltas = KarmaModel.apply_deltas
+        results = []
+
+        def read():
+            results.append(batcher.read_with_pending(
+                lambda: "stored",
+                ["foo"],
+            ))
+
+        def slow_apply_deltas(*args, **kwargs):
+            reader.start()
+            reader.join(timeout=0.1)
+            self.assertTrue(reader.is_alive())
+            return apply_deltas(*args, **kwargs)
+
+        reader = threading.Thread(target=read)
+
+        with mock.patch.object(KarmaModel, "apply_deltas",
+                               side_effect=slow_apply_deltas):
+            batcher.flush()
+
+        reader.join()
+        self.assertEqual([("stored", {"foo": (0, 0)})], results)
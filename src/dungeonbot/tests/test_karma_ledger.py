@@ -0,0 +1,142 @@
+"""Tests for the karma ledger and its rollups."""
+
+
+from dungeonbot.conftest import BaseTest
+
+from dungeonbot.models.karma import KarmaModel
+from dungeonbot.models.karma_ledger import (
+    DAY,
+    HOUR,
+    KarmaEventModel,
+    KarmaRollupModel,
+)
+from dungeonbot.plugins.karma import KarmaModifyPlugin, KarmaTopPlugin
+
+from datetime import datetime, timedelta
+from unittest import mock
+
+
+class KarmaLedgerUnitTests(BaseTest):
+    """Tests for KarmaEventModel and KarmaRollupModel."""
+
+    def vote(self, string_id, delta, ago, giver="U1"):
+        """Record a vote made `ago` (a timedelta) before now."""
+        KarmaModel.upsert(
+            string_id=string_id,
+            upvotes=max(delta, 0),
+            downvotes=max(-delta, 0),
+            votes=[KarmaEventModel.vote(
+                string_id,
+                delta,
+                giver=giver,
+                channel="C1",
+                created=datetime.utcnow() - ago,
+            )],
+        )
+
+    def test_votes_are_rolled_up(self):
+        """Each vote lands in the ledger and in its hour and day."""
+        for _ in range(3):
+            self.vote("pizza", 1, timedelta(0))
+        self.vote("pizza", -1, timedelta(0), giver="U2")
+
+        self.assertEqual(4, len(KarmaEventModel.list_for(string_id="pizza")))
+        self.assertEqual(1, len(KarmaEventModel.list_for(giver="U2")))
+
+        for period in (HOUR, DAY):
+            rollup = self.db.session.query(KarmaRollupModel).filter_by(
+                period=period,
+                string_id="pizza",
+            ).one()
+            self.assertEqual(
+                (3, 1, 2),
+                (rollup.upvotes, rollup.downvotes, rollup.karma)
+            )
+
+    def test_list_window(self):
+        """Windowed leaderboards only count votes inside the window."""
+        self.vote("recent", 1, timedelta(minutes=1))
+        self.vote("recent", 1, timedelta(minutes=1))
+        self.vote("this week", 1, timedelta(days=3))
+        self.vote("this week", 1, timedelta(days=3))
+        self.vote("this week", 1, timedelta(days=3))
+        self.vote("last year", 1, timedelta(days=100))
+        self.vote("booed", -1, timedelta(hours=2))
+
+        def names(rows):
+            return [row.string_id for row in rows]
+
+        self.assertEqual(
+            ["recent", "booed"],
+            names(KarmaRollupModel.list_window("day", 5))
+        )
+        self.assertEqual(
+            ["this week", "recent", "booed"],
+            names(KarmaRollupModel.list_window("week", 5))
+        )
+        self.assertEqual(
+            ["booed", "recent"],
+            names(KarmaRollupModel.list_window("week", 2, lowest=True))
+        )
+        self.assertEqual(
+            4,
+            len(KarmaRollupModel.list_window("year", 5))
+        )
+
+    def test_window_includes_its_earliest_bucket(self):
+        """A vote less than a window ago always counts in that window."""
+        self.vote("just in", 1, timedelta(minutes=59))
+        self.vote("too old", 1, timedelta(hours=2, minutes=1))
+
+        self.assertEqual(
+            ["just in"],
+            [row.string_id for row in KarmaRollupModel.list_window("hour")]
+        )
+
+    def test_compact(self):
+        """Old ledger rows and hourly rollups are deleted, days are kept."""
+        self.vote("old", 1, timedelta(days=40))
+        self.vote("new", 1, timedelta(minutes=1))
+
+        self.assertEqual((1, 1), KarmaEventModel.compact(
+            ledger_days=30,
+            hourly_days=14,
+        ))
+
+        self.assertEqual(["new"], [
+            row.string_id for row in KarmaEventModel.list_for()
+        ])
+        self.assertEqual(
+            ["new", "old"],
+            [row.string_id for row in
+             KarmaRollupModel.list_window("year", 5)]
+        )
+
+    def test_plugins(self):
+        """++ writes the ledger and !karma_top reads a window from it."""
+        event = {"user": "U1", "channel": "C1", "team_id": "T1"}
+        ka = mock.MagicMock()
+        ka.check_if_correlates_to_userid.return_value = None
+        ka.usernames_for.return_value = {}
+        bot = mock.MagicMock()
+
+        KarmaModel.new(string_id="old favourite", upvotes=50)
+
+        for subject in ("pizza", "pizza", "tacos"):
+            plugin = KarmaModifyPlugin(event, subject, "++")
+            with mock.patch.object(plugin, "ka", ka):
+                plugin.run()
+
+        self.assertEqual("U1", KarmaEventModel.list_for("tacos")[0].giver)
+
+        plugin = KarmaTopPlugin(event, "2 week")
+        with mock.patch.object(plugin, "ka", ka):
+            with mock.patch.object(plugin, "bot", bot):
+                plugin.run()
+
+        bot.make_post.assert_called_with(
+            event,
+            "*The 2 highest-rated karma subjects in the last week:*\n\n"
+            "*pizza* with *2* karma _(2 ++, 0 --)_\n"
+            "*tacos* with *1* karma _(1 ++, 0 --)_\n"
+        )
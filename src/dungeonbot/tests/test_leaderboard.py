@@ -0,0 +1,110 @@
+"""Tests for the in-memory karma leaderboard."""
+
+
+from dungeonbot.conftest import BaseTest
+
+from dungeonbot.models import db
+from dungeonbot.models.karma import KarmaModel
+from dungeonbot.plugins.helpers.leaderboard import KarmaLeaderboard
+
+
+class KarmaLeaderboardUnitTests(BaseTest):
+    """Tests for the KarmaLeaderboard."""
+
+    def setUp(self):
+        """Create ten entries with karma 1 to 10."""
+        super().setUp()
+
+        for karma in range(1, 11):
+            KarmaModel.new(string_id="entry {}".format(karma), upvotes=karma)
+
+        self.board = KarmaLeaderboard(capacity=4, ttl=0)
+
+    def vote(self, string_id, upvotes=0, downvotes=0):
+        """Upsert a change and apply it, like KarmaModifyPlugin does."""
+        self.board.update([KarmaModel.upsert(
+            string_id=string_id,
+            upvotes=upvotes,
+            downvotes=downvotes,
+        )])
+
+    def names(self, entries):
+        """Return the string_ids of some entries."""
+        return [entry.string_id for entry in entries]
+
+    def test_reads_are_served_from_memory(self):
+        """The board loads once, then follows writes without reloading."""
+        self.assertEqual(
+            ["entry 10", "entry 9", "entry 8"],
+            self.names(self.board.highest(3))
+        )
+
+        self.vote("entry 2", upvotes=20)
+        self.vote("brand new", upvotes=9)
+
+        self.assertEqual(
+            ["entry 2", "entry 10", "entry 9", "brand new"],
+            self.names(self.board.highest(4))
+        )
+        self.assertEqual(1, self.board.counters["loads"])
+
+    def test_bottom_board(self):
+        """The lowest entries are kept the same way."""
+        self.assertEqual(
+            ["entry 1", "entry 2"],
+            self.names(self.board.lowest(2))
+        )
+
+        self.vote("entry 1", upvotes=3)
+        self.vote("in the red", downvotes=1)
+
+        self.assertEqual(
+            ["in the red", "entry 2", "entry 3", "entry 1"],
+            self.names(self.board.lowest(4))
+        )
+
+    def test_entry_falling_off_forces_a_reload(self):
+        """An entry dropping out of the board is replaced from the db."""
+        self.board.highest(4)
+
+        self.vote("entry 10", downvotes=20)
+
+        self.assertEqual(
+            ["entry 9", "entry 8", "entry 7", "entry 6"],
+            self.names(self.board.highest(4))
+        )
+        self.assertEqual(2, self.board.counters["loads"])
+
+    def test_out_of_order_updates_are_ignored(self):
+        """An older row for an entry doesn't replace a newer one."""
+        self.board.highest(4)
+        old = KarmaModel.upsert(string_id="entry 9", upvotes=1)
+        new = KarmaModel.upsert(string_id="entry 9", upvotes=5)
+
+        self.board.update([new, old])
+
+        self.assertEqual(15, self.board.highest(1)[0].karma)
+
+    def test_large_requests_go_to_the_db(self):
+        """Asking for more than the capacity reads the database."""
+        self.assertEqual(10, len(self.board.highest(50)))
+        self.assertEqual(0, self.board.counters["held"])
+
+    def test_null_karma_counts_as_zero(self):
+        """Rows with NULL votes and karma rank as 0 instead of crashing."""
+        db.session.add(KarmaModel(string_id="blank"))
+        db.session.commit()
+        self.vote("in the red", downvotes=1)
+
+        self.assertEqual(
+            ["in the red", "blank", "entry 1"],
+            self.names(self.board.lowest(3))
+        )
+        self.assertEqual(0, self.board.lowest(2)[1].karma)
+        self.assertEqual("entry 10", self.board.highest(1)[0].string_id)
+
+        self.board.update([KarmaModel.get_by_name("blank")])
+        self.assertEqual(
+            ["entry 10", "entry 9"],
+            self.names(self.board.highest(2))
+        )
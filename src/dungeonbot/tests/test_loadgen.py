@@ -0,0 +1,48 @@
+"""Tests for the load generator."""
+
+
+from dungeonbot.conftest import BaseTest
+
+from auxiliaries import loadgen
+
+
+class LoadgenUnitTests(BaseTest):
+    """Tests for auxiliaries.loadgen."""
+
+    def test_synthetic_payloads(self):
+        """Synthetic payloads have unique ids and the whole command mix."""
+        payloads = list(loadgen.synthetic_payloads(500, seed=1))
+
+        self.assertEqual(500, len({p["event_id"] for p in payloads}))
+
+        texts = [p["event"]["text"] for p in payloads]
+        for prefix in ("!roll", "!quest", "!karma_top"):
+            self.assertTrue(any(t.startswith(prefix) for t in texts))
+        self.assertTrue(any(t.endswith("++") for t in texts))
+
+    def test_percentile(self):
+        """Percentiles are nearest-rank."""
+        ordered = list(range(1, 101))
+
+        self.assertEqual(50, loadgen.percentile(ordered, 0.50))
+        self.assertEqual(99, loadgen.percentile(ordered, 0.99))
+        self.assertEqual(100, loadgen.percentile(ordered, 1.0))
+        self.assertIsNone(loadgen.percentile([], 0.5))
+
+    def test_run_load(self):
+        """Every payload is sent and statuses and errors are counted."""
+        def send(payload):
+            if payload["event_id"].endswith("7"):
+                raise IOError("connection refused")
+            return 200
+
+        report = loadgen.run_load(
+            loadgen.synthetic_payloads(20, seed=1),
+            send,
+            concurrency=4,
+        )
+
+        self.assertEqual(20, report["requests"])
+        self.assertEqual({"200": 18}, report["statuses"])
+        self.assertEqual({"OSError": 2}, report["errors"])
+        self.assertIsNotNone(report["latency_ms"]["p99"])
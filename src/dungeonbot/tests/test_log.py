@@ -0,0 +1,137 @@
+"""Tests for the structured logging helpers."""
+
+
+from dungeonbot.conftest import BaseTest
+
+from dungeonbot.log import (
+    LogfmtFormatter,
+    QueueingHandler,
+    Sampler,
+    fields,
+    summarize,
+)
+
+from unittest import mock
+
+import logging
+import threading
+
+
+def make_record(msg, *args, **kwargs):
+    """Build a log record carrying `kwargs` as fields."""
+    record = logging.LogRecord(
+        "dungeonbot.test", logging.INFO, __file__, 1, msg, args, None
+    )
+    record.fields = kwargs
+    return record
+
+
+class LogfmtFormatterUnitTests(BaseTest):
+    """Tests for the LogfmtFormatter."""
+
+    def test_format_fields(self):
+        """Fields follow the message as key=value pairs, quoted if needed."""
+        line = LogfmtFormatter().format(
+            make_record("event %s", "accepted", channel="C1", text="!roll 1d6")
+        )
+
+        self.assertIn("level=info", line)
+        self.assertIn('msg="event accepted"', line)
+        self.assertIn("channel=C1", line)
+        self.assertIn('text="!roll 1d6"', line)
+
+    def test_long_values_are_truncated(self):
+        """Values past max_field characters are cut short."""
+        line = LogfmtFormatter(max_field=10).format(
+            make_record("x", text="a" * 50)
+        )
+
+        self.assertIn("text=aaaaaaaaaa...", line)
+        self.assertNotIn("a" * 11, line)
+
+    def test_secrets_are_redacted(self):
+        """Token-like keys never reach the output, even nested."""
+        line = LogfmtFormatter().format(make_record(
+            "x",
+            token="xoxb-secret",
+            payload={"event": {"text": "hi"}, "token": "xoxb-secret"},
+        ))
+
+        self.assertNotIn("xoxb-secret", line)
+        self.assertIn("token=[redacted]", line)
+
+
+class QueueingHandlerUnitTests(BaseTest):
+    """Tests for the QueueingHandler."""
+
+    def test_records_are_written_by_the_background_thread(self):
+        """emit() returns at once; the target sees the record later."""
+        written = threading.Event()
+        target = mock.MagicMock()
+        target.handle.side_effect = lambda record: written.set()
+        handler = QueueingHandler(target)
+
+        handler.emit(make_record("hello %s", "there"))
+
+        self.assertTrue(written.wait(timeout=5))
+        record = target.handle.call_args[0][0]
+        self.assertEqual("hello there", record.getMessage())
+        handler.close()
+
+    def test_full_queue_drops_records(self):
+        """A full queue drops and counts records instead of blocking."""
+        release = threading.Event()
+        target = mock.MagicMock()
+        target.handle.side_effect = lambda record: release.wait(5)
+        handler = QueueingHandler(target, maxsize=1)
+
+        for n in range(10):
+            handler.emit(make_record("record %d", n))
+
+        self.assertGreater(handler.dropped, 0)
+        release.set()
+        handler.close()
+
+    def test_bad_record_is_reported_not_raised(self):
+        """A record that can't be formatted goes to handleError."""
+        target = mock.MagicMock()
+        handler = QueueingHandler(target)
+
+        with mock.patch.object(handler, "handleError") as mock_error:
+            record = make_record("%d apples", "some")
+            handler.emit(record)
+
+        mock_error.assert_called_with(record)
+        handler.close()
+        self.assertFalse(target.handle.called)
+
+
+class LogHelpersUnitTests(BaseTest):
+    """Tests for the summarize, fields and Sampler helpers."""
+
+    def test_summarize_keeps_only_event_fields(self):
+        """summarize() drops keys that aren't worth logging."""
+        event = {
+            "type": "message",
+            "channel": "C1",
+            "text": "hi",
+            "attachments": [{"big": "blob"}],
+        }
+
+        self.assertEqual(
+            {"type": "message", "channel": "C1", "text": "hi"},
+            summarize(event)
+        )
+
+    def test_fields(self):
+        """fields() builds the `extra` dict for a log call."""
+        self.assertEqual({"fields": {"a": 1}}, fields(a=1))
+
+    def test_sampler(self):
+        """A Sampler lets through one call in every `every`."""
+        sample = Sampler(3)
+        self.assertEqual(
+            [True, False, False, True, False, False],
+            [sample() for _ in range(6)]
+        )
+        self.assertTrue(all(Sampler(0)() for _ in range(3)))
@@ -0,0 +1,104 @@
+"""Tests for the metrics module."""
+
+
+from dungeonbot.conftest import BaseTest
+
+from dungeonbot.metrics import (
+    Histogram,
+    StageTimings,
+    command_label,
+    current_command,
+    render_counters,
+    set_command,
+)
+
+
+class HistogramUnitTests(BaseTest):
+    """Tests for the Histogram."""
+
+    def test_observe_and_cumulative(self):
+        """Values land in the first bucket whose bound they don't exceed."""
+        histogram = Histogram(buckets=(0.1, 1.0))
+
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value)
+
+        self.assertEqual(
+            [(0.1, 2), (1.0, 3), (float("inf"), 4)],
+            histogram.cumulative()
+        )
+        self.assertEqual(4, histogram.count)
+        self.assertAlmostEqual(3.65, histogram.sum)
+
+
+class StageTimingsUnitTests(BaseTest):
+    """Tests for StageTimings."""
+
+    def test_render(self):
+        """Histograms render in the Prometheus text format."""
+        timings = StageTimings(buckets=(0.1,))
+        timings.observe("plugin", "roll", 0.05)
+        timings.observe("plugin", "roll", 0.5)
+
+        self.assertEqual(
+            "\n".join([
+                "# HELP dungeonbot_stage_seconds "
+                "Time spent in each stage of handling an event.",
+                "# TYPE dungeonbot_stage_seconds histogram",
+                'dungeonbot_stage_seconds_bucket'
+                '{stage="plugin",command="roll",le="0.1"} 1',
+                'dungeonbot_stage_seconds_bucket'
+                '{stage="plugin",command="roll",le="+Inf"} 2',
+                'dungeonbot_stage_seconds_sum'
+                '{stage="plugin",command="roll"} 0.55',
+                'dungeonbot_stage_seconds_count'
+                '{stage="plugin",command="roll"} 2',
+            ]) + "\n",
+            timings.render()
+        )
+
+    def test_time_uses_thread_command(self):
+        """time() labels with the thread's current command by default."""
+        timings = StageTimings()
+        set_command("quest")
+
+        with timings.time("dispatch"):
+            pass
+
+        self.assertIn('command="quest"', timings.render())
+        self.assertEqual("quest", current_command())
+
+    def test_command_labels_are_bounded(self):
+        """Commands past max_commands are recorded as "other"."""
+        timings = StageTimings(max_commands=1)
+        timings.observe("plugin", "roll", 0.01)
+        timings.observe("plugin", "quest", 0.01)
+
+        rendered = timings.render()
+        self.assertIn('command="roll"', rendered)
+        self.assertIn('command="other"', rendered)
+        self.assertNotIn('command="quest"', rendered)
+
+
+class MetricsHelpersUnitTests(BaseTest):
+    """Tests for the module-level helpers."""
+
+    def test_command_label(self):
+        """Events are labelled by command."""
+        self.assertEqual("roll", command_label({"text": "!roll 1d20"}))
+        self.assertEqual("karma_modify", command_label({"text": "foo++"}))
+        self.assertEqual("none", command_label({"text": "hello"}))
+        self.assertEqual("invalid", command_label({"text": "!R0LL!!"}))
+        self.assertEqual("none", command_label({}))
+
+    def test_render_counters(self):
+        """Counters render as gauges, with nested dicts as labels."""
+        self.assertEqual(
+            "\n".join([
+                "# TYPE x_admitted gauge",
+                "x_admitted 3",
+                "# TYPE x_shed gauge",
+                'x_shed{shed="low"} 1',
+            ]) + "\n",
+            render_counters("x", {"admitted": 3, "shed": {"low": 1}})
+        )
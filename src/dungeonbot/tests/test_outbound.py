@@ -0,0 +1,200 @@
+"""Tests for the OutboundQueue."""
+
+
+from dungeonbot.conftest import BaseTest
+
+from dungeonbot.handlers import outbound
+from dungeonbot.handlers.outbound import OutboundQueue, TokenBucket
+
+from slacker import Error as SlackError
+
+from unittest import mock
+
+import threading
+
+
+class RateLimited(Exception):
+    """Stand-in for the HTTPError raised on a 429 from Slack."""
+
+    def __init__(self, retry_after):
+        """Carry a fake response with a Retry-After header."""
+        super().__init__("429")
+        self.response = mock.Mock(
+            status_code=429,
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+def make_queue(send, **kwargs):
+    """Build an OutboundQueue with limits too loose to slow tests down."""
+    options = dict(
+        channel_rate=1000.0,
+        channel_burst=1000,
+        team_rate=1000.0,
+        team_burst=1000,
+        backoff=0.01,
+    )
+    options.update(kwargs)
+    return OutboundQueue(send, **options)
+
+
+class TokenBucketUnitTests(BaseTest):
+    """Tests for the TokenBucket."""
+
+    def test_burst_then_rate(self):
+        """A full bucket allows `burst` events, then one per 1/rate."""
+        bucket = TokenBucket(rate=2.0, burst=2)
+        now = bucket.updated
+
+        for _ in range(2):
+            self.assertEqual(0, bucket.delay(now))
+            bucket.take()
+
+        self.assertAlmostEqual(0.5, bucket.delay(now))
+        self.assertEqual(0, bucket.delay(now + 0.5))
+
+    def test_pause(self):
+        """A paused bucket gives out no tokens until the pause ends."""
+        bucket = TokenBucket(rate=10.0, burst=10)
+        now = bucket.updated
+
+        bucket.pause(now + 3)
+        self.assertAlmostEqual(3, bucket.delay(now))
+
+
+class OutboundQueueUnitTests(BaseTest):
+    """Tests for the OutboundQueue."""
+
+    def test_messages_sent_in_order_per_channel(self):
+        """Each channel's messages are posted in the order queued."""
+        sent = []
+        queue = make_queue(lambda message: sent.append(
+            (message.channel, message.text)
+        ))
+
+        for n in range(20):
+            queue.put("C{}".format(n % 2), n, team_id="T1")
+
+        self.assertTrue(queue.drain(timeout=5))
+        self.assertEqual(
+            list(range(0, 20, 2)),
+            [text for channel, text in sent if channel == "C0"]
+        )
+        self.assertEqual(
+            list(range(1, 20, 2)),
+            [text for channel, text in sent if channel == "C1"]
+        )
+        self.assertEqual(20, queue.counters["sent"])
+
+    def test_put_returns_before_sending(self):
+        """put() doesn't wait for Slack."""
+        release = threading.Event()
+        queue = make_queue(lambda message: release.wait(5))
+
+        self.assertTrue(queue.put("C1", "hi"))
+        self.assertEqual(1, queue.counters["queued"])
+
+        release.set()
+        self.assertTrue(queue.drain(timeout=5))
+
+    def test_rate_limited_message_is_retried(self):
+        """A 429 is retried after Retry-After."""
+        attempts = []
+
+        def send(message):
+            attempts.append(message.text)
+            if len(attempts) == 1:
+                raise RateLimited(0.05)
+
+        queue = make_queue(send)
+        queue.put("C1", "hi", team_id="T1")
+
+        self.assertTrue(queue.drain(timeout=5))
+        self.assertEqual(["hi", "hi"], attempts)
+        self.assertEqual(1, queue.counters["retried"])
+        self.assertEqual(1, queue.counters["sent"])
+
+    def test_gives_up_after_max_attempts(self):
+        """Failing posts are retried with backoff, then dropped."""
+        send = mock.Mock(side_effect=IOError("down"))
+        queue = make_queue(send, max_attempts=3)
+
+        with mock.patch.object(outbound, "log"):
+            queue.put("C1", "hi")
+            self.assertTrue(queue.drain(timeout=5))
+
+        self.assertEqual(3, send.call_count)
+        self.assertEqual(1, queue.counters["failed"])
+
+    def test_slack_errors_are_not_retried(self):
+        """A Slack API error fails the message at once."""
+        send = mock.Mock(side_effect=SlackError("channel_not_found"))
+        queue = make_queue(send)
+
+        with mock.patch.object(outbound, "log"):
+            queue.put("C1", "hi")
+            self.assertTrue(queue.drain(timeout=5))
+
+        self.assertEqual(1, send.call_count)
+        self.assertEqual(1, queue.counters["failed"])
+
+    def test_full_queue_drops(self):
+        """put() returns False once max_size messages are waiting."""
+        release = threading.Event()
+        queue = make_queue(lambda message: release.wait(5), max_size=1)
+
+        with mock.patch.object(outbound, "log"):
+            self.assertTrue(queue.put("C1", "one"))
+            self.assertFalse(queue.put("C1", "two"))
+
+        self.assertEqual(1, queue.counters["dropped"])
+        release.set()
+        self.assertTrue(queue.drain(timeout=5))
+
+    def test_counters_report_queue_age(self):
+        """oldest_age is how long the oldest waiting message has waited."""
+        queue = make_queue(mock.Mock(), channel_rate=0.001, channel_burst=1)
+        queue.put("C1", "one")
+        queue.put("C1", "two")
+
+        with mock.patch.object(
+            outbound.time,
+            "monotonic",
+            return_value=outbound.time.monotonic() + 10,
+        ):
+            self.assertGreaterEqual(queue.counters["oldest_age"], 9)
+
+    def test_coalesce_merges_replies_in_order(self):
+        """Replies queued within the window go out as one post, in order."""
+        sent = []
+        queue = make_queue(
+            lambda message: sent.append((message.channel, message.text)),
+            coalesce_window=0.05,
+        )
+
+        for text in ("one", "two", "three"):
+            queue.put("C1", text)
+        queue.put("C2", "elsewhere")
+
+        self.assertTrue(queue.drain(timeout=5))
+        self.assertIn(("C1", "one\ntwo\nthree"), sent)
+        self.assertIn(("C2", "elsewhere"), sent)
+        self.assertEqual(2, queue.counters["coalesced"])
+        self.assertEqual(2, queue.counters["sent"])
+
+    def test_coalesce_respects_size_and_threads(self):
+        """Merging stops at the size cap and at a change of thread."""
+        sent = []
+        queue = make_queue(
+            lambda message: sent.append(message.text),
+            coalesce_window=0.05,
+            coalesce_max=7,
+        )
+
+        queue.put("C1", "aaa")
+        queue.put("C1", "bbb")
+        queue.put("C1", "ccc")
+        queue.put("C1", "ddd", thread_ts="1.0")
+
+        self.assertTrue(queue.drain(timeout=5))
+        self.assertEqual(["aaa\nbbb", "ccc", "ddd"], sent)
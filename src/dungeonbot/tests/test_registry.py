@@ -0,0 +1,96 @@
+"""Tests for the plugin registry."""
+
+
+from dungeonbot.conftest import BaseTest
+
+from dungeonbot.handlers.event import EventHandler
+from dungeonbot.plugins import registry
+from dungeonbot.plugins.help import HelpPlugin
+from dungeonbot.plugins.highlights import HighlightPlugin
+from dungeonbot.plugins.karma import KarmaModifyPlugin
+
+from unittest import mock
+
+import importlib
+
+
+class PluginRegistryUnitTests(BaseTest):
+    """Tests for the plugin registry."""
+
+    def test_dispatch_and_help_share_the_registry(self):
+        """EventHandler and HelpPlugin see the same commands."""
+        self.assertIs(registry.commands, EventHandler.valid_commands)
+        self.assertIs(registry.commands, HelpPlugin.help_topics)
+        self.assertIs(registry.suffixes, EventHandler.valid_suffixes)
+
+    def test_registered_commands(self):
+        """Decorated plugins are registered under their names."""
+        self.assertIs(HighlightPlugin, registry.commands['log'])
+        self.assertIs(KarmaModifyPlugin, registry.suffixes['++'])
+        self.assertIs(KarmaModifyPlugin, registry.suffixes['--'])
+
+    def test_module_tables_match_the_decorators(self):
+        """Every listed module registers exactly the names listed for it."""
+        for plugins in (registry.commands, registry.suffixes):
+            for module in set(plugins.modules.values()):
+                importlib.import_module(module)
+
+            self.assertEqual(set(plugins.modules), set(plugins.loaded))
+            for name, plugin in plugins.loaded.items():
+                self.assertEqual(plugins.modules[name], plugin.__module__)
+
+    def test_unregistered_listed_name_raises(self):
+        """A table entry its module doesn't register is a clear error."""
+        plugins = registry.LazyPluginMap({'thing': "some.module"})
+
+        with mock.patch.object(registry.importlib, "import_module"):
+            with self.assertRaisesRegex(LookupError, "some.module"):
+                plugins['thing']
+
+    def test_conflicting_registration_raises(self):
+        """A name can't be claimed by two plugins."""
+        plugins = registry.LazyPluginMap({})
+        plugins.register(['thing'], HelpPlugin)
+        plugins.register(['thing'], HelpPlugin)
+
+        with self.assertRaises(ValueError):
+            plugins.register(['thing'], HighlightPlugin)
+
+    def test_plugins_import_on_first_lookup(self):
+        """A plugin's module is imported when its command is looked up."""
+        plugins = registry.LazyPluginMap({'thing': "some.module"})
+
+        def fake_import(module):
+            plugins.register(['thing'], HelpPlugin)
+
+        with mock.patch.object(
+            registry.importlib,
+            "import_module",
+            side_effect=fake_import,
+        ) as mock_import:
+            self.assertIn('thing', plugins)
+            self.assertFalse(mock_import.called)
+
+            self.assertIs(HelpPlugin, plugins['thing'])
+            self.assertIs(HelpPlugin, plugins.get('thing'))
+            mock_import.assert_called_once_with("some.module")
+
+            self.assertIsNone(plugins.get('nothing'))
+
+    def test_preload(self):
+        """preload() imports the named plugins, or all of them for "*"."""
+        plugins = registry.LazyPluginMap({'a': "mod.a", 'b': "mod.b"})
+
+        with mock.patch.object(
+            registry.importlib,
+            "import_module",
+            side_effect=lambda module: plugins.register(
+                [module[-1]],
+                HelpPlugin,
+            ),
+        ) as mock_import:
+            plugins.preload(['a', 'unknown'])
+            mock_import.assert_called_once_with("mod.a")
+
+            plugins.preload(['*'])
+            self.assertEqual({'a', 'b'}, set(plugins.loaded))
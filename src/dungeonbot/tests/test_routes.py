@@ -4,6 +4,7 @@
 from dungeonbot.conftest import BaseTest
 
 from dungeonbot import routes
+from dungeonbot.handlers.dedup import EventDeduplicator
 
 from unittest import mock
 
@@ -43,39 +44,99 @@ class RoutesToolsUnitTests(BaseTest):
             event = {"user": "not a bot", "text": "bad suffix +-"}
             self.assertFalse(routes.event_is_important(event))
 
+            event = {"user": "not a bot", "text": "2 -- 1 is 3"}
+            self.assertFalse(routes.event_is_important(event))
+
+            event = {"user": "not a bot", "text": ""}
+            self.assertFalse(routes.event_is_important(event))
+
+            event = {
+                "subtype": "message_changed",
+                "message": {"user": "not a bot", "text": "foo++"},
+            }
+            self.assertFalse(routes.event_is_important(event))
+
+    def test_event_is_important_several_suffix_commands(self):
+        """event_is_important finds suffix commands mid-message."""
+        event = {"user": "not a bot", "text": "alice++ bob++ thanks!"}
+        mock_getenv = mock.MagicMock()
+        mock_getenv.return_value = "some bot id"
+
+        with mock.patch.object(routes.os, "getenv", mock_getenv):
+            self.assertTrue(routes.event_is_important(event))
+
+    def test_event_is_important_suffix_in_a_sentence(self):
+        """A suffix in the middle of a sentence isn't a command."""
+        event = {"user": "not a bot", "text": "I love c++ and rust"}
+        mock_getenv = mock.MagicMock()
+        mock_getenv.return_value = "some bot id"
+
+        with mock.patch.object(routes.os, "getenv", mock_getenv):
+            self.assertFalse(routes.event_is_important(event))
+
     def test_process_event_with_important_event(self):
         """process_event should call the mock event handler."""
         event = {"user": "not a bot", "text": "suffix command++"}
-        mock_eprint = mock.MagicMock()
+        mock_log = mock.MagicMock()
         mock_event_handler = mock.MagicMock()
 
         with mock.patch.object(routes, "EventHandler", mock_event_handler):
-            with mock.patch.object(routes, "eprint", mock_eprint):
+            with mock.patch.object(routes, "log", mock_log):
                 self.assertTrue(routes.event_is_important(event))
 
                 routes.process_event(event)
 
                 self.assertTrue(mock_event_handler.called)
                 self.assertTrue(mock_event_handler(event).process_event.called)
+                self.assertTrue(mock_log.info.called)
 
     def test_process_event_with_unimportant_event(self):
         """process_event should call the mock event handler."""
         event = {"user": "not a bot", "text": "buttslol"}
-        mock_eprint = mock.MagicMock()
+        mock_log = mock.MagicMock()
         mock_event_handler = mock.MagicMock()
 
         with mock.patch.object(routes, "EventHandler", mock_event_handler):
-            with mock.patch.object(routes, "eprint", mock_eprint):
+            with mock.patch.object(routes, "log", mock_log):
                 self.assertFalse(routes.event_is_important(event))
 
                 routes.process_event(event)
 
                 self.assertFalse(mock_event_handler.called)
 
+    def test_process_event_with_user_change(self):
+        """A user_change event updates the user directory."""
+        user = {"id": "U1", "name": "someone", "team_id": "T1"}
+        event = {"type": "user_change", "user": user, "team_id": "T1"}
+        mock_event_handler = mock.MagicMock()
+
+        with mock.patch.object(routes, "EventHandler", mock_event_handler):
+            with mock.patch.object(routes, "user_directory") as mock_users:
+                routes.process_event(event)
+
+                mock_users.update.assert_called_with(user, "T1")
+                self.assertFalse(mock_event_handler.called)
+
 
 class RoutesUnitTests(BaseTest):
     """Tests for the routing functions in the routes module."""
 
+    def setUp(self):
+        """Keep the first request from starting the real sweeper."""
+        super().setUp()
+        patcher = mock.patch.object(routes.event_queue, "start")
+        self.mock_start = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_start_event_queue(self):
+        """The worker's queue is started before it serves a request."""
+        self.assertIn(
+            routes.start_event_queue,
+            self.app.before_first_request_funcs,
+        )
+        routes.start_event_queue()
+        self.assertTrue(self.mock_start.called)
+
     def test_route_root_with_get(self):
         """Return a redirect when accessed via GET."""
         tc = self.app.test_client()
@@ -85,18 +146,146 @@ class RoutesUnitTests(BaseTest):
         """Return a 200 OK when accessed via POST."""
         tc = self.app.test_client()
         event = {"event": {"a thing": "something"}, "team_id": "some id"}
-        mock_processor = mock.MagicMock()
+        mock_queue = mock.MagicMock()
 
-        with mock.patch.object(routes, "process_event", mock_processor):
-            # import ipdb; ipdb.set_trace()
+        with mock.patch.object(routes, "event_queue", mock_queue):
             self.assertEqual(200, tc.post(
                 '/',
                 data=json.dumps(event),
                 content_type="application/json",
             ).status_code)
-            self.assertTrue(mock_processor.called)
+            mock_queue.put.assert_called_with(
+                {"a thing": "something", "team_id": "some id"}
+            )
+
+    def test_route_root_drops_slack_retries(self):
+        """A resent event is acknowledged but not processed again."""
+        tc = self.app.test_client()
+        event = {
+            "event": {"a thing": "something"},
+            "team_id": "some id",
+            "event_id": "Ev0123456789",
+        }
+        mock_queue = mock.MagicMock()
+        dd = EventDeduplicator()
+
+        with mock.patch.object(routes, "event_queue", mock_queue):
+            with mock.patch.object(routes, "deduplicator", dd):
+                self.assertEqual(200, tc.post(
+                    '/',
+                    data=json.dumps(event),
+                    content_type="application/json",
+                ).status_code)
+                self.assertEqual(200, tc.post(
+                    '/',
+                    data=json.dumps(event),
+                    content_type="application/json",
+                    headers={"X-Slack-Retry-Num": "1"},
+                ).status_code)
+
+                self.assertEqual(1, mock_queue.put.call_count)
+
+    def test_route_root_sheds_load(self):
+        """Return a 503 with Retry-After when over capacity."""
+        tc = self.app.test_client()
+        event = {"event": {"text": "!help"}, "team_id": "some id"}
+        mock_queue = mock.MagicMock()
+        mock_admission = mock.MagicMock()
+        mock_admission.admit.return_value = False
+
+        with mock.patch.object(routes, "event_queue", mock_queue):
+            with mock.patch.object(routes, "admission", mock_admission):
+                response = tc.post(
+                    '/',
+                    data=json.dumps(event),
+                    content_type="application/json",
+                )
+
+                self.assertEqual(503, response.status_code)
+                self.assertEqual(
+                    str(self.app.config["EVENT_RETRY_AFTER"]),
+                    response.headers["Retry-After"]
+                )
+                self.assertFalse(mock_queue.put.called)
+
+    def test_route_root_rejected_event(self):
+        """An event the executor rejects gets a 503 unless it was stored."""
+        tc = self.app.test_client()
+        event = {
+            "event": {"text": "!help"},
+            "team_id": "some id",
+            "event_id": "Ev0123456789",
+        }
+        mock_queue = mock.MagicMock()
+        mock_queue.put.return_value = False
+        mock_queue.durable = False
+
+        with mock.patch.object(routes, "event_queue", mock_queue):
+            with mock.patch.object(routes, "deduplicator",
+                                   EventDeduplicator()):
+                response = tc.post(
+                    '/',
+                    data=json.dumps(event),
+                    content_type="application/json",
+                )
+
+                self.assertEqual(503, response.status_code)
+                self.assertIn("Retry-After", response.headers)
+
+                mock_queue.durable = True
+                self.assertEqual(200, tc.post(
+                    '/',
+                    data=json.dumps(event),
+                    content_type="application/json",
+                    headers={"X-Slack-Retry-Num": "1"},
+                ).status_code)
+                self.assertEqual(2, mock_queue.put.call_count)
+
+    def test_accept_event_put_raises(self):
+        """An event that couldn't be stored is queued on Slack's retry."""
+        payload = {
+            "event": {"text": "!help"},
+            "team_id": "some id",
+            "event_id": "Ev0123456789",
+        }
+        mock_queue = mock.MagicMock()
+        mock_queue.put.side_effect = [RuntimeError("no such table"), True]
+
+        with mock.patch.object(routes, "event_queue", mock_queue):
+            with mock.patch.object(routes, "deduplicator",
+                                   EventDeduplicator()):
+                with self.assertRaises(RuntimeError):
+                    routes.accept_event(dict(payload))
+
+                self.assertEqual(
+                    200,
+                    routes.accept_event(dict(payload), retry_num="1")
+                )
+                self.assertEqual(2, mock_queue.put.call_count)
 
     def test_route_oauth(self):
         """The OAuth route just returns 200 for now."""
         tc = self.app.test_client()
         self.assertEqual(200, tc.get('/oauth').status_code)
+
+    def test_route_metrics(self):
+        """The metrics route serves Prometheus text."""
+        tc = self.app.test_client()
+        response = tc.get('/metrics')
+
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(response.content_type.startswith("text/plain"))
+        self.assertIn(b"# TYPE dungeonbot_stage_seconds histogram",
+                      response.data)
+        self.assertIn(b"dungeonbot_executor_queued", response.data)
+
+    def test_route_metrics_queue_depths(self):
+        """The metrics route shows the busiest keys' queue depths."""
+        depths = mock.MagicMock(return_value={"T1:C1": 3})
+
+        with mock.patch.object(routes.get_executor(), "depths", depths):
+            response = self.app.test_client().get('/metrics')
+
+        depths.assert_called_with(top=self.app.config["EVENT_METRICS_KEYS"])
+        self.assertIn(b'dungeonbot_executor_depth{depth="T1:C1"} 3',
+                      response.data)
@@ -0,0 +1,81 @@
+"""Tests for the suffix-command tokenizer."""
+
+
+from dungeonbot.conftest import BaseTest
+
+from dungeonbot.handlers.tokenizer import SuffixOp, tokenize
+
+
+class TokenizerUnitTests(BaseTest):
+    """Tests for tokenize."""
+
+    def test_single_suffix_command(self):
+        """A whole message is one subject, whitespace and all."""
+        self.assertEqual(
+            [SuffixOp("some string with spaces", "++")],
+            tokenize("some string with spaces++")
+        )
+        self.assertEqual([SuffixOp("x", "--")], tokenize("x--"))
+
+    def test_several_suffix_commands(self):
+        """Each suffix ends a subject."""
+        self.assertEqual(
+            [
+                SuffixOp("alice", "++"),
+                SuffixOp("bob", "++"),
+                SuffixOp("the dm", "--"),
+            ],
+            tokenize("alice++ bob++ the dm--")
+        )
+        self.assertEqual(
+            [SuffixOp("alice", "++")],
+            tokenize("alice++ thanks for the help")
+        )
+
+    def test_delimited_subjects(self):
+        """Quotes or parentheses mark a multi-word subject mid-message."""
+        self.assertEqual(
+            [SuffixOp("the dm", "--"), SuffixOp("slow dice", "++")],
+            tokenize('well "the dm"-- and (slow dice)++ again')
+        )
+
+    def test_suffixes_in_sentences(self):
+        """A suffix inside ordinary text isn't a suffix-command."""
+        for text in (
+            "I love c++ and rust",
+            "we never -- I mean we rarely-- do that",
+            "the build++ is broken again",
+        ):
+            self.assertEqual([], tokenize(text), text)
+
+        self.assertEqual(
+            [SuffixOp("c", "++")],
+            tokenize("c++ and rust")
+        )
+
+    def test_mentions(self):
+        """Mentions become the mentioned user's ID."""
+        self.assertEqual(
+            [SuffixOp("U123", "++"), SuffixOp("U456", "--")],
+            tokenize("thanks <@U123>++ and <@U456|bob>--")
+        )
+
+    def test_not_suffix_commands(self):
+        """Detached or embedded suffixes don't count."""
+        for text in (
+            "",
+            "++",
+            "not a thing",
+            "bad suffix +-",
+            "x -- y",
+            "i++;",
+            "a+-b",
+        ):
+            self.assertEqual([], tokenize(text), text)
+
+    def test_suffixes(self):
+        """Only the given suffixes are recognized."""
+        self.assertEqual(
+            [SuffixOp("a++ b", "--")],
+            tokenize("a++ b--", suffixes={"--": None})
+        )
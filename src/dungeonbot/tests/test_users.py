@@ -0,0 +1,146 @@
+"""Tests for the UserDirectory."""
+
+
+from dungeonbot.conftest import BaseTest
+
+from dungeonbot.handlers import users
+from dungeonbot.handlers.users import UserDirectory
+
+from unittest import mock
+
+import threading
+
+
+def members(*names, team_id="T1"):
+    """Build users.list members named `names`, with ids U<name>."""
+    return [
+        {"id": "U" + name, "name": name, "team_id": team_id}
+        for name in names
+    ]
+
+
+class UserDirectoryUnitTests(BaseTest):
+    """Tests for the UserDirectory."""
+
+    def test_lookups_fetch_once(self):
+        """Lookups by id and name share one fetch per team."""
+        fetch = mock.Mock(return_value=members("alice", "bob"))
+        directory = UserDirectory(fetch)
+
+        self.assertEqual("Ualice", directory.by_name("alice", "T1")["id"])
+        self.assertEqual("bob", directory.by_id("Ubob", "T1")["name"])
+        self.assertIsNone(directory.by_name("pizza", "T1"))
+
+        fetch.assert_called_once_with("T1")
+        self.assertEqual(
+            {"teams": 1, "fetches": 1, "hits": 2, "misses": 1},
+            directory.counters
+        )
+
+    def test_by_ids(self):
+        """A list of ids is resolved with one fetch."""
+        fetch = mock.Mock(return_value=members("alice", "bob"))
+        directory = UserDirectory(fetch)
+
+        found = directory.by_ids(["Ualice", "pizza", "Ubob", "tacos"], "T1")
+
+        self.assertEqual({"Ualice", "Ubob"}, set(found))
+        self.assertEqual("bob", found["Ubob"]["name"])
+        fetch.assert_called_once_with("T1")
+        self.assertEqual(2, directory.counters["misses"])
+
+    def test_teams_are_separate(self):
+        """Each team gets its own fetch and its own index."""
+        fetch = mock.Mock(side_effect=lambda team_id: members(
+            "alice" if team_id == "T1" else "carol",
+            team_id=team_id,
+        ))
+        directory = UserDirectory(fetch)
+
+        self.assertIsNotNone(directory.by_name("alice", "T1"))
+        self.assertIsNone(directory.by_name("alice", "T2"))
+        self.assertIsNotNone(directory.by_name("carol", "T2"))
+        self.assertEqual(2, fetch.call_count)
+
+    def test_update_replaces_user(self):
+        """A user_change replaces the user under its id and new name."""
+        directory = UserDirectory(mock.Mock(return_value=members("alice")))
+        directory.by_id("Ualice", "T1")
+
+        directory.update({"id": "Ualice", "name": "alicia", "team_id": "T1"})
+        directory.update({"id": "Udave", "name": "dave", "team_id": "T1"})
+
+        self.assertIsNone(directory.by_name("alice", "T1"))
+        self.assertEqual("Ualice", directory.by_name("alicia", "T1")["id"])
+        self.assertEqual("dave", directory.by_id("Udave", "T1")["name"])
+        self.assertEqual(1, directory.counters["fetches"])
+
+    def test_invalidate(self):
+        """An invalidated team is fetched again on the next lookup."""
+        fetch = mock.Mock(return_value=members("alice"))
+        directory = UserDirectory(fetch)
+
+        directory.by_id("Ualice", "T1")
+        directory.invalidate("T1")
+        directory.by_id("Ualice", "T1")
+
+        self.assertEqual(2, fetch.call_count)
+
+    def test_concurrent_cold_lookups_fetch_once(self):
+        """Lookups racing to load a team share one fetch."""
+        release = threading.Event()
+
+        def slow_fetch(team_id):
+            release.wait(timeout=5)
+            return members("alice")
+
+        fetch = mock.Mock(side_effect=slow_fetch)
+        directory = UserDirectory(fetch)
+        found = []
+
+        threads = [
+            threading.Thread(
+                target=lambda: found.append(directory.by_name("alice", "T1"))
+            )
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+
+        threading.Event().wait(0.05)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        fetch.assert_called_once_with("T1")
+        self.assertEqual(4, len([user for user in found if user]))
+
+    def test_stale_index_refreshes_in_background(self):
+        """Past the ttl, lookups use the old index while a refresh runs."""
+        refreshed = threading.Event()
+        results = [members("alice"), members("alice", "bob")]
+
+        def fetch(team_id):
+            result = results.pop(0)
+            if not results:
+                refreshed.set()
+            return result
+
+        directory = UserDirectory(fetch, ttl=60)
+        directory.by_id("Ualice", "T1")
+
+        with mock.patch.object(
+            users.time,
+            "monotonic",
+            return_value=users.time.monotonic() + 120,
+        ):
+            self.assertIsNone(directory.by_name("bob", "T1"))
+
+        self.assertTrue(refreshed.wait(timeout=5))
+
+        for _ in range(100):
+            if directory.counters["fetches"] == 2:
+                break
+            threading.Event().wait(0.01)
+
+        self.assertIsNotNone(directory.by_name("bob", "T1"))
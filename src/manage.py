@@ -17,7 +17,10 @@ from dungeonbot.models import (
     quest,
     roll,
 	attribute,
-	highlights
+	highlights,
+	event_queue,
+	seen_event,
+	karma_ledger,
 )
 import os
 
@@ -42,6 +45,239 @@ migrate = Migrate(app, models.db)
 manager.add_command("db", MigrateCommand)
 
 
+@manager.option(
+    "-i", "--interface",
+    dest="interface",
+    default=app.config["SERVER_INTERFACE"],
+    help="'wsgi' (Flask) or 'asgi' (needs uvicorn)",
+)
+@manager.option("-H", "--host", dest="host", default="0.0.0.0")
+@manager.option("-p", "--port", dest="port", type=int, default=5006)
+def serve(interface, host, port):
+    """Run the project over WSGI or ASGI."""
+    if interface == "wsgi":
+        app.run(host=host, port=port)
+
+    elif interface == "asgi":
+        try:
+            import uvicorn
+        except ImportError:
+            print("Serving over ASGI needs uvicorn: pip install uvicorn")
+            return
+
+        uvicorn.run(
+            "dungeonbot.asgi:application",
+            host=host,
+            port=port,
+            lifespan="on",
+        )
+
+    else:
+        print("Unknown interface '{}'; use 'wsgi' or 'asgi'.".format(
+            interface
+        ))
+
+
+@manager.command
+def replay_events():
+    """Process stored events left behind by a stopped or crashed worker."""
+    from dungeonbot import routes
+    from dungeonbot.handlers.executor import get_executor
+
+    replayed = routes.event_queue.replay()
+    get_executor().shutdown()
+
+    print("Replayed {} stored events.".format(replayed))
+
+
+@manager.option("--ledger-days", dest="ledger_days", type=int,
+                default=app.config["KARMA_LEDGER_DAYS"])
+@manager.option("--hourly-days", dest="hourly_days", type=int,
+                default=app.config["KARMA_HOURLY_DAYS"])
+def compact_karma(ledger_days, hourly_days):
+    """Delete old karma ledger rows and hourly rollups; run it daily."""
+    from dungeonbot.models.karma_ledger import KarmaEventModel
+
+    events, hourly = KarmaEventModel.compact(ledger_days, hourly_days)
+
+    print("Deleted {} ledger rows and {} hourly rollups.".format(
+        events,
+        hourly,
+    ))
+
+
+@manager.option("-n", "--count", dest="count", type=int, default=1000,
+                help="number of synthetic payloads")
+@manager.option("-f", "--file", dest="path", default=None,
+                help="JSONL file of recorded payloads to replay instead")
+@manager.option("--repeat", dest="repeat", type=int, default=1,
+                help="times to replay the file")
+@manager.option("-c", "--concurrency", dest="concurrency", type=int,
+                default=8)
+@manager.option("-r", "--rate", dest="rate", type=float, default=None,
+                help="payloads per second (default: as fast as possible)")
+@manager.option("-u", "--url", dest="url", default=None,
+                help="POST to a running server instead of in-process")
+@manager.option("--fake-slack", dest="fake_slack", action="store_true",
+                help="post replies to a local fake Slack")
+@manager.option("--create-tables", dest="create_tables",
+                action="store_true")
+@manager.option("--seed", dest="seed", type=int, default=None)
+@manager.option("--json", dest="as_json", action="store_true")
+def load_test(count, path, repeat, concurrency, rate, url, fake_slack,
+              create_tables, seed, as_json):
+    """Replay Events API payloads against the app and report throughput."""
+    import json
+    from auxiliaries import loadgen
+
+    if path:
+        payloads = loadgen.read_payloads(path, repeat)
+    else:
+        payloads = loadgen.synthetic_payloads(count, seed=seed)
+
+    if url:
+        report = loadgen.run_load(
+            payloads,
+            loadgen.http_sender(url),
+            concurrency,
+            rate,
+        )
+
+    else:
+        fake = None
+        if fake_slack:
+            from auxiliaries.fake_slack import FakeSlack
+            fake = FakeSlack(users=1000).start()
+            app.config["SLACK_API_URL"] = fake.url
+            os.environ["PERMISSION_TO_SPEAK"] = "1"
+
+        if create_tables:
+            models.db.create_all()
+
+        report = loadgen.run_in_process(app, payloads, concurrency, rate)
+
+        if fake:
+            report["slack_calls"] = dict(fake.stats)
+            fake.stop()
+
+    print(json.dumps(report, indent=2) if as_json
+          else loadgen.format_report(report))
+
+
+@manager.option("-o", "--output", dest="output", default=None,
+                help="write the results to this JSON file")
+@manager.option("-b", "--compare", dest="baseline", default=None,
+                help="JSON results to compare against")
+@manager.option("-t", "--threshold", dest="threshold", type=float,
+                default=0.2, help="slowdown that counts as a regression")
+@manager.option("-k", "--filter", dest="pattern", default=None,
+                help="only run benchmarks whose name contains this")
+@manager.option("--sizes", dest="sizes", default="10000,100000,1000000",
+                help="karma table sizes for the sized benchmarks")
+@manager.option("--rounds", dest="rounds", type=int, default=5)
+@manager.option("--db", dest="db_url", default=None,
+                help="scratch database URL; its tables are dropped")
+def benchmark(output, baseline, threshold, pattern, sizes, rounds, db_url):
+    """Run the plugin micro-benchmarks; exit 1 on a regression."""
+    import json
+    import sys
+    from auxiliaries import benchmarks
+
+    db_url = benchmarks.prepare(app, db_url)
+
+    results = benchmarks.run(
+        pattern=pattern,
+        sizes=[int(size) for size in sizes.split(",") if size],
+        rounds=rounds,
+        progress=lambda name, stats: print(
+            benchmarks.format_stats(name, stats)
+        ),
+    )
+
+    if output:
+        with open(output, "w") as f:
+            json.dump({
+                "environment": benchmarks.environment(db_url),
+                "results": results,
+            }, f, indent=2, sort_keys=True)
+
+    if baseline:
+        with open(baseline) as f:
+            rows = benchmarks.compare(
+                json.load(f)["results"],
+                results,
+                threshold,
+            )
+
+        print("\n" + benchmarks.format_comparison(rows))
+
+        regressions = [row[0] for row in rows if row[4]]
+        if regressions:
+            print("\n{} regression(s) over {:.0%}: {}".format(
+                len(regressions),
+                threshold,
+                ", ".join(regressions),
+            ))
+            sys.exit(1)
+
+
+@manager.option("-m", "--module", dest="module", default="dungeonbot")
+@manager.option("-n", "--top", dest="top", type=int, default=20)
+def startup_report(module, top):
+    """Break down the time spent importing the app, like -X importtime.
+
+    Imports `module` in a fresh interpreter and shows the total import
+    time, the time per top-level package and the `top` slowest modules.
+    Set PLUGIN_PRELOAD in the environment to include preloaded plugins.
+
+    """
+    import subprocess
+    import sys
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + module],
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(self_us), int(cumulative_us), name.strip()))
+
+    if result.returncode or not rows:
+        print(result.stderr)
+        return
+
+    packages = {}
+    for self_us, _, name in rows:
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + self_us
+
+    print("Importing '{}' took {:.1f} ms ({} modules).\n".format(
+        module,
+        sum(row[0] for row in rows) / 1000.0,
+        len(rows),
+    ))
+
+    print("{:>10}  {}".format("self [ms]", "package"))
+    for package, self_us in sorted(
+        packages.items(),
+        key=lambda item: -item[1],
+    )[:top]:
+        print("{:>10.1f}  {}".format(self_us / 1000.0, package))
+
+    print("\n{:>10}  {:>10}  {}".format("self [ms]", "cumul [ms]", "module"))
+    for self_us, cumulative_us, name in sorted(rows, reverse=True)[:top]:
+        print("{:>10.1f}  {:>10.1f}  {}".format(
+            self_us / 1000.0,
+            cumulative_us / 1000.0,
+            name,
+        ))
+
+
 @manager.command
 def test(verbose=False, skip_covered=False, clean=False):
     """Run testing suite.